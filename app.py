@@ -1,26 +1,250 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 import os
 import time
-import requests
-import yt_dlp
 from pathlib import Path
-import threading
 import uuid
 import json
 import tempfile
+import gzip
+import hashlib
+import hmac
+import math
+import re
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+try:
+    import brotli  # optional; gzip is used when it isn't installed
+except ImportError:
+    brotli = None
+from result_cache import ResultCache, extract_video_id
+from job_store import TERMINAL_STATUSES, create_job_store
+from chunking import (
+    UsageTracker, chunk_budget, estimate_tokens, is_near_duplicate, scale_strategies, select_balanced, split_transcript,
+    word_set
+)
+from http_clients import PooledSession, buffered_body
+from scheduler import CancelTokens, JobCancelled, JobScheduler, QueueFull, StageLimiter, TimerQueue
+from async_runtime import AsyncRuntime
+from job_queue import SQLiteJobQueue
+from question_bank import QuestionBank
+from response_memo import ResponseMemo, request_key
+from rate_limit import TokenBudget
+from metrics import (
+    ASSEMBLYAI_POLLS, CANCEL_GROQ_TOKENS, CANCEL_RECLAIMED, FALLBACK_CONTENT, GROQ_ATTEMPTS, GROQ_BUDGET, GROQ_TOKENS,
+    JOBS_CANCELLED, JOBS_COALESCED, JOBS_FINISHED, JSON_REPAIRS, SCHEDULER_JOBS, STAGE_SLOTS, STRATEGY_FALLBACKS,
+    UPLOAD_BYTES, ProcessStats, job_timings, observe_stage, registry, timed
+)
 
 load_dotenv()
 
 app = Flask(__name__)
 
-# Store transcription results in memory (use Redis/database in production)
-transcription_results = {}
-
 # Your API keys (loaded from .env)
 ASSEMBLYAI_API_KEY = os.environ.get("ASSEMBLYAI_API_KEY")
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 
+# Upstream base URLs (overridable to point at local fakes for benchmarks)
+ASSEMBLYAI_BASE_URL = os.environ.get("ASSEMBLYAI_BASE_URL", "https://api.assemblyai.com").rstrip('/')
+GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL", "https://api.groq.com").rstrip('/')
+
+# Stream the native audio track straight into the AssemblyAI upload instead of
+# downloading it and re-encoding to MP3 first. Memory is capped at the buffer size.
+AUDIO_STREAMING = os.environ.get("AUDIO_STREAMING", "1") == "1"
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", 512 * 1024))
+STREAM_BUFFER_BYTES = int(os.environ.get("STREAM_BUFFER_BYTES", 8 * 1024 * 1024))
+# YouTube throttles long unranged reads, so media is fetched in ranged pieces like yt-dlp does
+STREAM_RANGE_SIZE = 10 * 1024 * 1024
+
+# Use YouTube's own captions when they exist and only transcribe audio otherwise
+CAPTIONS_FIRST = os.environ.get("CAPTIONS_FIRST", "1") == "1"
+# Shorter caption tracks are usually just "[Music]" and aren't worth generating from
+MIN_CAPTION_CHARS = 200
+
+# Guardrails checked against the metadata probe before any audio is fetched; 0 turns
+# a limit off. With AUDIO_SECTION_SECONDS set only that much audio from the start of
+# the video is downloaded and transcribed, and the limits apply to that section.
+MAX_VIDEO_DURATION = int(os.environ.get("MAX_VIDEO_DURATION", 3 * 3600))
+MAX_AUDIO_BYTES = int(os.environ.get("MAX_AUDIO_BYTES", 300 * 1024 * 1024))
+AUDIO_SECTION_SECONDS = int(os.environ.get("AUDIO_SECTION_SECONDS", 0))
+# Probe while accepting /transcribe so oversized videos are refused straight away and
+# the client gets the duration and an ETA in the response
+PROBE_ON_SUBMIT = os.environ.get("PROBE_ON_SUBMIT", "1") == "1"
+PROBE_REUSE_SECONDS = 300
+
+# Long transcripts are split into chunks and generated map-reduce style
+MCQ_TARGET = int(os.environ.get("MCQ_TARGET", 12))
+FLASHCARD_TARGET = int(os.environ.get("FLASHCARD_TARGET", 15))
+CHUNK_MIN_TOKENS = int(os.environ.get("CHUNK_MIN_TOKENS", 750))
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", 3000))
+MAX_CHUNKS = int(os.environ.get("MAX_CHUNKS", 8))
+CHUNK_CONCURRENCY = int(os.environ.get("CHUNK_CONCURRENCY", 4))
+
+# Batches/playlists: children are fed into the worker pool a few at a time
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 100))
+BATCH_DOWNLOAD_SLOTS = int(os.environ.get("BATCH_DOWNLOAD_SLOTS", 1))
+BATCH_MAX_ACTIVE = int(os.environ.get("BATCH_MAX_ACTIVE", 4))
+BATCH_TICK_SECONDS = 2
+# Job states that still hold (or wait for) a download slot
+INGEST_STATUSES = ('queued', 'fetching_captions', 'downloading', 'uploading')
+
+# JSON responses smaller than this aren't worth compressing
+COMPRESS_MIN_BYTES = 1024
+
+# Each open event stream holds a server thread. Streams are closed after
+# SSE_MAX_SECONDS, and once SSE_MAX_STREAMS are open (by default half of gunicorn's
+# WEB_THREADS) new ones are refused; the page then polls /status instead
+SSE_MAX_SECONDS = int(os.environ.get("SSE_MAX_SECONDS", 120))
+SSE_MAX_STREAMS = int(os.environ.get("SSE_MAX_STREAMS", int(os.environ.get("WEB_THREADS", 32)) // 2))
+_sse_slots = threading.BoundedSemaphore(max(1, SSE_MAX_STREAMS))
+
+# Optional webhook mode: AssemblyAI calls us back when a transcript is done instead of
+# being polled every few seconds. Needs the public base URL of this app and a shared secret.
+ASSEMBLYAI_WEBHOOK_BASE_URL = os.environ.get("ASSEMBLYAI_WEBHOOK_BASE_URL")
+ASSEMBLYAI_WEBHOOK_SECRET = os.environ.get("ASSEMBLYAI_WEBHOOK_SECRET")
+WEBHOOK_SECRET_HEADER = 'X-Webhook-Secret'
+
+# Shared keep-alive sessions per upstream, with retry/backoff on 429 and 5xx
+assemblyai_session = PooledSession(
+    'assemblyai',
+    pool_size=int(os.environ.get("ASSEMBLYAI_POOL_SIZE", 16)),
+    retries=int(os.environ.get("HTTP_RETRIES", 3)),
+    timeout=float(os.environ.get("ASSEMBLYAI_TIMEOUT", 30)),
+)
+groq_session = PooledSession(
+    'groq',
+    pool_size=int(os.environ.get("GROQ_POOL_SIZE", 8)),
+    retries=int(os.environ.get("HTTP_RETRIES", 3)),
+    timeout=float(os.environ.get("GROQ_TIMEOUT", 60)),
+)
+# Uploads carry the whole audio file, so they get a much longer timeout
+ASSEMBLYAI_UPLOAD_TIMEOUT = float(os.environ.get("ASSEMBLYAI_UPLOAD_TIMEOUT", 600))
+# Streamed uploads can't be replayed, so they use a session without retries
+assemblyai_stream_session = PooledSession(
+    'assemblyai-stream',
+    pool_size=int(os.environ.get("MAX_CONCURRENT_UPLOADS", 4)),
+    retries=0,
+    timeout=ASSEMBLYAI_UPLOAD_TIMEOUT,
+)
+# Session used to pull audio from YouTube's media servers when streaming
+media_session = PooledSession(
+    'media',
+    pool_size=int(os.environ.get("MAX_CONCURRENT_DOWNLOADS", 4)),
+    retries=int(os.environ.get("HTTP_RETRIES", 3)),
+    timeout=60,
+)
+
+# Local data directory for persistent stores (caches, job state)
+DATA_DIR = os.environ.get("DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+# Job state lives in a bounded store: "sqlite" (default, shared by all workers and
+# kept across restarts) or "memory" (per-process LRU)
+job_store = create_job_store(os.environ.get("JOB_STORE", "sqlite"), DATA_DIR)
+
+# Where pipeline jobs run: "local" is a fixed-size worker pool in this process;
+# "sqlite" is a durable queue consumed by separate `python worker.py` processes, so
+# web processes only enqueue and read job state. Either way /transcribe answers 429
+# once JOB_QUEUE_SIZE jobs are waiting.
+JOB_QUEUE = os.environ.get("JOB_QUEUE", "local")
+if JOB_QUEUE == 'sqlite':
+    scheduler = SQLiteJobQueue(
+        os.environ.get("JOB_QUEUE_PATH", os.path.join(DATA_DIR, "queue.db")),
+        max_queue=int(os.environ.get("JOB_QUEUE_SIZE", 50)),
+        visibility_timeout=int(os.environ.get("JOB_VISIBILITY_TIMEOUT", 120)),
+        max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", 3)),
+    )
+else:
+    scheduler = JobScheduler(
+        workers=int(os.environ.get("WORKER_THREADS", 16)),
+        max_queue=int(os.environ.get("JOB_QUEUE_SIZE", 50)),
+        on_start=lambda job_id, waited: observe_stage('queue_wait', waited, job_id),
+    )
+
+# Concurrency caps per pipeline stage
+stage_limits = StageLimiter({
+    'download': int(os.environ.get("MAX_CONCURRENT_DOWNLOADS", 4)),
+    'upload': int(os.environ.get("MAX_CONCURRENT_UPLOADS", 4)),
+    'poll': int(os.environ.get("MAX_CONCURRENT_POLLS", 16)),
+    'groq': int(os.environ.get("MAX_CONCURRENT_GROQ", 8)),
+})
+
+# Fallback status checks for webhook-mode jobs run here instead of on a worker
+timers = TimerQueue()
+# Jobs waiting in the queue or running here are touched this often, so the job store
+# doesn't take one blocked on a stage slot, a download or the Groq budget for dead
+JOB_TOUCH_SECONDS = 60
+
+# Every process sharing DATA_DIR (gunicorn workers, worker.py) publishes its metrics
+# here, so /metrics and /jobs/stats include pipeline work done in the others
+process_stats = ProcessStats(os.environ.get("METRICS_PATH", os.path.join(DATA_DIR, "metrics.db")), registry)
+METRICS_PUBLISH_SECONDS = 10
+
+# Requests for a video (and language) that's already being processed attach to that
+# job instead of starting another one; each caller keeps its own job ID as an alias.
+# Flights are claimed in the job store, so they're shared by every web process.
+SINGLE_FLIGHT = os.environ.get("SINGLE_FLIGHT", "1") == "1"
+
+# Cancelled jobs (POST /jobs/<id>/cancel, or nobody has read their status for
+# ABANDON_AFTER seconds) stop at their next check: downloads abort, polling stops,
+# the AssemblyAI transcript is deleted and pending Groq calls are skipped. The flag
+# lives in the job store, so a worker in another process sees it too. 0 turns
+# abandonment detection off.
+ABANDON_AFTER = int(os.environ.get("ABANDON_AFTER", 120))
+ABANDON_CHECK_SECONDS = 15
+# Status reads are written to the job at most this often
+READ_NOTE_SECONDS = 10
+cancel_tokens = CancelTokens(lambda job_id: bool((job_store.get(job_id) or {}).get('cancelled_at')))
+
+# PIPELINE_MODE=async waits for AssemblyAI on an asyncio loop instead of sleeping in a
+# worker thread, so waiting jobs cost no thread; blocking calls use a small fixed pool
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "threads")
+async_runtime = AsyncRuntime(
+    io_threads=int(os.environ.get("ASYNC_IO_THREADS", 8))
+) if PIPELINE_MODE == 'async' else None
+
+# Persistent cache of transcripts/MCQs/flashcards so repeat videos skip the whole pipeline
+result_cache = ResultCache(
+    os.environ.get("RESULT_CACHE_PATH", os.path.join(DATA_DIR, "results.db")),
+    ttl=int(os.environ.get("RESULT_CACHE_TTL", 7 * 24 * 3600)),
+    max_bytes=int(os.environ.get("RESULT_CACHE_MAX_BYTES", 200 * 1024 * 1024)),
+)
+
+# Every generated MCQ/flashcard is banked; later jobs covering the same material are
+# served from the bank first and Groq only generates the shortfall
+QUESTION_BANK = os.environ.get("QUESTION_BANK", "1") == "1"
+question_bank = QuestionBank(
+    os.environ.get("QUESTION_BANK_PATH", os.path.join(DATA_DIR, "bank.db")),
+    ttl=int(os.environ.get("QUESTION_BANK_TTL", 90 * 24 * 3600)),
+)
+
+# Identical Groq requests (retries, resubmitted jobs) are answered from disk.
+# A job submitted with "regenerate": true skips this, the result cache and the bank.
+GROQ_MEMO = os.environ.get("GROQ_MEMO", "1") == "1"
+groq_memo = ResponseMemo(
+    os.environ.get("GROQ_MEMO_PATH", os.path.join(DATA_DIR, "groq_memo.db")),
+    ttl=int(os.environ.get("GROQ_MEMO_TTL", 24 * 3600)),
+    max_bytes=int(os.environ.get("GROQ_MEMO_MAX_BYTES", 100 * 1024 * 1024)),
+)
+
+# Groq account rate limits, shared by every job: calls wait for tokens-per-minute and
+# requests-per-minute budget instead of failing with 429s. The limits are corrected
+# from Groq's x-ratelimit-* headers after each call; 0 turns the budget off. The
+# buckets live in SQLite (GROQ_BUDGET_PATH), so every gunicorn worker and worker
+# process sharing DATA_DIR draws on the one account limit.
+GROQ_TOKENS_PER_MINUTE = int(os.environ.get("GROQ_TOKENS_PER_MINUTE", 6000))
+GROQ_REQUESTS_PER_MINUTE = int(os.environ.get("GROQ_REQUESTS_PER_MINUTE", 30))
+groq_budget = TokenBudget(
+    GROQ_TOKENS_PER_MINUTE,
+    GROQ_REQUESTS_PER_MINUTE,
+    path=os.environ.get("GROQ_BUDGET_PATH", os.path.join(DATA_DIR, "groq_budget.db")),
+) if GROQ_TOKENS_PER_MINUTE and GROQ_REQUESTS_PER_MINUTE else None
+
+# Stream Groq completions for jobs, so each question/flashcard is published to the
+# job as soon as the model closes it instead of after the whole response
+GROQ_STREAMING = os.environ.get("GROQ_STREAMING", "1") == "1"
+
 # The tempfile module handles cleanup automatically, so this function is no longer needed.
 # def cleanup_file(file_path):
 #     """Remove temporary audio file"""
@@ -29,9 +253,33 @@ GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 #     except FileNotFoundError:
 #         pass
 
-def download_audio(youtube_url, output_path):
-    """Download audio from YouTube video"""
-    ydl_opts = {
+# yt-dlp options shared by every YouTube call. yt_dlp itself is imported inside the
+# functions that use it: it's by far the slowest import, and web processes that only
+# enqueue jobs and serve status never need it.
+YDL_BASE_OPTS = {
+    'quiet': True,
+    # Add these options to fix 403 errors
+    'extractor_args': {
+        'youtube': {
+            'skip': ['dash', 'hls']
+        }
+    },
+    'http_headers': {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    },
+    'cookiefile': None,
+    'no_warnings': True,
+}
+
+def download_audio(youtube_url, output_path, section_seconds=None, job_id=None):
+    """Download audio from YouTube video, optionally only its first section_seconds.
+
+    Raises JobCancelled, abandoning the download or transcode, once job_id is cancelled.
+    """
+    import yt_dlp
+    from yt_dlp.utils import DownloadCancelled, download_range_func
+    
+    ydl_opts = dict(YDL_BASE_OPTS, **{
         'format': 'bestaudio/best',
         'outtmpl': output_path.replace('.mp3', '.%(ext)s'),
         'postprocessors': [{
@@ -39,35 +287,298 @@ def download_audio(youtube_url, output_path):
             'preferredcodec': 'mp3',
             'preferredquality': '192',
         }],
-        'quiet': True,
-        # Add these options to fix 403 errors
-        'extractor_args': {
-            'youtube': {
-                'skip': ['dash', 'hls']
-            }
-        },
-        'http_headers': {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        },
-        'cookiefile': None,
-        'no_warnings': True,
-        'ignoreerrors': True,
-    }
+    })
+    if section_seconds:
+        ydl_opts['download_ranges'] = download_range_func(None, [(0, section_seconds)])
+        ydl_opts['force_keyframes_at_cuts'] = True
+    elif MAX_AUDIO_BYTES:
+        ydl_opts['max_filesize'] = MAX_AUDIO_BYTES
     
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([youtube_url])
+    # Note when ffmpeg takes over so download and transcode are timed separately
+    marks = {}
+    def mark_transcode(d):
+        stop_if_cancelled(d)
+        if d.get('status') == 'started':
+            marks.setdefault('transcode', time.perf_counter())
     
+    # yt-dlp calls these every few KB; DownloadCancelled is the one error it lets through
+    def stop_if_cancelled(d):
+        if cancel_tokens.cancelled(job_id):
+            raise DownloadCancelled(f"Job {job_id} was cancelled")
+    ydl_opts['progress_hooks'] = [stop_if_cancelled]
+    ydl_opts['postprocessor_hooks'] = [mark_transcode]
+    
+    started = time.perf_counter()
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            ydl.download([youtube_url])
+    except DownloadCancelled as e:
+        CANCEL_RECLAIMED.inc(work='download')
+        raise JobCancelled(str(e))
+    finished = time.perf_counter()
+
+    # Download errors raise, but yt-dlp skips a file over max_filesize without one;
+    # don't upload the empty file that's left
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        if ydl_opts.get('max_filesize'):
+            raise Exception(f"Video audio is too large; the limit is {MAX_AUDIO_BYTES // 2**20} MB")
+        raise Exception("Audio download produced no file")
+
+    transcode_started = marks.get('transcode', finished)
+    observe_stage('download', transcode_started - started)
+    observe_stage('transcode', finished - transcode_started)
     return output_path
 
+def probe_video(youtube_url):
+    """Fetch video metadata (formats, captions, duration) without downloading any media"""
+    import yt_dlp
+    
+    ydl_opts = dict(YDL_BASE_OPTS, format='bestaudio/best')
+    
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return ydl.extract_info(youtube_url, download=False)
+
+# Probes made while accepting a job, handed to the worker in this process so it
+# doesn't ask YouTube again
+_recent_probes = OrderedDict()
+_recent_probes_lock = threading.Lock()
+
+def remember_probe(youtube_url, info):
+    now = time.time()
+    with _recent_probes_lock:
+        _recent_probes[youtube_url] = (now, info)
+        while _recent_probes and (
+            len(_recent_probes) > 256 or next(iter(_recent_probes.values()))[0] < now - PROBE_REUSE_SECONDS
+        ):
+            _recent_probes.popitem(last=False)
+
+def recall_probe(youtube_url):
+    with _recent_probes_lock:
+        entry = _recent_probes.pop(youtube_url, None)
+    if entry and entry[0] >= time.time() - PROBE_REUSE_SECONDS:
+        return entry[1]
+    return None
+
+def transcribed_seconds(info):
+    """Seconds of audio the pipeline would transcribe: the whole video or the configured section"""
+    duration = (info or {}).get('duration')
+    if duration and AUDIO_SECTION_SECONDS:
+        return min(duration, AUDIO_SECTION_SECONDS)
+    return duration
+
+def estimated_audio_bytes(info):
+    """Size of the audio that would be fetched, from the format's (approximate) size or bitrate"""
+    audio_format = pick_audio_format(info) or info
+    size = audio_format.get('filesize') or audio_format.get('filesize_approx')
+    duration = info.get('duration')
+    if not size and duration and audio_format.get('abr'):
+        size = audio_format['abr'] * 1000 / 8 * duration
+    if size and duration:
+        size = size * transcribed_seconds(info) / duration
+    return int(size) if size else None
+
+def video_limit_error(info):
+    """Why this video's audio is too big to transcribe here, or None if it's within the limits"""
+    if info.get('is_live'):
+        return "Live streams can't be transcribed until they have ended"
+    seconds = transcribed_seconds(info)
+    if MAX_VIDEO_DURATION and seconds and seconds > MAX_VIDEO_DURATION:
+        return f"Video is too long ({seconds // 60:.0f} min); the limit is {MAX_VIDEO_DURATION // 60} min"
+    size = estimated_audio_bytes(info)
+    if MAX_AUDIO_BYTES and size and size > MAX_AUDIO_BYTES:
+        return f"Video audio is too large (about {size // 2**20} MB); the limit is {MAX_AUDIO_BYTES // 2**20} MB"
+    return None
+
+def audio_section(info):
+    """Seconds to cut the audio download at, or None to fetch all of it"""
+    if not AUDIO_SECTION_SECONDS:
+        return None
+    duration = (info or {}).get('duration')
+    if duration and duration <= AUDIO_SECTION_SECONDS:
+        return None
+    return AUDIO_SECTION_SECONDS
+
+def probe_summary(info, language_code=None):
+    """What the client is told about a video as soon as it's probed, with a rough ETA"""
+    has_captions = pick_caption_track(info, language_code) is not None
+    if CAPTIONS_FIRST and has_captions:
+        eta = 20
+    else:
+        # Fetch and upload, AssemblyAI at roughly a third of real time, then Groq
+        eta = 50 + (transcribed_seconds(info) or 600) * 0.3
+    return {
+        'title': info.get('title'),
+        'duration': info.get('duration'),
+        'transcribed_seconds': transcribed_seconds(info),
+        'estimated_audio_bytes': estimated_audio_bytes(info),
+        'has_captions': has_captions,
+        'eta_seconds': int(eta),
+    }
+
+def pick_audio_format(info):
+    """Pick the best audio-only format that can be fetched over plain HTTP(S).
+
+    Returns the yt-dlp format dict (url, http_headers, ext, filesize...), or None when
+    only fragmented formats are available and the download + transcode path is needed.
+    """
+    candidates = [
+        f for f in (info or {}).get('formats') or []
+        if f.get('url')
+        and f.get('vcodec') == 'none'
+        and f.get('acodec') not in (None, 'none')
+        and str(f.get('protocol', '')).startswith('http')
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda f: f.get('abr') or f.get('tbr') or 0)
+
+def iter_audio_chunks(audio_format, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the raw bytes of an audio format, fetched in ranged requests"""
+    headers = dict(audio_format.get('http_headers') or {})
+    offset = 0
+    
+    while True:
+        headers['Range'] = f'bytes={offset}-{offset + STREAM_RANGE_SIZE - 1}'
+        with media_session.get(audio_format['url'], headers=headers, stream=True) as response:
+            if response.status_code not in (200, 206):
+                raise Exception(f"Audio download failed: {response.status_code}")
+            received = 0
+            for chunk in response.iter_content(chunk_size):
+                received += len(chunk)
+                yield chunk
+        offset += received
+        
+        # 200 means the server ignored the range and sent everything
+        if response.status_code == 200 or received < STREAM_RANGE_SIZE:
+            return
+
+def stream_to_assemblyai(info, api_key, job_id=None):
+    """Stream the native audio track into an AssemblyAI upload without touching disk.
+
+    Returns the upload URL, or None if the video has no directly streamable audio format.
+    The stream is cut off (raising JobCancelled) once job_id is cancelled.
+    """
+    audio_format = pick_audio_format(info)
+    if audio_format is None:
+        return None
+    
+    headers = {'authorization': api_key}
+    sent = [0]
+    
+    def counted(chunks):
+        for chunk in chunks:
+            if cancel_tokens.cancelled(job_id):
+                CANCEL_RECLAIMED.inc(work='upload')
+                raise JobCancelled(f"Job {job_id} was cancelled")
+            sent[0] += len(chunk)
+            yield chunk
+    
+    body = buffered_body(counted(iter_audio_chunks(audio_format)), STREAM_BUFFER_BYTES, STREAM_CHUNK_SIZE)
+    
+    with stage_limits.stage('upload'), timed('stream_upload'):
+        response = assemblyai_stream_session.post(
+            f'{ASSEMBLYAI_BASE_URL}/v2/upload',
+            headers=headers,
+            data=body
+        )
+    UPLOAD_BYTES.observe(sent[0], path='streaming')
+    
+    if response.status_code == 200:
+        return response.json()['upload_url']
+    else:
+        raise Exception(f"Upload failed: {response.status_code} - {response.text}")
+
+def pick_caption_track(info, language_code=None):
+    """Choose the best caption track for the requested (or the video's own) language.
+
+    Manual subtitles win over auto-generated ones. Auto captions are only used in the
+    video's original language; YouTube's other auto tracks are machine translations.
+    Returns (language, formats, automatic) or None if there's nothing suitable.
+    """
+    subtitles = info.get('subtitles') or {}
+    automatic = info.get('automatic_captions') or {}
+    
+    # yt-dlp doesn't always know the language, but the real auto track is marked "-orig"
+    original = info.get('language')
+    if not original:
+        original = next((lang[:-len('-orig')] for lang in automatic if lang.endswith('-orig')), None)
+    
+    # Auto-detect mode: without a known original language AssemblyAI has to detect it
+    lang = language_code or original
+    if not lang:
+        return None
+    
+    for track_lang, formats in subtitles.items():
+        if track_lang == lang or track_lang.startswith(lang + '-'):
+            return lang, formats, False
+    if automatic.get(f'{lang}-orig'):
+        return lang, automatic[f'{lang}-orig'], True
+    if original and lang.split('-')[0] == original.split('-')[0] and automatic.get(lang):
+        return lang, automatic[lang], True
+    return None
+
+def captions_to_text(content, ext):
+    """Turn a json3 or WebVTT caption file into plain transcript text"""
+    lines = []
+    
+    if ext == 'json3':
+        for event in json.loads(content).get('events', []):
+            text = ''.join(seg.get('utf8', '') for seg in event.get('segs') or []).strip()
+            if text:
+                lines.append(text)
+    else:
+        for line in content.splitlines():
+            line = line.strip()
+            if not line or line == 'WEBVTT' or '-->' in line or line.isdigit():
+                continue
+            if line.startswith(('Kind:', 'Language:', 'NOTE', 'STYLE')):
+                continue
+            line = re.sub(r'<[^>]+>', '', line).strip()
+            # Auto captions repeat the previous line as they scroll
+            if line and (not lines or lines[-1] != line):
+                lines.append(line)
+    
+    return re.sub(r'\s+', ' ', ' '.join(lines)).strip()
+
+def fetch_captions(info, language_code=None):
+    """Build transcript info from YouTube captions, or None if no usable track exists"""
+    track = pick_caption_track(info, language_code)
+    if track is None:
+        return None
+    
+    lang, formats, automatic = track
+    by_ext = {f.get('ext'): f for f in formats if f.get('url')}
+    caption_format = by_ext.get('json3') or by_ext.get('vtt')
+    if caption_format is None:
+        return None
+    
+    response = media_session.get(caption_format['url'])
+    if response.status_code != 200:
+        return None
+    
+    text = captions_to_text(response.text, caption_format['ext'])
+    if len(text) < MIN_CAPTION_CHARS:
+        return None
+    
+    return {
+        'text': text,
+        'language_detected': lang.split('-')[0],
+        'language_confidence': 0.9 if automatic else 1.0,
+        'audio_duration': info.get('duration'),
+        'source': 'auto_captions' if automatic else 'captions',
+    }
+
 def upload_to_assemblyai(file_path, api_key):
     """Upload audio file to AssemblyAI"""
     headers = {'authorization': api_key}
+    UPLOAD_BYTES.observe(os.path.getsize(file_path), path='file')
     
-    with open(file_path, 'rb') as f:
-        response = requests.post(
-            'https://api.assemblyai.com/v2/upload',
+    with stage_limits.stage('upload'), timed('upload'), open(file_path, 'rb') as f:
+        response = assemblyai_session.post(
+            f'{ASSEMBLYAI_BASE_URL}/v2/upload',
             headers=headers,
-            files={'file': f}
+            files={'file': f},
+            timeout=ASSEMBLYAI_UPLOAD_TIMEOUT
         )
     
     if response.status_code == 200:
@@ -75,7 +586,7 @@ def upload_to_assemblyai(file_path, api_key):
     else:
         raise Exception(f"Upload failed: {response.status_code} - {response.text}")
 
-def submit_transcription(audio_url, api_key, language_code=None):
+def submit_transcription(audio_url, api_key, language_code=None, webhook_url=None):
     """Submit transcription request to AssemblyAI with language support"""
     headers = {
         'authorization': api_key,
@@ -95,80 +606,597 @@ def submit_transcription(audio_url, api_key, language_code=None):
         data['language_code'] = language_code
         data['language_detection'] = False
     
-    response = requests.post(
-        'https://api.assemblyai.com/v2/transcript',
-        headers=headers,
-        json=data
-    )
+    # Ask AssemblyAI to call us back, authenticated with the shared secret
+    if webhook_url:
+        data['webhook_url'] = webhook_url
+        data['webhook_auth_header_name'] = WEBHOOK_SECRET_HEADER
+        data['webhook_auth_header_value'] = ASSEMBLYAI_WEBHOOK_SECRET
+    
+    with timed('submit'):
+        response = assemblyai_session.post(
+            f'{ASSEMBLYAI_BASE_URL}/v2/transcript',
+            headers=headers,
+            json=data
+        )
     
     if response.status_code == 200:
         return response.json()['id']
     else:
         raise Exception(f"Transcription submission failed: {response.status_code} - {response.text}")
 
-def poll_transcription(transcript_id, api_key, job_id):
-    """Poll AssemblyAI for transcription completion"""
+def fetch_transcript(transcript_id, api_key):
+    """Fetch the current state of an AssemblyAI transcript"""
     headers = {'authorization': api_key}
     
-    while True:
-        response = requests.get(
-            f'https://api.assemblyai.com/v2/transcript/{transcript_id}',
+    ASSEMBLYAI_POLLS.inc()
+    with stage_limits.stage('poll'):
+        response = assemblyai_session.get(
+            f'{ASSEMBLYAI_BASE_URL}/v2/transcript/{transcript_id}',
             headers=headers
         )
+    
+    if response.status_code == 200:
+        return response.json()
+    else:
+        raise Exception(f"Polling failed: {response.status_code} - {response.text}")
+
+
+def poll_delay(attempt, audio_duration=None, fallback=False):
+    """Seconds to wait before the next AssemblyAI status check.
+
+    Transcription takes a fraction of the audio length, so long videos are checked
+    less often. In webhook mode polling is only a safety net and backs off further.
+    """
+    if fallback:
+        # First check around when the transcript should be done, then back off
+        expected = max(30, (audio_duration or 0) * 0.3)
+        return min(300, expected * (2 ** attempt))
+    ceiling = min(30, max(5, (audio_duration or 0) * 0.02))
+    return min(ceiling, 3 * (1.5 ** attempt))
+
+
+def poll_transcription(transcript_id, api_key, job_id, video_id=None, language_code=None, regenerate=False):
+    """Poll AssemblyAI for transcription completion"""
+    attempt = 0
+    submitted = time.perf_counter()
+    started = None  # when AssemblyAI moved the transcript from its queue to processing
+    
+    while True:
+        try:
+            result = fetch_transcript(transcript_id, api_key)
+        except Exception as e:
+            finish_job(job_id, {
+                'status': 'error',
+                'error': str(e)
+            })
+            return
+        
+        if started is None and result['status'] != 'queued':
+            started = time.perf_counter()
+            observe_stage('assemblyai_queue', started - submitted)
         
-        if response.status_code != 200:
-            transcription_results[job_id] = {
+        if result['status'] in ('completed', 'error'):
+            observe_stage('assemblyai_processing', time.perf_counter() - started)
+            complete_transcription(job_id, result, video_id, language_code, regenerate)
+            return
+        
+        # AssemblyAI reports "queued"/"processing"; both are "processing" to the client
+        cancelled = cancel_tokens.cancelled(job_id)
+        if not cancelled:
+            job_store.update(job_id, status='processing')
+            cancelled = cancel_tokens.wait(job_id, poll_delay(attempt, result.get('audio_duration')))
+        if cancelled:
+            CANCEL_RECLAIMED.inc(work='transcription_poll')
+            raise JobCancelled(f"Job {job_id} was cancelled")
+        attempt += 1
+
+
+async def poll_transcription_async(transcript_id, api_key, job_id, video_id=None, language_code=None, regenerate=False):
+    """poll_transcription for async mode: waits on the event loop, then queues generation"""
+    attempt = 0
+    submitted = time.perf_counter()
+    started = None
+    
+    while True:
+        try:
+            result = await async_runtime.run_blocking(fetch_transcript, transcript_id, api_key)
+        except Exception as e:
+            await async_runtime.run_blocking(finish_job, job_id, {
                 'status': 'error',
-                'error': f"Polling failed: {response.status_code} - {response.text}"
-            }
+                'error': str(e)
+            })
             return
         
-        result = response.json()
-        status = result['status']
+        if started is None and result['status'] != 'queued':
+            started = time.perf_counter()
+            observe_stage('assemblyai_queue', started - submitted, job_id)
         
-        transcription_results[job_id] = {'status': status}
+        if result['status'] in ('completed', 'error'):
+            observe_stage('assemblyai_processing', time.perf_counter() - started, job_id)
+            while True:
+                try:
+                    scheduler.submit(
+                        job_id, job_timings.wrap(complete_transcription, job_id),
+                        job_id, result, video_id, language_code, regenerate
+                    )
+                    return
+                except QueueFull:
+                    await asyncio.sleep(5)
         
-        if status == 'completed':
-            # Generate MCQs and Flashcards using Groq
-            transcription_results[job_id] = {'status': 'generating_content'}
-            
-            # Generate MCQs
-            mcq_data = generate_mcqs_with_groq(
-                result['text'], 
-                result.get('language_detected', 'en')
-            )
-            
-            # Generate Flashcards
-            flashcard_data = generate_flashcards_with_groq(
-                result['text'], 
-                result.get('language_detected', 'en')
-            )
-            
-            # Include all data in final result
-            transcription_results[job_id] = {
-                'status': 'completed',
-                'transcript': result['text'],  # Keep transcript for internal use
-                'language_detected': result.get('language_detected'),
-                'language_confidence': result.get('confidence', 0),
-                'audio_duration': result.get('audio_duration'),
-                'mcqs': mcq_data.get('questions', []),
-                'mcq_error': mcq_data.get('error'),
-                'flashcards': flashcard_data.get('flashcards', []),
-                'flashcard_error': flashcard_data.get('error')
-            }
+        # Also keeps long transcriptions from being mistaken for dead jobs
+        await async_runtime.run_blocking(job_store.update, job_id, status='processing')
+        # Sleep in short steps so a cancel from this process is seen right away
+        deadline = time.monotonic() + poll_delay(attempt, result.get('audio_duration'))
+        while time.monotonic() < deadline and not cancel_tokens.is_set(job_id):
+            await asyncio.sleep(min(1.0, deadline - time.monotonic()))
+        if await async_runtime.run_blocking(cancel_tokens.cancelled, job_id):
+            CANCEL_RECLAIMED.inc(work='transcription_poll')
+            await async_runtime.run_blocking(finish_job, job_id, {'status': 'cancelled'})
             return
-        elif status == 'error':
-            transcription_results[job_id] = {
-                'status': 'error',
-                'error': result.get('error', 'Unknown error')
-            }
+        attempt += 1
+
+
+def complete_transcription(job_id, result, video_id=None, language_code=None, regenerate=False):
+    """Record a finished AssemblyAI transcript and generate content from it"""
+    if result['status'] == 'error':
+        finish_job(job_id, {
+            'status': 'error',
+            'error': result.get('error', 'Unknown error')
+        })
+        return
+    
+    transcript_info = {
+        'text': result['text'],
+        'language_detected': result.get('language_detected'),
+        'language_confidence': result.get('confidence', 0),
+        'audio_duration': result.get('audio_duration'),
+    }
+    if video_id:
+        result_cache.put(video_id, language_code, 'transcript', transcript_info)
+    
+    try:
+        generate_content(job_id, transcript_info, video_id, language_code, regenerate)
+    except JobCancelled:
+        finish_job(job_id, {'status': 'cancelled'})
+
+
+def delete_transcript(transcript_id, attempt=0):
+    """Delete a cancelled job's transcript (audio and text) at AssemblyAI.
+
+    A transcript that's still being processed may not be deletable yet, so failed
+    attempts are retried a few times on the timer thread.
+    """
+    try:
+        response = assemblyai_session.delete(
+            f'{ASSEMBLYAI_BASE_URL}/v2/transcript/{transcript_id}',
+            headers={'authorization': ASSEMBLYAI_API_KEY}
+        )
+        if response.status_code == 200:
+            CANCEL_RECLAIMED.inc(work='transcript_deleted')
+            return
+        print(f"Deleting transcript {transcript_id} failed: {response.status_code} - {response.text}")
+    except Exception as e:
+        print(f"Deleting transcript {transcript_id} failed: {e}")
+    
+    if attempt < 4:
+        timers.schedule(poll_delay(attempt, fallback=True), delete_transcript, transcript_id, attempt + 1)
+
+
+def assemblyai_webhook_url(job_id):
+    """Callback URL for a job, or None when webhook mode isn't configured"""
+    if not (ASSEMBLYAI_WEBHOOK_BASE_URL and ASSEMBLYAI_WEBHOOK_SECRET):
+        return None
+    return f"{ASSEMBLYAI_WEBHOOK_BASE_URL.rstrip('/')}/webhooks/assemblyai/{job_id}"
+
+
+def dispatch_transcription_result(job_id, result):
+    """Hand a finished transcript for a webhook-mode job to the worker pool.
+
+    The webhook and the fallback poll can both see the same transcript finish (even in
+    different processes), so the job is claimed first and only the winner continues.
+    Returns False if the pool is full and the result should be delivered again later.
+    """
+    job = job_store.get(job_id)
+    if job and job.get('cancelled_at'):
+        finish_job(job_id, {'status': 'cancelled'})
+        return True
+    if not job_store.transition(job_id, 'processing', status='transcribed'):
+        return True
+    if job.get('submitted_at'):
+        observe_stage('assemblyai_transcription', time.time() - job['submitted_at'], job_id)
+    
+    try:
+        scheduler.submit(
+            job_id, job_timings.wrap(complete_transcription, job_id),
+            job_id, result, job.get('video_id'), job.get('language_code'), job.get('regenerate', False)
+        )
+    except QueueFull:
+        job_store.transition(job_id, 'transcribed', status='processing')
+        return False
+    return True
+
+
+def schedule_transcription_check(job_id, delay, attempt=0):
+    """Check on a job's submitted transcript after delay seconds.
+
+    With the SQLite queue the check is a queued task, so it outlives the worker that
+    submitted the audio; otherwise it runs on this process's timer thread.
+    """
+    if JOB_QUEUE == 'sqlite':
+        scheduler.submit(job_id, check_transcription_job, job_id, attempt, delay=delay)
+    else:
+        timers.schedule(delay, check_transcription_job, job_id, attempt)
+
+
+def check_transcription_job(job_id, attempt=0):
+    """One status check for a job waiting on AssemblyAI without a thread of its own.
+
+    In webhook mode this is the fallback for a callback that hasn't arrived yet.
+    """
+    job = job_store.get(job_id)
+    if job and job.get('cancelled_at'):
+        # Cancelled while it waited (finish_job's record no longer carries the flag)
+        finish_job(job_id, {'status': 'cancelled'})
+        return
+    if not job or job.get('status') != 'processing':
+        # The webhook already handled it (or the job is gone)
+        return
+    
+    audio_duration = None
+    try:
+        result = fetch_transcript(job['transcript_id'], ASSEMBLYAI_API_KEY)
+        audio_duration = result.get('audio_duration')
+        if result['status'] in ('completed', 'error') and dispatch_transcription_result(job_id, result):
             return
+        # Touch the job so long transcriptions aren't mistaken for dead ones
+        job_store.transition(job_id, 'processing')
+    except Exception as e:
+        print(f"Transcript check for job {job_id} failed: {e}")
+    
+    fallback = bool(assemblyai_webhook_url(job_id))
+    schedule_transcription_check(job_id, poll_delay(attempt + 1, audio_duration, fallback), attempt + 1)
+
+
+def generate_content(job_id, transcript_info, video_id=None, language_code=None, regenerate=False):
+    """Generate MCQs and flashcards for a finished transcript, reusing cached results.
+
+    Both generators run at the same time and each result is published to the job as
+    soon as it's ready, so the quiz can be shown while flashcards are still being made.
+    Within each, items are appended to the job one by one as Groq streams them.
+    """
+    set_stage(job_id, 'generating_content')
+    language = transcript_info.get('language_detected') or 'en'
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        mcq_future = executor.submit(
+            job_timings.wrap(cached_generate), 'mcqs', generate_mcqs, transcript_info, language, video_id, language_code,
+            regenerate, item_publisher(job_id, 'mcqs')
+        )
+        flashcard_future = executor.submit(
+            job_timings.wrap(cached_generate), 'flashcards', generate_flashcards, transcript_info, language, video_id, language_code,
+            regenerate, item_publisher(job_id, 'flashcards')
+        )
+
+        for future in as_completed([mcq_future, flashcard_future]):
+            if future is mcq_future:
+                mcq_data = future.result()
+                job_store.update(job_id, mcqs=mcq_data.get('questions', []), mcq_error=mcq_data.get('error'))
+            else:
+                flashcard_data = future.result()
+                job_store.update(job_id, flashcards=flashcard_data.get('flashcards', []), flashcard_error=flashcard_data.get('error'))
+
+    observe_stage('generate', time.perf_counter() - started)
+    finish_job(job_id, build_completed_result(transcript_info, mcq_data, flashcard_data))
+
+
+def item_publisher(job_id, field):
+    """Callback that appends each generated item to the job's field as it arrives"""
+    items = []
+    lock = threading.Lock()
+    
+    def publish(item):
+        with lock:
+            items.append(item)
+            job_store.update(job_id, **{field: list(items)})
+            if len(items) == 1:
+                observe_stage(f'first_{field}', time.perf_counter() - started, job_id)
+    
+    started = time.perf_counter()
+    return publish
+
+
+def set_stage(job_id, status, **fields):
+    """Move a job on to its next pipeline stage, or raise JobCancelled if it has been cancelled"""
+    cancel_tokens.check(job_id)
+    job_store.update(job_id, status=status, **fields)
+
+
+def finish_job(job_id, job):
+    """Write a job's final state together with where its time went"""
+    # However far the pipeline got (or whatever error that caused), a cancelled job ends as cancelled
+    if job['status'] == 'cancelled' or cancel_tokens.cancelled(job_id):
+        stored = job_store.get(job_id) or {}
+        job = {
+            'status': 'cancelled',
+            'error': 'Job was cancelled',
+            'cancel_reason': stored.get('cancel_reason'),
+            'video': stored.get('video'),
+        }
+        if stored.get('transcript_id'):
+            timers.schedule(0, delete_transcript, stored['transcript_id'])
+    JOBS_FINISHED.inc(status=job['status'])
+    job_store.set(job_id, dict(job, stage_timings=job_timings.pop(job_id)))
+    cancel_tokens.discard(job_id)
+
+
+def cached_generate(kind, generator, transcript_info, language, video_id=None, language_code=None, regenerate=False,
+                    on_item=None):
+    """Return cached MCQs/flashcards for the video, generating (and caching) them on a miss"""
+    data = result_cache.get(video_id, language_code, kind) if video_id and not regenerate else None
+    if data is None:
+        data = generator(
+            transcript_info['text'], language, transcript_info.get('audio_duration'), video_id, regenerate, on_item
+        )
+        # Don't cache the generic fallback content
+        if video_id and not data.get('error'):
+            result_cache.put(video_id, language_code, kind, data)
+    return data
+
+
+def generate_mcqs(transcript, language_detected="en", audio_duration=None, video_id=None, regenerate=False,
+                  on_item=None):
+    """Generate MCQs covering the whole transcript"""
+    return generate_over_transcript(
+        transcript, language_detected, generate_mcqs_with_groq, 'mcqs', 'questions', 'question', MCQ_TARGET,
+        audio_duration, video_id, regenerate, on_item
+    )
+
+
+def generate_flashcards(transcript, language_detected="en", audio_duration=None, video_id=None, regenerate=False,
+                        on_item=None):
+    """Generate flashcards covering the whole transcript"""
+    return generate_over_transcript(
+        transcript, language_detected, generate_flashcards_with_groq, 'flashcards', 'flashcards', 'front', FLASHCARD_TARGET,
+        audio_duration, video_id, regenerate, on_item
+    )
+
+
+def generate_over_transcript(transcript, language_detected, generator, kind, items_key, text_key, target,
+                             audio_duration=None, video_id=None, regenerate=False, on_item=None):
+    """Map-reduce generation over the full transcript, topped up from the question bank.
+
+    Banked items this transcript covers are used first. Short transcripts go to the
+    generator as before. Longer ones are split at sentence/paragraph boundaries, each
+    chunk gets its own (bounded-concurrency) Groq call for a share of the candidates,
+    and the results are deduplicated and picked round-robin so the final set covers
+    the whole video.
+    
+    With on_item, each item is handed over the moment it's accepted (banked ones
+    first, then generated ones as Groq streams them), up to the target, and the
+    final set starts with exactly those items in that order.
+    """
+    started = time.time()
+    usage = UsageTracker()
+    budget = chunk_budget(transcript, CHUNK_MIN_TOKENS, CHUNK_MAX_TOKENS, MAX_CHUNKS)
+    chunks = split_transcript(transcript, budget)
+    
+    banked = []
+    if QUESTION_BANK and not regenerate:
+        banked = question_bank.lookup(kind, language_detected, transcript, video_id, limit=target)
+    need = target - len(banked)
+    
+    # Items already handed to on_item; chunks stream concurrently, so this is shared
+    published = []
+    seen = [word_set(item.get(text_key, '')) for item in banked]
+    publish_lock = threading.Lock()
+    
+    def publish(item):
+        with publish_lock:
+            if len(published) >= need or is_near_duplicate(item.get(text_key, ''), seen):
+                return
+            published.append(item)
+            seen.append(word_set(item.get(text_key, '')))
+            on_item(item)
+    
+    if on_item:
+        for item in banked:
+            on_item(item)
+    
+    if need <= 0:
+        data = {items_key: banked}
+    else:
+        streamed = publish if on_item else None
+        if len(chunks) <= 1:
+            # With some items already banked, only the shortfall is asked for
+            if banked:
+                results = [generator(
+                    transcript, language_detected, count=need, chunk=True, usage=usage, fresh=regenerate, on_item=streamed
+                )]
+            else:
+                results = [generator(transcript, language_detected, usage=usage, fresh=regenerate, on_item=streamed)]
+        else:
+            # Over-generate a little so dedupe still leaves enough to choose from
+            per_chunk = min(need, max(3, math.ceil(need * 1.5 / len(chunks))))
+            with ThreadPoolExecutor(max_workers=CHUNK_CONCURRENCY) as executor:
+                results = list(executor.map(
+                    job_timings.wrap(lambda piece: generator(
+                        piece, language_detected, count=per_chunk, chunk=True, usage=usage, fresh=regenerate,
+                        on_item=streamed
+                    )),
+                    chunks
+                ))
         
-        time.sleep(5)
+        # Calls that failed come back as the generic fallback content, marked with an error
+        candidates = [result.get(items_key, []) for result in results if not result.get('error')]
+        if candidates or banked:
+            # What was already shown stays; the balanced pick only fills what's left
+            fresh = published + select_balanced(candidates, need - len(published), text_key, seen=seen)
+            if QUESTION_BANK and fresh:
+                question_bank.add(kind, video_id, language_detected, fresh)
+            data = {items_key: banked + fresh}
+        else:
+            data = results[0]
+    
+    data['generation'] = dict(
+        usage.report(time.time() - started, len(transcript), audio_duration),
+        chunks=len(chunks),
+        from_bank=len(banked)
+    )
+    print(f"Generated {len(data.get(items_key, []))} {items_key} from {len(chunks)} chunk(s): {data['generation']}")
+    return data
+
 
+def call_groq(data, generator, fresh=False, on_text=None):
+    """POST a chat completion to Groq, answering repeats of an identical request from the memo.
 
-def generate_mcqs_with_groq(transcript, language_detected="en"):
-    """Generate relevant MCQs from transcript using Groq API"""
+    Returns the parsed response (marked ``memoized`` when it came from the memo), or
+    None if Groq answered with an error status. fresh=True skips the memo lookup.
+    Responses aren't memoized here; the generators do that once they have checked
+    them (see ``remember_groq_response``).
+    With on_text the completion is streamed and each piece of text is passed to it
+    as it arrives (a memoized response arrives as one piece). Raises JobCancelled,
+    before the call or part-way through a stream, once the current job is cancelled.
+    """
+    job_id = job_timings.current()
+    prompt_tokens = estimate_tokens(json.dumps(data['messages']))
+    max_tokens = data.get('max_tokens', 1024)
+    
+    def skip_if_cancelled(grant=None):
+        if cancel_tokens.cancelled(job_id):
+            if grant:
+                groq_budget.settle(grant)
+            CANCEL_RECLAIMED.inc(work='groq_call')
+            CANCEL_GROQ_TOKENS.inc(prompt_tokens + max_tokens)
+            raise JobCancelled(f"Job {job_id} was cancelled")
+    
+    skip_if_cancelled()
+    key = request_key(data) if GROQ_MEMO else None
+    if key and fresh:
+        groq_memo.bypass()
+    elif key:
+        memoized = groq_memo.get(key)
+        if memoized is not None:
+            if on_text:
+                on_text(memoized['choices'][0]['message']['content'])
+            return dict(memoized, memoized=True)
+    stream = bool(on_text) and GROQ_STREAMING
+    
+    # Wait for rate budget before taking a Groq slot, so waiting doesn't hold one
+    grant = None
+    if groq_budget:
+        grant = groq_budget.acquire(
+            prompt_tokens, max_tokens, job_id, abandon=lambda: cancel_tokens.cancelled(job_id)
+        )
+        skip_if_cancelled(grant)
+        observe_stage('groq_budget_wait', grant['waited'])
+    
+    headers = {
+        "Authorization": f"Bearer {GROQ_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    with stage_limits.stage('groq'), timed(f'groq_{generator}'):
+        # The job may have been cancelled while this call waited for a slot
+        skip_if_cancelled(grant)
+        started = time.perf_counter()
+        response = None
+        received = []
+        try:
+            response = groq_session.post(
+                f"{GROQ_BASE_URL}/openai/v1/chat/completions",
+                headers=headers,
+                json=dict(data, stream=True) if stream else data,
+                stream=stream
+            )
+            
+            if response.status_code != 200:
+                response.close()
+                if grant:
+                    groq_budget.settle(grant, None, response.headers, response.status_code)
+                GROQ_ATTEMPTS.inc(generator=generator, outcome='http_error')
+                return None
+            
+            if stream:
+                def on_piece(text):
+                    if not received:
+                        observe_stage(f'groq_{generator}_first_token', time.perf_counter() - started)
+                    received.append(text)
+                    if cancel_tokens.cancelled(job_id):
+                        # Hanging up stops generation, so the rest of the completion isn't billed
+                        CANCEL_RECLAIMED.inc(work='groq_stream')
+                        CANCEL_GROQ_TOKENS.inc(max(0, max_tokens - estimate_tokens(''.join(received))))
+                        raise JobCancelled(f"Job {job_id} was cancelled")
+                    on_text(text)
+                
+                try:
+                    result = read_groq_stream(response, on_piece)
+                finally:
+                    response.close()
+            else:
+                result = response.json()
+        except Exception:
+            # A timeout, dropped connection, unreadable body or a cancel mid-stream.
+            # Text that streamed in was generated (and billed), so the prompt and that
+            # much completion are charged; with nothing received the reservation is refunded.
+            if grant:
+                used = {'total_tokens': prompt_tokens + estimate_tokens(''.join(received))} if received else None
+                groq_budget.settle(grant, used, response.headers if response is not None else None)
+            raise
+    
+    if grant:
+        groq_budget.settle(grant, result.get('usage'), response.headers)
+    record_groq_usage(generator, result.get('usage'))
+    return result
+
+
+def remember_groq_response(data, result, usable):
+    """Memoize a checked Groq response for identical requests.
+
+    Only a completion that finished on its own and gave enough valid items is kept:
+    replaying a truncated or malformed one would hand a resubmitted job the same
+    bad answer instead of the retry it came for.
+    """
+    if not GROQ_MEMO or result.get('memoized') or not usable:
+        return
+    if result['choices'][0].get('finish_reason') != 'stop':
+        return
+    groq_memo.put(request_key(data), result)
+
+
+def record_groq_usage(generator, usage):
+    """Token histograms for one Groq call"""
+    for kind in ('prompt', 'completion'):
+        tokens = (usage or {}).get(f'{kind}_tokens')
+        if tokens:
+            GROQ_TOKENS.observe(tokens, generator=generator, kind=kind)
+
+
+def build_completed_result(transcript_info, mcq_data, flashcard_data):
+    """Assemble the final job result from transcript, MCQ and flashcard payloads"""
+    return {
+        'status': 'completed',
+        'transcript': transcript_info['text'],  # Keep transcript for internal use
+        'language_detected': transcript_info.get('language_detected'),
+        'language_confidence': transcript_info.get('language_confidence', 0),
+        'audio_duration': transcript_info.get('audio_duration'),
+        'mcqs': mcq_data.get('questions', []),
+        'mcq_error': mcq_data.get('error'),
+        'flashcards': flashcard_data.get('flashcards', []),
+        'flashcard_error': flashcard_data.get('error'),
+        'transcript_source': transcript_info.get('source', 'assemblyai'),
+        'generation_stats': {
+            'mcqs': mcq_data.get('generation'),
+            'flashcards': flashcard_data.get('generation'),
+        }
+    }
+
+
+def generate_mcqs_with_groq(transcript, language_detected="en", count=None, chunk=False, usage=None, fresh=False, on_item=None):
+    """Generate relevant MCQs from transcript using Groq API.
+
+    With chunk=True the transcript is one pre-sized chunk of a longer video: all of it
+    is sent and ``count`` questions are requested instead of the defaults.
+    """
     
     # Content-focused prompts that analyze the actual transcript
     prompts = {
@@ -229,11 +1257,6 @@ JSON मा मात्र जवाफ दिनुहोस्।"""
     
     prompt = prompts.get(language_detected, prompts["en"])
     
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
     # Flexible strategies that adapt to content
     strategies = [
         {"max_tokens": 4000, "transcript_length": 3000, "questions": 12},
@@ -242,14 +1265,40 @@ JSON मा मात्र जवाफ दिनुहोस्।"""
         {"max_tokens": 2500, "transcript_length": 1500, "questions": 8},
         {"max_tokens": 2000, "transcript_length": 1000, "questions": 7}
     ]
+    if chunk:
+        strategies = scale_strategies(strategies, len(transcript), 'questions', count or strategies[0]['questions'])
+    min_questions = min(5, strategies[0]['questions'])
+    target = strategies[0]['questions']
+    
+    # Valid questions survive a failed or truncated attempt; retries only ask for the rest
+    collected = []
+    seen = []
+    
+    def keep(q):
+        """Collect a valid, new question, handing it to on_item as soon as it's accepted"""
+        if len(collected) >= target or not is_valid_mcq(q) or is_near_duplicate(q['question'], seen):
+            return
+        collected.append(q)
+        seen.append(word_set(q['question']))
+        if on_item:
+            on_item(q)
     
-    for strategy in strategies:
+    for index, strategy in enumerate(strategies):
+        if index:
+            STRATEGY_FALLBACKS.inc(generator='mcqs')
+        missing = min(strategy['questions'], target - len(collected))
         try:
+            user_content = f"{prompt}\n\nTranscript content to analyze:\n{transcript[:strategy['transcript_length']]}"
+            if collected:
+                user_content += "\n\nThese questions were already written, do not repeat them:\n" + "\n".join(
+                    f"- {q['question']}" for q in collected
+                )
+            
             data = {
                 "messages": [
                     {
                         "role": "system",
-                        "content": f"""You are an expert educator creating multiple choice questions based on transcript content. Your goal is to create {strategy['questions']} high-quality educational questions that test understanding of the material presented.
+                        "content": f"""You are an expert educator creating multiple choice questions based on transcript content. Your goal is to create {missing} high-quality educational questions that test understanding of the material presented.
 
 IMPORTANT GUIDELINES:
 1. Focus on the actual content of the transcript
@@ -264,7 +1313,7 @@ Return ONLY valid JSON format with no extra text."""
                     },
                     {
                         "role": "user",
-                        "content": f"{prompt}\n\nTranscript content to analyze:\n{transcript[:strategy['transcript_length']]}"
+                        "content": user_content
                     }
                 ],
                 "model": "llama3-70b-8192",
@@ -272,54 +1321,52 @@ Return ONLY valid JSON format with no extra text."""
                 "max_tokens": strategy["max_tokens"]
             }
             
-            response = requests.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=60
-            )
+            # Streamed questions are validated and kept one by one as they close
+            parser = ItemStream('questions')
             
-            if response.status_code != 200:
+            def on_text(text):
+                for q in parser.feed(text):
+                    keep(q)
+            
+            result = call_groq(data, 'mcqs', fresh, on_text if on_item else None)
+            if result is None:
                 continue
             
-            result = response.json()
+            if usage and not result.get('memoized'):
+                usage.add(result.get('usage'))
             content = result["choices"][0]["message"]["content"].strip()
             
-            print(f"MCQ Strategy: {strategy}")
+            print(f"MCQ Strategy: {strategy} (asked for {missing})")
             print(f"Raw response length: {len(content)}")
-            print(f"Finish reason: {result.get('choices', [{}])[0].get('finish_reason')}")
-            
-            # Clean the response
-            content = clean_json_response(content)
-            
-            # Try to parse
-            try:
-                mcq_data = json.loads(content)
-                
-                # Validate structure and ensure we have enough questions
-                if validate_mcq_structure(mcq_data) and len(mcq_data.get('questions', [])) >= 5:
-                    return mcq_data
-                else:
-                    print(f"Invalid MCQ structure or insufficient questions ({len(mcq_data.get('questions', []))}), trying next strategy")
-                    continue
-                    
-            except json.JSONDecodeError as e:
-                print(f"JSON parse error: {e}")
-                fixed_content = fix_json_issues(content)
-                if fixed_content:
-                    try:
-                        mcq_data = json.loads(fixed_content)
-                        if validate_mcq_structure(mcq_data) and len(mcq_data.get('questions', [])) >= 5:
-                            return mcq_data
-                    except:
-                        pass
-                continue
+            print(f"Finish reason: {result.get('choices', [{}])[0].get('finish_reason')}")
+            
+            # Keep every complete, valid question, even from a truncated response
+            # (already-streamed ones are rejected as duplicates)
+            items = parse_items(clean_json_response(content), 'questions')
+            for q in items:
+                keep(q)
+            valid = sum(1 for q in items if is_valid_mcq(q))
+            remember_groq_response(data, result, valid >= min(missing, min_questions))
+            
+            if len(collected) >= min_questions:
+                GROQ_ATTEMPTS.inc(generator='mcqs', outcome='ok')
+                return {"questions": collected[:target]}
+            GROQ_ATTEMPTS.inc(generator='mcqs', outcome='too_few')
+            print(f"Only {len(collected)} valid questions so far, asking for the rest")
                 
+        except JobCancelled:
+            raise
         except Exception as e:
             print(f"MCQ Strategy failed: {e}")
+            GROQ_ATTEMPTS.inc(generator='mcqs', outcome='exception')
             continue
     
+    # A few real questions beat the generic fallback
+    if collected:
+        return {"questions": collected}
+    
     # Content-focused fallback questions
+    FALLBACK_CONTENT.inc(generator='mcqs')
     return {
         "questions": [
             {
@@ -345,8 +1392,12 @@ Return ONLY valid JSON format with no extra text."""
     }
 
 
-def generate_flashcards_with_groq(transcript, language_detected="en"):
-    """Generate relevant flashcards from transcript using Groq API"""
+def generate_flashcards_with_groq(transcript, language_detected="en", count=None, chunk=False, usage=None, fresh=False, on_item=None):
+    """Generate relevant flashcards from transcript using Groq API.
+
+    With chunk=True the transcript is one pre-sized chunk of a longer video: all of it
+    is sent and ``count`` flashcards are requested instead of the defaults.
+    """
     
     # Content-focused prompts that analyze the actual transcript
     prompts = {
@@ -406,11 +1457,6 @@ JSON मा मात्र जवाफ दिनुहोस्।"""
     
     prompt = prompts.get(language_detected, prompts["en"])
     
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
     # Flexible strategies for flashcard generation
     strategies = [
         {"max_tokens": 3500, "transcript_length": 2500, "flashcards": 15},
@@ -418,14 +1464,40 @@ JSON मा मात्र जवाफ दिनुहोस्।"""
         {"max_tokens": 2500, "transcript_length": 1500, "flashcards": 10},
         {"max_tokens": 2000, "transcript_length": 1000, "flashcards": 8}
     ]
+    if chunk:
+        strategies = scale_strategies(strategies, len(transcript), 'flashcards', count or strategies[0]['flashcards'])
+    min_flashcards = min(3, strategies[0]['flashcards'])
+    target = strategies[0]['flashcards']
+    
+    # Valid flashcards survive a failed or truncated attempt; retries only ask for the rest
+    collected = []
+    seen = []
+    
+    def keep(card):
+        """Collect a valid, new flashcard, handing it to on_item as soon as it's accepted"""
+        if len(collected) >= target or not is_valid_flashcard(card) or is_near_duplicate(card['front'], seen):
+            return
+        collected.append(card)
+        seen.append(word_set(card['front']))
+        if on_item:
+            on_item(card)
     
-    for strategy in strategies:
+    for index, strategy in enumerate(strategies):
+        if index:
+            STRATEGY_FALLBACKS.inc(generator='flashcards')
+        missing = min(strategy['flashcards'], target - len(collected))
         try:
+            user_content = f"{prompt}\n\nTranscript content to analyze:\n{transcript[:strategy['transcript_length']]}"
+            if collected:
+                user_content += "\n\nThese flashcards were already written, do not repeat them:\n" + "\n".join(
+                    f"- {card['front']}" for card in collected
+                )
+            
             data = {
                 "messages": [
                     {
                         "role": "system",
-                        "content": f"""You are an expert educator creating study flashcards based on transcript content. Your goal is to create {strategy['flashcards']} high-quality flashcards that help students learn the material presented.
+                        "content": f"""You are an expert educator creating study flashcards based on transcript content. Your goal is to create {missing} high-quality flashcards that help students learn the material presented.
 
 IMPORTANT GUIDELINES:
 1. Focus on the actual content of the transcript
@@ -440,7 +1512,7 @@ Return ONLY valid JSON format with no extra text."""
                     },
                     {
                         "role": "user",
-                        "content": f"{prompt}\n\nTranscript content to analyze:\n{transcript[:strategy['transcript_length']]}"
+                        "content": user_content
                     }
                 ],
                 "model": "llama3-70b-8192",
@@ -448,54 +1520,52 @@ Return ONLY valid JSON format with no extra text."""
                 "max_tokens": strategy["max_tokens"]
             }
             
-            response = requests.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=60
-            )
+            # Streamed flashcards are validated and kept one by one as they close
+            parser = ItemStream('flashcards')
             
-            if response.status_code != 200:
+            def on_text(text):
+                for card in parser.feed(text):
+                    keep(card)
+            
+            result = call_groq(data, 'flashcards', fresh, on_text if on_item else None)
+            if result is None:
                 continue
             
-            result = response.json()
+            if usage and not result.get('memoized'):
+                usage.add(result.get('usage'))
             content = result["choices"][0]["message"]["content"].strip()
             
-            print(f"Flashcard Strategy: {strategy}")
+            print(f"Flashcard Strategy: {strategy} (asked for {missing})")
             print(f"Raw response length: {len(content)}")
             print(f"Finish reason: {result.get('choices', [{}])[0].get('finish_reason')}")
             
-            # Clean the response
-            content = clean_json_response(content)
+            # Keep every complete, valid flashcard, even from a truncated response
+            # (already-streamed ones are rejected as duplicates)
+            items = parse_items(clean_json_response(content), 'flashcards')
+            for card in items:
+                keep(card)
+            valid = sum(1 for card in items if is_valid_flashcard(card))
+            remember_groq_response(data, result, valid >= min(missing, min_flashcards))
             
-            # Try to parse
-            try:
-                flashcard_data = json.loads(content)
-                
-                # Validate structure
-                if validate_flashcard_structure(flashcard_data) and len(flashcard_data.get('flashcards', [])) >= 3:
-                    return flashcard_data
-                else:
-                    print(f"Invalid flashcard structure or insufficient flashcards ({len(flashcard_data.get('flashcards', []))}), trying next strategy")
-                    continue
-                    
-            except json.JSONDecodeError as e:
-                print(f"Flashcard JSON parse error: {e}")
-                fixed_content = fix_json_issues(content)
-                if fixed_content:
-                    try:
-                        flashcard_data = json.loads(fixed_content)
-                        if validate_flashcard_structure(flashcard_data) and len(flashcard_data.get('flashcards', [])) >= 3:
-                            return flashcard_data
-                    except:
-                        pass
-                continue
+            if len(collected) >= min_flashcards:
+                GROQ_ATTEMPTS.inc(generator='flashcards', outcome='ok')
+                return {"flashcards": collected[:target]}
+            GROQ_ATTEMPTS.inc(generator='flashcards', outcome='too_few')
+            print(f"Only {len(collected)} valid flashcards so far, asking for the rest")
                 
+        except JobCancelled:
+            raise
         except Exception as e:
             print(f"Flashcard Strategy failed: {e}")
+            GROQ_ATTEMPTS.inc(generator='flashcards', outcome='exception')
             continue
     
+    # A few real flashcards beat the generic fallback
+    if collected:
+        return {"flashcards": collected}
+    
     # Content-focused fallback flashcards
+    FALLBACK_CONTENT.inc(generator='flashcards')
     return {
         "flashcards": [
             {
@@ -537,25 +1607,26 @@ def validate_flashcard_structure(flashcard_data):
         if not isinstance(flashcards, list) or len(flashcards) == 0:
             return False
         
-        for card in flashcards:
-            if not isinstance(card, dict):
-                return False
-            
-            required_keys = ['front', 'back']
-            if not all(key in card for key in required_keys):
-                return False
-            
-            if not isinstance(card['front'], str) or not isinstance(card['back'], str):
-                return False
-            
-            if len(card['front'].strip()) == 0 or len(card['back'].strip()) == 0:
-                return False
-        
-        return True
+        return all(is_valid_flashcard(card) for card in flashcards)
     except:
         return False
 
 
+def is_valid_flashcard(card):
+    """Validate a single flashcard"""
+    if not isinstance(card, dict):
+        return False
+    
+    required_keys = ['front', 'back']
+    if not all(key in card for key in required_keys):
+        return False
+    
+    if not isinstance(card['front'], str) or not isinstance(card['back'], str):
+        return False
+    
+    return len(card['front'].strip()) > 0 and len(card['back'].strip()) > 0
+
+
 def clean_json_response(content):
     """Clean the JSON response from common formatting issues"""
     # Remove markdown code blocks
@@ -577,36 +1648,138 @@ def clean_json_response(content):
     return content
 
 
-def fix_json_issues(content):
-    """Try to fix common JSON truncation issues"""
+def parse_items(content, items_key):
+    """Pull every complete item out of a (possibly truncated) JSON response.
+
+    The whole document is parsed first. If the model was cut off part-way, the
+    items array is decoded one object at a time instead, so everything that
+    closed before the cut is kept and only the unfinished tail is lost.
+    """
     try:
-        # Count braces to see if we're missing closing ones
-        open_braces = content.count('{')
-        close_braces = content.count('}')
-        open_brackets = content.count('[')
-        close_brackets = content.count(']')
-        
-        # If we're missing closing braces/brackets, try to add them
-        if open_braces > close_braces:
-            # Try to complete the JSON structure
-            missing_braces = open_braces - close_braces
-            
-            # If it looks like we're in the middle of a string, close it
-            if content.count('"') % 2 == 1:
-                content += '"'
-            
-            # Add missing closing brackets first
-            if open_brackets > close_brackets:
-                content += ']' * (open_brackets - close_brackets)
-            
-            # Add missing closing braces
-            content += '}' * missing_braces
-            
-            return content
-    except:
-        pass
+        data = json.loads(content)
+        items = data.get(items_key) if isinstance(data, dict) else None
+        if isinstance(items, list):
+            return items
+    except json.JSONDecodeError as e:
+        print(f"JSON parse error, recovering complete {items_key}: {e}")
     
-    return None
+    match = re.search(r'"%s"\s*:\s*\[' % re.escape(items_key), content)
+    if not match:
+        return []
+    
+    decoder = json.JSONDecoder()
+    items = []
+    pos = match.end()
+    with timed('json_repair'):
+        while True:
+            while pos < len(content) and content[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(content) or content[pos] == ']':
+                break
+            try:
+                item, pos = decoder.raw_decode(content, pos)
+            except json.JSONDecodeError:
+                # The truncated tail
+                break
+            items.append(item)
+    JSON_REPAIRS.inc(items_key=items_key)
+    return items
+
+
+class ItemStream:
+    """Incremental parser that yields each object of a JSON items array as soon as it closes.
+
+    Text is fed in as it streams from the model. Once the ``"<items_key>": [``
+    opening has arrived, the array is scanned for balanced braces (skipping over
+    strings), and every closed object is decoded and returned by the ``feed`` call
+    that completed it. Objects that don't decode are skipped, as in parse_items.
+    """
+
+    def __init__(self, items_key):
+        self.opening = re.compile(r'"%s"\s*:\s*\[' % re.escape(items_key))
+        self.buffer = ''
+        self.pos = None
+        self.start = None
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.done = False
+
+    def feed(self, text):
+        """Add streamed text; returns the items it completed"""
+        self.buffer += text
+        if self.pos is None:
+            match = self.opening.search(self.buffer)
+            if not match:
+                return []
+            self.pos = match.end()
+
+        items = []
+        buffer = self.buffer
+        while self.pos < len(buffer) and not self.done:
+            char = buffer[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                if self.depth == 0:
+                    self.start = self.pos
+                self.depth += 1
+            elif char in '}]':
+                if self.depth == 0:
+                    # The items array itself closed
+                    self.done = True
+                else:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        try:
+                            items.append(json.loads(buffer[self.start:self.pos + 1]))
+                        except json.JSONDecodeError:
+                            pass
+            self.pos += 1
+        return items
+
+
+def read_groq_stream(response, on_text):
+    """Consume a streamed (server-sent events) chat completion, passing each text delta to on_text.
+
+    Returns the same shape as a non-streamed response: the full message content,
+    the finish reason and the token usage Groq reports in the final event.
+    """
+    # SSE is UTF-8; without this requests would guess and mangle non-Latin text
+    response.encoding = 'utf-8'
+    parts = []
+    finish_reason = None
+    usage = None
+
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith('data:'):
+            continue
+        payload = line[5:].strip()
+        if payload == '[DONE]':
+            break
+        event = json.loads(payload)
+        usage = (event.get('x_groq') or {}).get('usage') or event.get('usage') or usage
+        for choice in event.get('choices') or []:
+            text = (choice.get('delta') or {}).get('content')
+            if text:
+                parts.append(text)
+                on_text(text)
+            finish_reason = choice.get('finish_reason') or finish_reason
+
+    return {
+        'choices': [{
+            'message': {'role': 'assistant', 'content': ''.join(parts)},
+            'finish_reason': finish_reason
+        }],
+        'usage': usage or {}
+    }
 
 
 def validate_mcq_structure(mcq_data):
@@ -619,54 +1792,468 @@ def validate_mcq_structure(mcq_data):
         if not isinstance(questions, list) or len(questions) == 0:
             return False
         
-        for q in questions:
-            if not isinstance(q, dict):
-                return False
-            
-            required_keys = ['question', 'options', 'correct_answer']
-            if not all(key in q for key in required_keys):
-                return False
-            
-            if not isinstance(q['options'], list) or len(q['options']) != 4:
-                return False
-            
-            if q['correct_answer'] not in ['A', 'B', 'C', 'D']:
-                return False
-        
-        return True
+        return all(is_valid_mcq(q) for q in questions)
     except:
         return False
 
 
-def process_transcription(youtube_url, job_id, language_code=None):
+def is_valid_mcq(q):
+    """Validate a single MCQ"""
+    if not isinstance(q, dict):
+        return False
+    
+    required_keys = ['question', 'options', 'correct_answer']
+    if not all(key in q for key in required_keys):
+        return False
+    
+    if not isinstance(q['question'], str) or not isinstance(q['options'], list) or len(q['options']) != 4:
+        return False
+    
+    return q['correct_answer'] in ['A', 'B', 'C', 'D']
+
+
+def process_transcription(youtube_url, job_id, language_code=None, regenerate=False):
     """Background task to process transcription"""
+    video_id = extract_video_id(youtube_url)
+
+    # A redelivered task whose audio was already submitted goes back to waiting on
+    # that transcript instead of downloading, uploading and paying for it again
+    job = job_store.get(job_id) or {}
+    if job.get('transcript_id'):
+        if job.get('status') in ('submitting', 'processing'):
+            # A check may already be queued too; dispatch_transcription_result lets only one continue
+            job_store.update(job_id, status='processing')
+            schedule_transcription_check(job_id, 0)
+        return
+
+    # A cached transcript means we can skip straight to content generation
+    if video_id:
+        transcript_info = result_cache.get(video_id, language_code, 'transcript')
+        if transcript_info:
+            try:
+                generate_content(job_id, transcript_info, video_id, language_code, regenerate)
+            except Exception as e:
+                finish_job(job_id, {
+                    'status': 'error',
+                    'error': str(e)
+                })
+            return
+
     # Create a temporary file that will be automatically deleted when closed
     # or when the program exits.
     temp_audio_file = tempfile.NamedTemporaryFile(suffix=".mp3", delete=True)
     
     try:
-        transcription_results[job_id] = {'status': 'downloading'}
-        download_audio(youtube_url, temp_audio_file.name)
+        set_stage(job_id, 'fetching_captions')
+        info = recall_probe(youtube_url)
+        if info is None:
+            try:
+                with timed('probe'):
+                    info = probe_video(youtube_url)
+            except Exception as e:
+                print(f"Metadata probe failed: {e}")
+            if info:
+                job_store.update(job_id, video=probe_summary(info, language_code))
+        
+        # Captions fast path: no audio download and no AssemblyAI call at all
+        transcript_info = None
+        if CAPTIONS_FIRST and info:
+            try:
+                with timed('captions'):
+                    transcript_info = fetch_captions(info, language_code)
+            except Exception as e:
+                print(f"Caption fetch failed, falling back to audio: {e}")
+        if transcript_info:
+            if video_id:
+                result_cache.put(video_id, language_code, 'transcript', transcript_info)
+            generate_content(job_id, transcript_info, video_id, language_code, regenerate)
+            return
+        
+        # Refuse oversized videos before any audio is fetched
+        limit_error = video_limit_error(info) if info else None
+        if limit_error:
+            finish_job(job_id, {'status': 'error', 'error': limit_error})
+            return
+        
+        set_stage(job_id, 'downloading')
+        section = audio_section(info)
+        audio_url = None
+        # A raw stream can't be cut at a timestamp, so sections go through yt-dlp
+        if AUDIO_STREAMING and info and not section:
+            try:
+                with stage_limits.stage('download'):
+                    audio_url = stream_to_assemblyai(info, ASSEMBLYAI_API_KEY, job_id)
+            except JobCancelled:
+                raise
+            except Exception as e:
+                print(f"Streaming upload failed, falling back to download + transcode: {e}")
         
-        transcription_results[job_id] = {'status': 'uploading'}
-        audio_url = upload_to_assemblyai(temp_audio_file.name, ASSEMBLYAI_API_KEY)
+        if audio_url is None:
+            with stage_limits.stage('download'):
+                download_audio(youtube_url, temp_audio_file.name, section, job_id)
+            
+            set_stage(job_id, 'uploading')
+            audio_url = upload_to_assemblyai(temp_audio_file.name, ASSEMBLYAI_API_KEY)
+        
+        set_stage(job_id, 'submitting')
+        webhook_url = assemblyai_webhook_url(job_id)
+        transcript_id = submit_transcription(audio_url, ASSEMBLYAI_API_KEY, language_code, webhook_url)
+        # Recorded first, so however the job ends from here its transcript can be deleted,
+        # and a redelivered task can pick the wait up again without submitting twice
+        job_store.update(
+            job_id,
+            transcript_id=transcript_id,
+            video_id=video_id,
+            language_code=language_code,
+            regenerate=regenerate,
+            submitted_at=time.time()
+        )
         
-        transcription_results[job_id] = {'status': 'submitting'}
-        transcript_id = submit_transcription(audio_url, ASSEMBLYAI_API_KEY, language_code)
+        # Free this worker; the webhook or a status check picks the job up again. With
+        # the SQLite queue every mode waits this way: the checks are queued tasks, so a
+        # worker restart doesn't lose the job the way a blocking or event-loop poll would.
+        if webhook_url or JOB_QUEUE == 'sqlite':
+            set_stage(job_id, 'processing')
+            schedule_transcription_check(job_id, poll_delay(0, fallback=bool(webhook_url)))
+            return
         
-        transcription_results[job_id] = {'status': 'processing'}
-        poll_transcription(transcript_id, ASSEMBLYAI_API_KEY, job_id)
+        set_stage(job_id, 'processing')
+        if async_runtime:
+            # Free this worker; the event loop polls and hands the transcript back
+            async_runtime.spawn(
+                poll_transcription_async, transcript_id, ASSEMBLYAI_API_KEY, job_id, video_id, language_code, regenerate
+            )
+            return
+        poll_transcription(transcript_id, ASSEMBLYAI_API_KEY, job_id, video_id, language_code, regenerate)
         
     except Exception as e:
-        transcription_results[job_id] = {
+        finish_job(job_id, {
             'status': 'error',
             'error': str(e)
-        }
+        })
     finally:
         # Ensure the temporary file is closed and deleted
         temp_audio_file.close()
 
 
+def cached_result(video_id, language_code):
+    """Return a completed result if transcript, MCQs and flashcards are all cached.
+
+    Only a full hit is counted in the cache stats; otherwise the worker's own
+    lookups record what was and wasn't cached, so each submission counts once.
+    """
+    transcript_info = result_cache.get(video_id, language_code, 'transcript', count=False)
+    if not transcript_info:
+        return None
+    mcq_data = result_cache.get(video_id, language_code, 'mcqs', count=False)
+    flashcard_data = result_cache.get(video_id, language_code, 'flashcards', count=False)
+    if mcq_data is None or flashcard_data is None:
+        return None
+    result_cache.count_hits('transcript', 'mcqs', 'flashcards')
+    return build_completed_result(transcript_info, mcq_data, flashcard_data)
+
+
+class VideoRejected(Exception):
+    """The probe found the video over this deployment's duration or size limits"""
+
+    def __init__(self, message, video):
+        super().__init__(message)
+        self.video = video
+
+
+def start_job(youtube_url, language_code=None, job_id=None, regenerate=False, probe=False):
+    """Create a job and queue it on the worker pool, or answer it from the cache.
+
+    Returns the fields the client is sent: job_id plus either cached, or
+    queue_position and video. A request for a video that's already in flight is
+    attached to that job (coalesced) instead. With probe the video's metadata is
+    read first and ``video`` summarises it (duration, captions, ETA); oversized
+    videos raise VideoRejected. Raises QueueFull when the pool's wait queue has no
+    room. With regenerate the questions are generated afresh instead of coming
+    from any cache.
+    """
+    job_id = job_id or str(uuid.uuid4())
+    
+    # Fully cached video: answer immediately without starting the pipeline
+    video_id = extract_video_id(youtube_url)
+    if video_id and not regenerate:
+        cached = cached_result(video_id, language_code)
+        if cached:
+            job_store.set(job_id, cached)
+            return {'job_id': job_id, 'cached': True}
+    
+    # Record the job before the probe and the worker so the first /status poll (and
+    # any identical request) finds it. Same video already in flight: this job ID
+    # becomes an alias of that job instead
+    flight = f"{video_id or youtube_url.strip()}:{language_code or ''}" if SINGLE_FLIGHT and not regenerate else None
+    owner = job_store.create(job_id, {'status': 'queued', 'read_at': time.time()}, flight)
+    if owner:
+        JOBS_COALESCED.inc()
+        return {
+            'job_id': job_id,
+            'queue_position': scheduler.position(owner),
+            'video': (job_store.get(owner) or {}).get('video'),
+            'coalesced': True
+        }
+    
+    video = None
+    try:
+        if probe:
+            try:
+                with timed('probe'):
+                    info = probe_video(youtube_url)
+            except Exception as e:
+                # Not fatal here: the worker probes again and reports the error itself
+                print(f"Metadata probe failed: {e}")
+                info = None
+            if info:
+                video = probe_summary(info, language_code)
+                job_store.update(job_id, video=video)
+                limit_error = video_limit_error(info)
+                if limit_error:
+                    raise VideoRejected(limit_error, video)
+                remember_probe(youtube_url, info)
+        
+        position = scheduler.submit(
+            job_id, job_timings.wrap(process_transcription, job_id), youtube_url, job_id, language_code, regenerate
+        )
+    except VideoRejected as e:
+        # Requests that attached in the meantime see why the job never ran
+        finish_job(job_id, {'status': 'error', 'error': str(e)})
+        raise
+    except QueueFull as e:
+        # The job never started, so it isn't counted as finished. Ending it first stops
+        # more requests attaching; it's only kept for those that already did, so a batch
+        # child retried later doesn't carry an error in the meantime
+        job_store.set(job_id, {'status': 'error', 'error': str(e)})
+        if not job_store.followers(job_id):
+            job_store.delete(job_id)
+        raise
+    return {'job_id': job_id, 'queue_position': position, 'video': video}
+
+
+def touch_live_jobs():
+    """Keep jobs fresh in the job store while they wait for a worker or run here"""
+    try:
+        job_store.touch(set(scheduler.waiting()) | set(job_timings.running()))
+    except Exception as e:
+        print(f"Refreshing live jobs failed: {e}")
+    timers.schedule(JOB_TOUCH_SECONDS, touch_live_jobs)
+
+
+timers.schedule(JOB_TOUCH_SECONDS, touch_live_jobs)
+
+
+def publish_metrics():
+    """Share this process's metrics and stage slots with the others"""
+    try:
+        process_stats.publish(stages=stage_limits.stats())
+    except Exception as e:
+        print(f"Publishing metrics failed: {e}")
+    timers.schedule(METRICS_PUBLISH_SECONDS, publish_metrics)
+
+
+timers.schedule(METRICS_PUBLISH_SECONDS, publish_metrics)
+
+
+def stage_stats():
+    """Stage slots in use and waiting, summed over every live process"""
+    stats = stage_limits.stats()
+    for snapshot in process_stats.others(max_age=3 * METRICS_PUBLISH_SECONDS):
+        for stage, counts in snapshot['live'].get('stages', {}).items():
+            totals = stats.setdefault(stage, {'limit': 0, 'in_use': 0, 'waiting': 0})
+            for key in totals:
+                totals[key] += counts.get(key, 0)
+    return stats
+
+
+def resolve_job(job_id):
+    """A job's ID and record, following an alias to the job it was coalesced into"""
+    job = job_store.get(job_id)
+    if job and job.get('alias_of'):
+        return job['alias_of'], job_store.get(job['alias_of'])
+    return job_id, job
+
+
+def stop_job(job_id, reason):
+    """Cancel a job's pipeline work, wherever it's running.
+
+    The flag goes into the job store, so the worker (possibly another process) stops
+    at its next check and ends the job itself. A job that's only waiting, in the
+    queue or for an AssemblyAI webhook, has nothing left to notice it and is ended here.
+    """
+    stage = (job_store.get(job_id) or {}).get('status')
+    job_store.update(job_id, status='cancelled', cancelled_at=time.time(), cancel_reason=reason)
+    cancel_tokens.cancel(job_id)
+    JOBS_CANCELLED.inc(reason=reason, outcome='stopped', stage=stage)
+    
+    idle = scheduler.remove(job_id)
+    if idle:
+        # Either the job itself or its next queued transcript check
+        CANCEL_RECLAIMED.inc(work='queued_job' if stage == 'queued' else 'transcription_poll')
+    elif stage == 'processing' and assemblyai_webhook_url(job_id):
+        idle = True
+    if idle:
+        finish_job(job_id, {'status': 'cancelled'})
+
+
+def cancel_job(job_id, reason='client'):
+    """Cancel the job a client is following.
+
+    A job that other requests were coalesced onto keeps running while any of them
+    still wants it, and only this caller is detached. Returns 'cancelled',
+    'detached', the status of a job that had already finished, or None if unknown.
+    """
+    job = job_store.get(job_id)
+    if not job:
+        return None
+    owner_id = job.get('alias_of') or job_id
+    owner = job_store.get(owner_id) if owner_id != job_id else job
+    if not owner:
+        return None
+    if owner['status'] in TERMINAL_STATUSES or owner.get('cancelled_at'):
+        return 'cancelled' if owner.get('cancelled_at') else owner['status']
+    if job.get('detached_at'):
+        return 'detached'
+    
+    if owner_id != job_id:
+        # The alias ends here, whatever becomes of the job it was following
+        job_store.set(job_id, {'status': 'cancelled', 'error': 'Job was cancelled', 'cancel_reason': reason})
+    # Counted from the job store, so callers attached through other web processes count too
+    remaining = len(job_store.followers(owner_id))
+    if owner_id != job_id and not owner.get('detached_at'):
+        remaining += 1
+    if remaining:
+        if owner_id == job_id:
+            job_store.update(job_id, detached_at=time.time())
+        JOBS_CANCELLED.inc(reason=reason, outcome='detached', stage=owner['status'])
+        return 'detached'
+    
+    stop_job(owner_id, reason)
+    return 'cancelled'
+
+
+# Last status read noted per job, so polling clients cost at most one write per READ_NOTE_SECONDS
+_job_reads = OrderedDict()
+_job_reads_lock = threading.Lock()
+
+
+def note_read(job_id):
+    """Record that the job's client is still reading its status"""
+    now = time.time()
+    with _job_reads_lock:
+        if now - _job_reads.get(job_id, 0) < READ_NOTE_SECONDS:
+            return
+        _job_reads[job_id] = now
+        _job_reads.move_to_end(job_id)
+        while len(_job_reads) > 10000:
+            _job_reads.popitem(last=False)
+    job_store.update(job_id, read_at=now)
+
+
+def watch_abandonment(job_id):
+    """Cancel a client's job once its status hasn't been read for ABANDON_AFTER seconds"""
+    job = job_store.get(job_id)
+    if not job or job.get('detached_at'):
+        return
+    followed = job_store.get(job['alias_of']) if job.get('alias_of') else job
+    if not followed or followed['status'] in TERMINAL_STATUSES or followed.get('cancelled_at'):
+        return
+    
+    idle = time.time() - job.get('read_at', 0)
+    if idle < ABANDON_AFTER:
+        timers.schedule(ABANDON_CHECK_SECONDS, watch_abandonment, job_id)
+        return
+    print(f"Job {job_id} abandoned: status not read for {idle:.0f}s")
+    cancel_job(job_id, 'abandoned')
+
+
+def expand_playlist(playlist_url):
+    """List the video URLs of a playlist without downloading anything"""
+    import yt_dlp
+    
+    ydl_opts = dict(YDL_BASE_OPTS, extract_flat='in_playlist')
+    
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(playlist_url, download=False)
+    
+    urls = []
+    for entry in (info or {}).get('entries') or []:
+        if not entry:
+            continue
+        video_id = entry.get('id')
+        if video_id and extract_video_id(video_id):
+            urls.append(f'https://www.youtube.com/watch?v={video_id}')
+        elif entry.get('url'):
+            urls.append(entry['url'])
+    return urls
+
+
+def start_batch(batch_id, urls, playlist_url=None, language_code=None, regenerate=False):
+    """Expand the playlist (if any), create the child jobs and start feeding them"""
+    if playlist_url:
+        try:
+            urls = list(urls) + expand_playlist(playlist_url)
+        except Exception as e:
+            job_store.set(batch_id, {'status': 'error', 'type': 'batch', 'error': f"Playlist expansion failed: {e}"})
+            return
+    
+    urls = urls[:MAX_BATCH_SIZE]
+    if not urls:
+        job_store.set(batch_id, {'status': 'error', 'type': 'batch', 'error': 'No videos found'})
+        return
+    
+    # Child jobs are only written to the store when they start, so a long batch
+    # can't leave not-yet-started children looking stale
+    children = [{'job_id': str(uuid.uuid4()), 'url': url} for url in urls]
+    
+    job_store.set(batch_id, {
+        'status': 'running',
+        'type': 'batch',
+        'language_code': language_code,
+        'regenerate': regenerate,
+        'children': children,
+        'next_child': 0
+    })
+    advance_batch(batch_id)
+
+
+def advance_batch(batch_id):
+    """Feed a batch's children into the shared worker pool a few at a time.
+
+    A new child starts only while fewer than BATCH_DOWNLOAD_SLOTS children are still
+    fetching media, so video N+1 downloads while N transcribes and N-1 generates,
+    and one big playlist can't fill the whole queue ahead of other users.
+    """
+    batch = job_store.get(batch_id)
+    if not batch or batch.get('status') != 'running':
+        return
+    
+    children = batch['children']
+    next_child = batch['next_child']
+    statuses = [(resolve_job(child['job_id'])[1] or {}).get('status') for child in children[:next_child]]
+    fetching = sum(1 for status in statuses if status in INGEST_STATUSES)
+    # A child that has vanished from the store (expired) no longer counts as active
+    active = sum(1 for status in statuses if status and status not in TERMINAL_STATUSES)
+    
+    while next_child < len(children) and fetching < BATCH_DOWNLOAD_SLOTS and active < BATCH_MAX_ACTIVE:
+        child = children[next_child]
+        try:
+            start_job(child['url'], batch.get('language_code'), child['job_id'], batch.get('regenerate', False))
+        except QueueFull:
+            break
+        next_child += 1
+        fetching += 1
+        active += 1
+    
+    if next_child == len(children) and active == 0:
+        job_store.update(batch_id, next_child=next_child, status='completed')
+        return
+    
+    job_store.update(batch_id, next_child=next_child)
+    timers.schedule(BATCH_TICK_SECONDS, advance_batch, batch_id)
+
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -677,25 +2264,444 @@ def transcribe():
     data = request.get_json()
     youtube_url = data.get('url')
     language_code = data.get('language')  # Optional language selection
+    regenerate = bool(data.get('regenerate'))  # Skip every cache and ask Groq again
     
     if not youtube_url:
         return jsonify({'error': 'YouTube URL is required'}), 400
     
-    # Generate unique job ID
-    job_id = str(uuid.uuid4())
+    # Hand the job to the worker pool, refusing it if the video is over the limits
+    # or the wait queue is full
+    try:
+        job = start_job(youtube_url, language_code, regenerate=regenerate, probe=PROBE_ON_SUBMIT)
+    except VideoRejected as e:
+        return jsonify({'error': str(e), 'video': e.video}), 413
+    except QueueFull:
+        return busy_response()
+    
+    if ABANDON_AFTER and not job.get('cached'):
+        timers.schedule(ABANDON_CHECK_SECONDS, watch_abandonment, job['job_id'])
+    return jsonify(job)
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    """Stop a job the client no longer wants (also sent by the page when it's closed)"""
+    outcome = cancel_job(job_id)
+    if outcome is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if outcome in ('completed', 'error'):
+        return jsonify({'error': 'Job already finished', 'status': outcome}), 409
+    return jsonify({'job_id': job_id, 'status': outcome})
+
+
+def busy_response():
+    response = jsonify({
+        'error': 'The server is busy right now. Please try again in a minute.',
+        'queue_length': scheduler.stats()['queued']
+    })
+    response.headers['Retry-After'] = '30'
+    return response, 429
+
+
+@app.route('/batch', methods=['POST'])
+def create_batch():
+    data = request.get_json() or {}
+    urls = [url for url in data.get('urls') or [] if isinstance(url, str) and url.strip()]
+    playlist_url = data.get('playlist')
+    language_code = data.get('language')
+    regenerate = bool(data.get('regenerate'))
+    
+    if not urls and not playlist_url:
+        return jsonify({'error': 'A list of YouTube URLs or a playlist URL is required'}), 400
+    if len(urls) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'A batch can have at most {MAX_BATCH_SIZE} videos'}), 400
+    
+    batch_id = str(uuid.uuid4())
+    job_store.set(batch_id, {'status': 'expanding', 'type': 'batch'})
+    try:
+        scheduler.submit(batch_id, start_batch, batch_id, urls, playlist_url, language_code, regenerate)
+    except QueueFull:
+        job_store.delete(batch_id)
+        return busy_response()
+    
+    return jsonify({'batch_id': batch_id})
+
+
+@app.route('/batch/<batch_id>')
+def batch_status(batch_id):
+    batch = job_store.get(batch_id)
+    if not batch or batch.get('type') != 'batch':
+        return jsonify({'error': 'Batch not found'}), 404
+    
+    children = []
+    by_status = {}
+    for index, child in enumerate(batch.get('children', [])):
+        if index < batch.get('next_child', 0):
+            summary = status_payload(child['job_id'])
+        else:
+            summary = {'status': 'pending'}
+        by_status[summary['status']] = by_status.get(summary['status'], 0) + 1
+        children.append({
+            'job_id': child['job_id'],
+            'url': child['url'],
+            'status': summary['status'],
+            'error': summary.get('error'),
+            'mcq_count': summary.get('mcq_count'),
+            'flashcard_count': summary.get('flashcard_count')
+        })
+    
+    total = len(children)
+    finished = sum(by_status.get(status, 0) for status in TERMINAL_STATUSES)
+    return jsonify({
+        'batch_id': batch_id,
+        'status': batch['status'],
+        'error': batch.get('error'),
+        'total': total,
+        'completed': by_status.get('completed', 0),
+        'failed': by_status.get('error', 0),
+        'cancelled': by_status.get('cancelled', 0),
+        'progress': round(100 * finished / total) if total else 0,
+        'by_status': by_status,
+        'children': children
+    })
+
+
+def batch_bank(batch_id, field, text_key):
+    """Combined, de-duplicated MCQs or flashcards from every finished video in a batch"""
+    batch = job_store.get(batch_id)
+    if not batch or batch.get('type') != 'batch':
+        return jsonify({'error': 'Batch not found'}), 404
+    
+    bank, seen = [], []
+    for child in batch.get('children', []):
+        job = resolve_job(child['job_id'])[1] or {}
+        for item in job.get(field) or []:
+            if is_near_duplicate(item.get(text_key, ''), seen):
+                continue
+            seen.append(word_set(item.get(text_key, '')))
+            bank.append(dict(item, source_url=child['url'], job_id=child['job_id']))
+    
+    return jsonify(paginate(bank, default_limit=100, max_limit=500))
+
+
+@app.route('/batch/<batch_id>/mcqs')
+def batch_mcqs(batch_id):
+    return batch_bank(batch_id, 'mcqs', 'question')
+
+
+@app.route('/batch/<batch_id>/flashcards')
+def batch_flashcards(batch_id):
+    return batch_bank(batch_id, 'flashcards', 'front')
+
+
+# Small fields served by /status; MCQs, flashcards and transcript have their own endpoints
+STATUS_FIELDS = (
+    'status', 'error', 'language_detected', 'language_confidence', 'audio_duration',
+    'mcq_error', 'flashcard_error', 'transcript_source', 'generation_stats', 'stage_timings', 'video'
+)
+
+
+def status_payload(job_id):
+    """Current job state as served to the browser: state and lightweight metadata only"""
+    client_id = job_id
+    job_id, job = resolve_job(job_id)
+    job = job or {'status': 'not_found'}
+    result = {key: job[key] for key in STATUS_FIELDS if key in job}
+    if job.get('cancelled_at') or (client_id == job_id and job.get('detached_at')):
+        # Flagged (the pipeline may not have reached its next check yet), or still
+        # running only for requests coalesced onto it after this client left
+        result['status'] = 'cancelled'
+    if ABANDON_AFTER and result['status'] not in TERMINAL_STATUSES + ('not_found',):
+        note_read(client_id)
+    if 'mcqs' in job:
+        result['mcq_count'] = len(job['mcqs'])
+    if 'flashcards' in job:
+        result['flashcard_count'] = len(job['flashcards'])
+    if 'transcript' in job:
+        result['transcript_chars'] = len(job['transcript'])
+    if result['status'] == 'queued':
+        result['queue_position'] = scheduler.position(job_id)
+    return result
+
+
+def paginate(items, default_limit=50, max_limit=200):
+    """Slice a result list by ?offset=&limit= and trim items to ?fields=a,b"""
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = min(max_limit, max(1, request.args.get('limit', default_limit, type=int)))
+    page = items[offset:offset + limit]
+    
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    if fields:
+        page = [{key: item[key] for key in fields if key in item} for item in page]
+    
+    return {
+        'items': page,
+        'total': len(items),
+        'offset': offset,
+        'limit': limit,
+        'next_offset': offset + limit if offset + limit < len(items) else None
+    }
+
+
+def job_result_field(job_id, field):
+    """Fetch one result field of a job, or an error response if it isn't available"""
+    _, job = resolve_job(job_id)
+    if not job:
+        return None, (jsonify({'error': 'Job not found'}), 404)
+    if field not in job:
+        return None, (jsonify({'error': f'{field} not ready yet', 'status': job['status']}), 409)
+    return job[field], None
+
+
+@app.route('/jobs/<job_id>/mcqs')
+def job_mcqs(job_id):
+    mcqs, error = job_result_field(job_id, 'mcqs')
+    if error:
+        return error
+    return jsonify(paginate(mcqs))
+
+
+@app.route('/jobs/<job_id>/flashcards')
+def job_flashcards(job_id):
+    flashcards, error = job_result_field(job_id, 'flashcards')
+    if error:
+        return error
+    return jsonify(paginate(flashcards))
+
+
+@app.route('/jobs/<job_id>/transcript')
+def job_transcript(job_id):
+    transcript, error = job_result_field(job_id, 'transcript')
+    if error:
+        return error
+    
+    # Paged by characters
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = min(100000, max(1, request.args.get('limit', 20000, type=int)))
+    return jsonify({
+        'text': transcript[offset:offset + limit],
+        'total_chars': len(transcript),
+        'offset': offset,
+        'limit': limit,
+        'next_offset': offset + limit if offset + limit < len(transcript) else None
+    })
+
+
+@app.after_request
+def compress_response(response):
+    """Brotli/gzip-compress larger JSON responses for clients that accept it"""
+    if (response.direct_passthrough or response.status_code != 200
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
     
-    # Start background transcription process
-    thread = threading.Thread(target=process_transcription, args=(youtube_url, job_id, language_code))
-    thread.daemon = True
-    thread.start()
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    
+    accepted = request.headers.get('Accept-Encoding', '').lower()
+    if brotli and 'br' in accepted:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif 'gzip' in accepted:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
     
-    return jsonify({'job_id': job_id})
+    response.vary.add('Accept-Encoding')
+    # The body differs per encoding now, so the ETag can only be a weak one
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
 
 
 @app.route('/status/<job_id>')
 def status(job_id):
-    result = transcription_results.get(job_id, {'status': 'not_found'})
-    return jsonify(result)
+    response = jsonify(status_payload(job_id))
+    # Unchanged polls get a bodyless 304
+    response.set_etag(hashlib.md5(response.get_data()).hexdigest())
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+@app.route('/events/<job_id>')
+def events(job_id):
+    """Server-sent events: one message per stage transition, then the final payload"""
+    # Keep threads free for /transcribe and /status; the page falls back to polling
+    if not _sse_slots.acquire(blocking=False):
+        response = jsonify({'error': 'Too many open event streams; poll /status instead'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    def stream():
+        last_signature = None
+        last_sent = time.time()
+        deadline = last_sent + SSE_MAX_SECONDS
+        
+        while time.time() < deadline:
+            result = status_payload(job_id)
+            # Only stage changes matter to the browser, not every internal write
+            signature = (
+                result['status'],
+                result.get('queue_position'),
+                result.get('mcq_count'),
+                result.get('flashcard_count')
+            )
+            if signature != last_signature:
+                last_signature = signature
+                last_sent = time.time()
+                yield f"data: {json.dumps(result)}\n\n"
+                if result['status'] in TERMINAL_STATUSES or result['status'] == 'not_found':
+                    return
+            elif time.time() - last_sent > 15:
+                # Comment line keeps proxies from closing an idle connection
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+            
+            job_store.wait_for_change(1)
+    
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.call_on_close(_sse_slots.release)
+    return response
+
+
+@app.route('/webhooks/assemblyai/<job_id>', methods=['POST'])
+def assemblyai_webhook(job_id):
+    secret = request.headers.get(WEBHOOK_SECRET_HEADER, '')
+    if not ASSEMBLYAI_WEBHOOK_SECRET or not hmac.compare_digest(secret, ASSEMBLYAI_WEBHOOK_SECRET):
+        return jsonify({'error': 'Invalid webhook secret'}), 401
+    
+    payload = request.get_json(silent=True) or {}
+    job = job_store.get(job_id)
+    if not job or job.get('transcript_id') != payload.get('transcript_id'):
+        return jsonify({'error': 'Unknown job'}), 404
+    if job.get('status') != 'processing':
+        return jsonify({'ok': True})
+    
+    try:
+        result = fetch_transcript(job['transcript_id'], ASSEMBLYAI_API_KEY)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 502
+    
+    if result['status'] in ('completed', 'error') and not dispatch_transcription_result(job_id, result):
+        # Non-2xx makes AssemblyAI retry the webhook; the fallback poll is still scheduled too
+        return jsonify({'error': 'Server busy'}), 503
+    return jsonify({'ok': True})
+
+
+@app.route('/bank/<kind>')
+def bank_search(kind):
+    """Browse the question bank by ?video_id=, ?topic=, ?difficulty= and ?language="""
+    if kind not in ('mcqs', 'flashcards'):
+        return jsonify({'error': 'Unknown kind'}), 404
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = min(200, max(1, request.args.get('limit', 50, type=int)))
+    total, items = question_bank.search(
+        kind,
+        video_id=request.args.get('video_id'),
+        topic=request.args.get('topic'),
+        difficulty=request.args.get('difficulty'),
+        language=request.args.get('language'),
+        limit=limit,
+        offset=offset
+    )
+    return jsonify({
+        'items': items,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'next_offset': offset + limit if offset + limit < total else None
+    })
+
+
+@app.route('/bank/stats')
+def bank_stats():
+    return jsonify(question_bank.stats())
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+
+@app.route('/groq/memo/stats')
+def groq_memo_stats():
+    return jsonify(groq_memo.stats())
+
+
+@app.route('/groq/budget/stats')
+def groq_budget_stats():
+    return jsonify(groq_budget.stats() if groq_budget else {'enabled': False})
+
+
+@app.route('/http/stats')
+def http_stats():
+    return jsonify({
+        'assemblyai': assemblyai_session.stats(),
+        'assemblyai_stream': assemblyai_stream_session.stats(),
+        'groq': groq_session.stats(),
+        'media': media_session.stats(),
+    })
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint"""
+    scheduler_stats = scheduler.stats()
+    SCHEDULER_JOBS.set(scheduler_stats['active'], state='active')
+    SCHEDULER_JOBS.set(scheduler_stats['queued'], state='queued')
+    for stage, stats in stage_stats().items():
+        STAGE_SLOTS.set(stats['in_use'], stage=stage, state='in_use')
+        STAGE_SLOTS.set(stats['waiting'], stage=stage, state='waiting')
+    if groq_budget:
+        budget = groq_budget.stats()
+        GROQ_BUDGET.set(budget['waiting'], state='waiting')
+        GROQ_BUDGET.set(budget['tokens_available'], state='tokens_available')
+        GROQ_BUDGET.set(budget['paused_for_s'], state='paused_seconds')
+    return Response(registry.render(process_stats.others()), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/jobs/stats')
+def job_stats():
+    stats = job_store.stats()
+    stats['scheduler'] = scheduler.stats()
+    stats['stages'] = stage_stats()
+    stats['timers'] = timers.stats()
+    stats['cancellation'] = cancel_tokens.stats()
+    stats['mode'] = PIPELINE_MODE
+    if async_runtime:
+        stats['async'] = async_runtime.stats()
+    return jsonify(stats)
+
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'ok': True})
+
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: the stores answer, the API keys are set and new jobs can be queued"""
+    checks = {}
+    try:
+        job_store.stats()
+        checks['job_store'] = 'ok'
+    except Exception as e:
+        checks['job_store'] = f'error: {e}'
+    try:
+        queue = scheduler.stats()
+        checks['queue'] = 'ok' if queue['queued'] < queue['max_queue'] else 'full'
+    except Exception as e:
+        checks['queue'] = f'error: {e}'
+    checks['api_keys'] = 'ok' if ASSEMBLYAI_API_KEY and GROQ_API_KEY else 'missing'
+    
+    ready = all(value == 'ok' for value in checks.values())
+    return jsonify({'ready': ready, 'checks': checks}), 200 if ready else 503
 
 
 if __name__ == "__main__":
@@ -0,0 +1,50 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncRuntime:
+    """An asyncio event loop on one background thread, for jobs that mostly wait.
+
+    A coroutine parked here holds no thread while it sleeps, so thousands of jobs can
+    wait on AssemblyAI at once. The blocking calls they still need (requests, SQLite)
+    go through ``run_blocking`` to a small fixed executor.
+    """
+
+    def __init__(self, io_threads=8, name='async'):
+        self.io_threads = io_threads
+        self.loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix=f'{name}-io')
+        self._lock = threading.Lock()
+        self._tasks = 0
+        self._thread = threading.Thread(target=self._run, name=f'{name}-loop', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def spawn(self, coro_fn, *args):
+        """Start coro_fn(*args) on the loop from any thread; returns a concurrent.futures.Future"""
+        with self._lock:
+            self._tasks += 1
+        return asyncio.run_coroutine_threadsafe(self._track(coro_fn, args), self.loop)
+
+    async def _track(self, coro_fn, args):
+        try:
+            return await coro_fn(*args)
+        except Exception as e:
+            # The pipeline records its own errors; this only keeps the loop quiet
+            print(f"Async task {coro_fn.__name__} crashed: {e}")
+        finally:
+            with self._lock:
+                self._tasks -= 1
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        """Run a blocking call on the I/O executor without stalling the loop"""
+        return await self.loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def stats(self):
+        with self._lock:
+            return {'tasks': self._tasks, 'io_threads': self.io_threads}
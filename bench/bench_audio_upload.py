@@ -0,0 +1,112 @@
+"""Compare the legacy download + MP3 transcode + upload path with the streaming path.
+
+Uploads go to a local sink server that just counts bytes, so no AssemblyAI credits
+are used. Needs network access to YouTube and ffmpeg on PATH for the legacy path.
+
+    python bench/bench_audio_upload.py https://youtu.be/<id> [more urls] --runs 3
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class SinkHandler(BaseHTTPRequestHandler):
+    """Accepts /v2/upload bodies (multipart or chunked) and discards them"""
+    protocol_version = 'HTTP/1.1'
+    received = 0
+
+    def do_POST(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                SinkHandler.received += len(self.rfile.read(size))
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get('Content-Length', 0))
+            while remaining:
+                chunk = self.rfile.read(min(remaining, 1024 * 1024))
+                SinkHandler.received += len(chunk)
+                remaining -= len(chunk)
+
+        body = json.dumps({'upload_url': 'http://sink/audio'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def cpu_seconds():
+    """CPU time of this process plus finished children (ffmpeg runs as a child)"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def run_legacy(app, url):
+    temp_audio_file = tempfile.NamedTemporaryFile(suffix=".mp3", delete=True)
+    try:
+        app.download_audio(url, temp_audio_file.name)
+        return app.upload_to_assemblyai(temp_audio_file.name, 'bench')
+    finally:
+        temp_audio_file.close()
+
+
+def run_streaming(app, url):
+    upload_url = app.stream_to_assemblyai(app.probe_video(url), 'bench')
+    if upload_url is None:
+        raise Exception("No directly streamable audio format")
+    return upload_url
+
+
+def measure(fn, app, url):
+    SinkHandler.received = 0
+    start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+    fn(app, url)
+    return {
+        'wall_s': round(time.perf_counter() - start_wall, 2),
+        'cpu_s': round(cpu_seconds() - start_cpu, 2),
+        'uploaded_mb': round(SinkHandler.received / 1024 / 1024, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('urls', nargs='+')
+    parser.add_argument('--runs', type=int, default=1)
+    args = parser.parse_args()
+
+    sink = ThreadingHTTPServer(('127.0.0.1', 0), SinkHandler)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    os.environ['ASSEMBLYAI_BASE_URL'] = f'http://127.0.0.1:{sink.server_port}'
+    os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='ytmcq-bench-'))
+    import app
+
+    for url in args.urls:
+        for path, fn in (('legacy', run_legacy), ('streaming', run_streaming)):
+            for run in range(args.runs):
+                try:
+                    result = measure(fn, app, url)
+                except Exception as e:
+                    result = {'error': str(e)}
+                print(json.dumps({'url': url, 'path': path, 'run': run + 1, **result}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,460 @@
+"""Offline end-to-end load test: /transcribe + /status against local fake upstreams.
+
+One local server stands in for YouTube's media servers, AssemblyAI (upload,
+transcript submit/poll) and Groq chat completions, with configurable latency,
+error rates and truncated/malformed JSON. yt-dlp's metadata probe is swapped for a
+fixture pointing at that server, so no network access or API credits are needed.
+
+    python bench/bench_e2e.py --jobs 200 --concurrency 50 --groq-latency 1.5 --truncate-rate 0.2
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = (
+    'energy cell membrane protein river economy market supply demand theory light photon '
+    'gravity orbit planet climate carbon ocean current voltage circuit resistor algorithm '
+    'network graph vector matrix enzyme genome mutation species habitat empire treaty '
+    'revolution poetry metaphor grammar syntax equation integral derivative entropy'
+).split()
+
+
+def sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+class FakeUpstreams(BaseHTTPRequestHandler):
+    """YouTube media, AssemblyAI and Groq in one handler, driven by ``config``"""
+    protocol_version = 'HTTP/1.1'
+    config = None
+    media = b''
+    transcripts = {}
+    lock = threading.Lock()
+    calls = {}
+    groq_bucket = None
+
+    def log_message(self, *args):
+        pass
+
+    def count(self, name):
+        with self.lock:
+            FakeUpstreams.calls[name] = FakeUpstreams.calls.get(name, 0) + 1
+
+    def latency(self, seconds):
+        if seconds:
+            time.sleep(random.uniform(0.5, 1.5) * seconds)
+
+    def send_body(self, status, body, content_type='application/json', headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            received = 0
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return received, b''
+                received += len(self.rfile.read(size))
+                self.rfile.readline()
+        length = int(self.headers.get('Content-Length', 0))
+        return length, self.rfile.read(length)
+
+    def do_GET(self):
+        if self.path.startswith('/media/'):
+            return self.serve_media()
+        match = re.match(r'^/v2/transcript/([\w-]+)$', self.path)
+        if match:
+            return self.poll_transcript(match.group(1))
+        self.send_body(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path == '/v2/upload':
+            self.count('upload')
+            self.read_body()
+            self.latency(self.config.upload_latency)
+            return self.send_body(200, {'upload_url': f'http://fake/audio/{uuid.uuid4().hex}'})
+        if self.path == '/v2/transcript':
+            return self.submit_transcript()
+        if self.path == '/openai/v1/chat/completions':
+            return self.chat_completion()
+        self.send_body(404, {'error': 'not found'})
+
+    def do_DELETE(self):
+        match = re.match(r'^/v2/transcript/([\w-]+)$', self.path)
+        if not match:
+            return self.send_body(404, {'error': 'not found'})
+        self.count('delete')
+        with self.lock:
+            FakeUpstreams.transcripts.pop(match.group(1), None)
+        self.send_body(200, {'id': match.group(1), 'status': 'completed', 'text': None})
+
+    def serve_media(self):
+        self.count('media')
+        start, end = 0, len(self.media) - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(end, int(match.group(2) or end))
+        self.send_body(206 if match else 200, self.media[start:end + 1], 'audio/webm')
+
+    def submit_transcript(self):
+        self.count('submit')
+        _, raw = self.read_body()
+        if random.random() < self.config.assemblyai_error_rate:
+            return self.send_body(503, {'error': 'overloaded'})
+        transcript_id = uuid.uuid4().hex
+        rng = random.Random(transcript_id)
+        text = ' '.join(sentence(rng) for _ in range(self.config.transcript_sentences))
+        with self.lock:
+            FakeUpstreams.transcripts[transcript_id] = (time.time(), text)
+        body = json.loads(raw or b'{}')
+        if body.get('webhook_url'):
+            threading.Timer(self.config.transcribe_seconds, self.fire_webhook, (transcript_id, body)).start()
+        self.send_body(200, {'id': transcript_id, 'status': 'queued'})
+
+    def fire_webhook(self, transcript_id, body):
+        """Tell the app a transcript is done, the way AssemblyAI calls a submitted webhook_url"""
+        self.count('webhook')
+        try:
+            requests.post(
+                body['webhook_url'], json={'transcript_id': transcript_id, 'status': 'completed'},
+                headers={body['webhook_auth_header_name']: body['webhook_auth_header_value']}, timeout=10
+            )
+        except requests.RequestException:
+            self.count('webhook_failed')
+
+    def poll_transcript(self, transcript_id):
+        self.count('poll')
+        with self.lock:
+            entry = FakeUpstreams.transcripts.get(transcript_id)
+        if entry is None:
+            return self.send_body(404, {'error': 'unknown transcript'})
+        submitted, text = entry
+        age = time.time() - submitted
+        if age < self.config.transcribe_seconds * 0.2:
+            return self.send_body(200, {'id': transcript_id, 'status': 'queued'})
+        if age < self.config.transcribe_seconds:
+            return self.send_body(200, {'id': transcript_id, 'status': 'processing'})
+        self.send_body(200, {
+            'id': transcript_id, 'status': 'completed', 'text': text,
+            'language_code': 'en', 'confidence': 0.95, 'audio_duration': 600,
+        })
+
+    def send_stream(self, content, finish_reason, usage, headers, seconds):
+        """Send a completion as Groq's server-sent events, spreading ``seconds`` over its pieces"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        size = max(1, len(content) // 20)
+        pieces = [content[i:i + size] for i in range(0, len(content), size)] or ['']
+        try:
+            for index, piece in enumerate(pieces):
+                time.sleep(seconds / len(pieces))
+                event = {'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]}
+                if index == len(pieces) - 1:
+                    event['choices'][0]['finish_reason'] = finish_reason
+                    event['x_groq'] = {'usage': usage}
+                self.write_chunk(f'data: {json.dumps(event)}\n\n')
+            self.write_chunk('data: [DONE]\n\n')
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # The app hung up mid-stream (a cancelled job)
+            self.count('groq_aborted')
+            self.close_connection = True
+
+    def write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+
+    def chat_completion(self):
+        self.count('groq')
+        _, raw = self.read_body()
+        body = json.loads(raw)
+        # A streamed response starts right away and spreads its latency over the tokens
+        seconds = random.uniform(0.5, 1.5) * self.config.groq_latency
+        if not body.get('stream'):
+            time.sleep(seconds)
+        if random.random() < self.config.groq_error_rate:
+            return self.send_body(429, {'error': 'rate limited'}, headers={'Retry-After': '1'})
+
+        system = body['messages'][0]['content']
+        match = re.search(r'create (\d+)', system)
+        count = int(match.group(1)) if match else 10
+        rng = random.Random()
+        if 'flashcards' in system:
+            items = [{
+                'front': f'{sentence(rng, 6)[:-1]}?', 'back': sentence(rng),
+                'difficulty': 'medium', 'category': 'Fact', 'topic': rng.choice(WORDS),
+            } for _ in range(count)]
+            content = json.dumps({'flashcards': items})
+        else:
+            items = [{
+                'question': f'{sentence(rng, 8)[:-1]}?',
+                'options': [f'{letter}) {rng.choice(WORDS)}' for letter in 'ABCD'],
+                'correct_answer': rng.choice('ABCD'), 'explanation': sentence(rng),
+                'difficulty': 'medium', 'topic': rng.choice(WORDS),
+            } for _ in range(count)]
+            content = json.dumps({'questions': items})
+
+        roll = random.random()
+        finish_reason = 'stop'
+        if roll < self.config.malformed_rate:
+            content = 'Sure! Here are your questions: ' + content.replace('"', "'")
+        elif roll < self.config.malformed_rate + self.config.truncate_rate:
+            content = content[:int(len(content) * random.uniform(0.3, 0.9))]
+            finish_reason = 'length'
+
+        usage = {'prompt_tokens': len(raw) // 4, 'completion_tokens': len(content) // 4}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        allowed, headers = self.rate_limit(usage['total_tokens'])
+        if not allowed:
+            self.count('groq_429')
+            return self.send_body(429, {'error': 'rate limited'}, headers=headers)
+        if body.get('stream'):
+            self.count('groq_streamed')
+            return self.send_stream(content, finish_reason, usage, headers, seconds)
+        self.send_body(200, {
+            'choices': [{'message': {'role': 'assistant', 'content': content}, 'finish_reason': finish_reason}],
+            'usage': usage,
+        }, headers=headers)
+
+    def rate_limit(self, tokens):
+        """Enforce --groq-tpm as a token bucket refilled continuously, like Groq's own limiter.
+
+        Returns (allowed, x-ratelimit headers).
+        """
+        tpm = self.config.groq_tpm or 10 ** 9
+        now = time.time()
+        with self.lock:
+            level, updated = FakeUpstreams.groq_bucket or (tpm, now)
+            level = min(tpm, level + (now - updated) * tpm / 60)
+            allowed = level >= tokens
+            if allowed:
+                level -= tokens
+            FakeUpstreams.groq_bucket = (level, now)
+        headers = {
+            'x-ratelimit-limit-tokens': str(tpm),
+            'x-ratelimit-remaining-tokens': str(int(level)),
+            'x-ratelimit-reset-tokens': f'{(tpm - level) * 60 / tpm:.2f}s',
+        }
+        if not allowed:
+            headers['Retry-After'] = str(max(1, round((tokens - level) * 60 / tpm)))
+        return allowed, headers
+
+
+def fake_probe(base_url):
+    """Stand-in for yt-dlp metadata extraction: one streamable audio format, no captions"""
+    def probe_video(youtube_url):
+        return {
+            'id': youtube_url.rsplit('=', 1)[-1],
+            'duration': 600,
+            'formats': [{
+                'format_id': '251', 'url': f'{base_url}/media/audio.webm', 'ext': 'webm',
+                'vcodec': 'none', 'acodec': 'opus', 'abr': 128, 'protocol': 'https',
+            }],
+        }
+    return probe_video
+
+
+def rss_mb():
+    """Current resident set size of this process (Linux), falling back to the peak"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return round(values[index], 2)
+
+
+def run_job(base_url, status_interval, timeout):
+    """Submit one video and follow it to completion.
+
+    Returns (outcome, seconds, 429s, MCQs, seconds from the transcript being ready
+    until the first MCQ was visible).
+    """
+    video_id = uuid.uuid4().hex[:11]
+    started = time.perf_counter()
+    rejected = 0
+    while True:
+        response = requests.post(f'{base_url}/transcribe', json={'url': f'https://www.youtube.com/watch?v={video_id}'})
+        if response.status_code != 429:
+            break
+        rejected += 1
+        time.sleep(min(5, int(response.headers.get('Retry-After', 1))))
+    if response.status_code != 200:
+        return 'submit_error', time.perf_counter() - started, rejected, 0, None
+
+    job_id = response.json()['job_id']
+    generating = first_mcq = None
+    while time.perf_counter() - started < timeout:
+        status = requests.get(f'{base_url}/status/{job_id}').json()
+        if generating is None and status['status'] == 'generating_content':
+            generating = time.perf_counter()
+        if generating is not None and first_mcq is None and status.get('mcq_count'):
+            first_mcq = time.perf_counter() - generating
+        if status['status'] in ('completed', 'error', 'cancelled'):
+            return status['status'], time.perf_counter() - started, rejected, status.get('mcq_count', 0), first_mcq
+        time.sleep(status_interval)
+    return 'timeout', time.perf_counter() - started, rejected, 0, first_mcq
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--media-mb', type=float, default=2)
+    parser.add_argument('--upload-latency', type=float, default=0.2)
+    parser.add_argument('--transcribe-seconds', type=float, default=3)
+    parser.add_argument('--transcript-sentences', type=int, default=200)
+    parser.add_argument('--groq-latency', type=float, default=0.5)
+    parser.add_argument('--groq-error-rate', type=float, default=0.0)
+    parser.add_argument('--groq-tpm', type=int, default=0, help='tokens per minute the fake Groq allows (0: unlimited)')
+    parser.add_argument('--groq-rpm', type=int, default=100000, help='requests per minute budget the app assumes')
+    parser.add_argument('--groq-streaming', choices=('0', '1'), default='1', help='GROQ_STREAMING to run the app with')
+    parser.add_argument('--assemblyai-error-rate', type=float, default=0.0)
+    parser.add_argument('--truncate-rate', type=float, default=0.1)
+    parser.add_argument('--malformed-rate', type=float, default=0.05)
+    parser.add_argument('--poll-scale', type=float, default=0.2, help='multiplier on the app\'s AssemblyAI poll delays')
+    parser.add_argument('--status-interval', type=float, default=0.5)
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--mode', choices=('threads', 'async'), default='threads', help='PIPELINE_MODE to run the app in')
+    parser.add_argument('--verbose', action='store_true', help='keep the pipeline\'s own logging')
+    args = parser.parse_args()
+
+    FakeUpstreams.config = args
+    FakeUpstreams.media = os.urandom(int(args.media_mb * 1024 * 1024))
+    upstream = ThreadingHTTPServer(('127.0.0.1', 0), FakeUpstreams)
+    upstream.daemon_threads = True
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    upstream_url = f'http://127.0.0.1:{upstream.server_port}'
+
+    os.environ['ASSEMBLYAI_BASE_URL'] = upstream_url
+    os.environ['GROQ_BASE_URL'] = upstream_url
+    os.environ.setdefault('ASSEMBLYAI_API_KEY', 'bench')
+    os.environ.setdefault('GROQ_API_KEY', 'bench')
+    os.environ['PIPELINE_MODE'] = args.mode
+    os.environ['GROQ_STREAMING'] = args.groq_streaming
+    os.environ.setdefault('GROQ_REQUESTS_PER_MINUTE', str(args.groq_rpm))
+    os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='ytmcq-e2e-'))
+    import app
+    from werkzeug.serving import make_server
+
+    app.probe_video = fake_probe(upstream_url)
+    poll_delay = app.poll_delay
+    app.poll_delay = lambda *a, **kw: poll_delay(*a, **kw) * args.poll_scale
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    # Sample threads and memory while the load runs
+    samples = {'threads': 0, 'pipeline_threads': 0, 'rss_mb': 0, 'waiting_jobs': 0, 'threads_at_peak_waiting': 0}
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            # The simulated clients live in this process too; only count the app's threads
+            app_threads = sum(1 for t in threading.enumerate() if not t.name.startswith('bench-client'))
+            samples['threads'] = max(samples['threads'], app_threads)
+            # Without the per-request threads of the app's server and the fake upstreams
+            pipeline_threads = sum(
+                1 for t in threading.enumerate()
+                if not t.name.startswith('bench-client') and 'process_request_thread' not in t.name
+            )
+            samples['pipeline_threads'] = max(samples['pipeline_threads'], pipeline_threads)
+            samples['rss_mb'] = max(samples['rss_mb'], rss_mb())
+            # Jobs parked on AssemblyAI: what async mode should hold without a thread each
+            waiting = app.job_store.stats().get('by_status', {}).get('processing', 0)
+            if waiting >= samples['waiting_jobs']:
+                samples['waiting_jobs'] = waiting
+                samples['threads_at_peak_waiting'] = pipeline_threads
+            done.wait(0.5)
+    threading.Thread(target=sample, daemon=True).start()
+
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    with quiet, ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix='bench-client') as executor:
+        results = list(executor.map(
+            lambda _: run_job(base_url, args.status_interval, args.timeout), range(args.jobs)
+        ))
+    wall = time.perf_counter() - started
+    done.set()
+
+    latencies = [seconds for outcome, seconds, _, _, _ in results if outcome == 'completed']
+    mcq_counts = [mcqs for outcome, _, _, mcqs, _ in results if outcome == 'completed']
+    first_mcqs = [first for outcome, _, _, _, first in results if outcome == 'completed' and first is not None]
+    outcomes = {}
+    for outcome, _, _, _, _ in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    print(json.dumps({
+        'mode': args.mode,
+        'groq_streaming': args.groq_streaming == '1',
+        'jobs': args.jobs,
+        'concurrency': args.concurrency,
+        'outcomes': outcomes,
+        'rejected_429': sum(rejected for _, _, rejected, _, _ in results),
+        'wall_s': round(wall, 2),
+        'throughput_jobs_per_s': round(len(latencies) / wall, 3) if wall else None,
+        'latency_p50_s': percentile(latencies, 50),
+        'latency_p95_s': percentile(latencies, 95),
+        'latency_p99_s': percentile(latencies, 99),
+        'first_mcq_p50_s': percentile(first_mcqs, 50),
+        'first_mcq_p95_s': percentile(first_mcqs, 95),
+        'mcqs_per_job': round(sum(mcq_counts) / len(mcq_counts), 1) if mcq_counts else None,
+        'peak_app_threads': samples['threads'],
+        'peak_pipeline_threads': samples['pipeline_threads'],
+        'peak_waiting_jobs': samples['waiting_jobs'],
+        'pipeline_threads_at_peak_waiting': samples['threads_at_peak_waiting'],
+        'rss_mb_before': rss_before,
+        'peak_rss_mb': samples['rss_mb'],
+        'upstream_calls': FakeUpstreams.calls,
+        'fallback_content': sum(app.FALLBACK_CONTENT._values.values()),
+        'groq_budget': app.groq_budget.stats() if app.groq_budget else None,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
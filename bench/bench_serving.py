@@ -0,0 +1,150 @@
+"""Startup time and requests/second of the web tier: `python app.py` vs gunicorn.
+
+Each server is started from cold on a free port and timed until /readyz answers,
+then hammered with light requests (/status of an unknown job by default, which
+reads the job store) from a pool of client threads. No upstream calls are made.
+
+    python bench/bench_serving.py --clients 32 --seconds 10
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    'flask_dev': [sys.executable, 'app.py'],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return round(values[index] * 1000, 2)
+
+
+def import_seconds(module):
+    """Cold import time of a module in a fresh interpreter"""
+    code = f'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True,
+        env=dict(os.environ, DATA_DIR=tempfile.mkdtemp(prefix='bench-serving-'))
+    ).stdout
+    return round(float(output.strip().splitlines()[-1]), 3)
+
+
+def load(base_url, path, clients, seconds):
+    """Keep `clients` threads requesting path for `seconds`; returns (count, errors, latencies)"""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        session = requests.Session()
+        mine, failed = [], 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = session.get(base_url + path, timeout=10).status_code < 500
+            except requests.RequestException:
+                ok = False
+            if ok:
+                mine.append(time.perf_counter() - started)
+            else:
+                failed += 1
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies), errors[0], latencies
+
+
+def run_server(name, args):
+    port = free_port()
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        DATA_DIR=tempfile.mkdtemp(prefix='bench-serving-'),
+        JOB_QUEUE='sqlite',
+        ASSEMBLYAI_API_KEY='bench',
+        GROQ_API_KEY='bench',
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        SERVERS[name], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    try:
+        startup = None
+        while time.perf_counter() - started < args.startup_timeout:
+            try:
+                if requests.get(f'{base_url}/readyz', timeout=1).status_code == 200:
+                    startup = time.perf_counter() - started
+                    break
+            except requests.RequestException:
+                pass
+            time.sleep(0.02)
+        if startup is None:
+            return {'server': name, 'error': 'never became ready'}
+
+        load(base_url, args.path, args.clients, 1)  # warm up connections and workers
+        count, errors, latencies = load(base_url, args.path, args.clients, args.seconds)
+        return {
+            'server': name,
+            'startup_s': round(startup, 3),
+            'requests': count,
+            'errors': errors,
+            'rps': round(count / args.seconds, 1),
+            'latency_p50_ms': percentile(latencies, 50),
+            'latency_p99_ms': percentile(latencies, 99),
+        }
+    finally:
+        # The dev server's reloader runs the app in a child process; stop the whole group
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--servers', nargs='+', choices=sorted(SERVERS), default=['flask_dev', 'gunicorn'])
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--path', default='/status/bench-unknown-job')
+    parser.add_argument('--startup-timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        'cpus': os.cpu_count(),
+        'clients': args.clients,
+        'path': args.path,
+        'import_s': {'app': import_seconds('app'), 'yt_dlp': import_seconds('yt_dlp')},
+        'servers': [run_server(name, args) for name in args.servers],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import math
+import re
+import threading
+
+# Rough characters-per-token ratio for budgeting; good enough for English and Devanagari
+CHARS_PER_TOKEN = 4
+
+# Sentence ends: Latin punctuation plus the Devanagari danda used in Hindi/Nepali
+SENTENCE_END_RE = re.compile(r'(?<=[.!?।])\s+')
+
+
+def estimate_tokens(text):
+    """Cheap token estimate for budgeting requests"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_transcript(text, max_tokens):
+    """Split a transcript into chunks of at most ``max_tokens`` at natural boundaries.
+
+    Paragraphs are kept together where they fit, then sentences; a single sentence
+    longer than the budget (common in unpunctuated captions) is cut at word boundaries.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    text = text.strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in SENTENCE_END_RE.split(paragraph):
+            if len(sentence) <= max_chars:
+                pieces.append(sentence)
+                continue
+            words, current = sentence.split(), ''
+            for word in words:
+                if current and len(current) + 1 + len(word) > max_chars:
+                    pieces.append(current)
+                    current = word
+                else:
+                    current = f'{current} {word}' if current else word
+            if current:
+                pieces.append(current)
+
+    chunks, current = [], ''
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f'{current} {piece}' if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_budget(text, min_tokens, max_tokens, max_chunks):
+    """Token budget per chunk so long transcripts use at most ~max_chunks calls"""
+    wanted = math.ceil(estimate_tokens(text) / max_chunks)
+    return max(min_tokens, min(max_tokens, wanted))
+
+
+def scale_strategies(strategies, transcript_chars, count_key, count):
+    """Adapt a generator's fallback strategies to one pre-sized chunk.
+
+    The first strategy sends the whole chunk and asks for ``count`` items; later
+    strategies shrink both in the same proportions as the originals.
+    """
+    base_length = strategies[0]['transcript_length']
+    base_count = strategies[0][count_key]
+    length_scale = max(1.0, transcript_chars / base_length)
+
+    scaled = []
+    for strategy in strategies:
+        strategy = dict(strategy)
+        strategy['transcript_length'] = int(strategy['transcript_length'] * length_scale)
+        strategy[count_key] = max(1, round(strategy[count_key] * count / base_count))
+        scaled.append(strategy)
+    return scaled
+
+
+def word_set(text):
+    """Lower-cased set of words, the representation used for near-duplicate checks"""
+    return set(re.findall(r'\w+', (text or '').lower()))
+
+
+def is_near_duplicate(text, seen, threshold=0.8):
+    """True if text's word set overlaps any already-selected one by Jaccard >= threshold"""
+    words = word_set(text)
+    if not words:
+        return True
+    for other in seen:
+        union = len(words | other)
+        if union and len(words & other) / union >= threshold:
+            return True
+    return False
+
+
+def select_balanced(per_chunk_items, total, text_key, seen=None):
+    """Dedupe candidates and pick ``total`` of them round-robin across chunks.
+
+    Round-robin keeps coverage spread over the whole video instead of letting the
+    chunk that produced the most candidates dominate. ``seen`` holds word sets of
+    items already chosen elsewhere, which candidates must not repeat.
+    """
+    queues = [list(items) for items in per_chunk_items if items]
+    selected, seen = [], list(seen or [])
+
+    while queues and len(selected) < total:
+        for items in list(queues):
+            while items:
+                item = items.pop(0)
+                text = item.get(text_key, '')
+                if not is_near_duplicate(text, seen):
+                    selected.append(item)
+                    seen.append(word_set(text))
+                    break
+            if not items:
+                queues.remove(items)
+            if len(selected) >= total:
+                break
+    return selected
+
+
+class UsageTracker:
+    """Thread-safe tally of Groq calls and tokens for one generation run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, usage):
+        with self._lock:
+            self.calls += 1
+            if usage:
+                self.prompt_tokens += usage.get('prompt_tokens', 0)
+                self.completion_tokens += usage.get('completion_tokens', 0)
+
+    def report(self, seconds, transcript_chars, audio_duration=None):
+        """Summary with throughput and, when the audio length is known, cost per hour of audio"""
+        with self._lock:
+            report = {
+                'calls': self.calls,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'seconds': round(seconds, 2),
+                'chars_per_second': round(transcript_chars / seconds) if seconds else None,
+            }
+        if audio_duration:
+            hours = audio_duration / 3600
+            report['tokens_per_audio_hour'] = round((report['prompt_tokens'] + report['completion_tokens']) / hours)
+            report['seconds_per_audio_hour'] = round(seconds / hours, 1)
+        return report
@@ -0,0 +1,43 @@
+"""Gunicorn settings for the web tier.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Threaded workers suit this app: requests are short reads of job state, plus
+/events streams that sit idle most of the time, so each worker process serves many
+of them on threads. Pipeline work runs in `worker.py` processes (JOB_QUEUE=sqlite)
+or, with JOB_QUEUE=local, on the web process's own worker pool. That pool, its
+admission limit, the stage caps and queue positions are per process, so with the
+local queue there is one web process unless WEB_CONCURRENCY says otherwise.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+worker_class = 'gthread'
+JOB_QUEUE = os.environ.get('JOB_QUEUE', 'local')
+workers = int(os.environ.get('WEB_CONCURRENCY', max(2, multiprocessing.cpu_count()) if JOB_QUEUE == 'sqlite' else 1))
+# Each open /events stream holds a thread for up to SSE_MAX_SECONDS; the app lets
+# streams take at most half of them (SSE_MAX_STREAMS) and the rest of the browsers poll
+threads = int(os.environ.get('WEB_THREADS', 32))
+# /transcribe probes the video synchronously, which can take several seconds
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# The app isn't preloaded: its worker pools, timer thread and async loop start at
+# import and threads don't survive fork. yt-dlp is imported by the first job that
+# needs it; PRELOAD_YTDLP=1 imports it in the master instead, so several workers
+# share it, at the cost of a slower start.
+preload_app = False
+if os.environ.get('PRELOAD_YTDLP', '0') == '1':
+    import flask  # noqa: F401
+    import requests  # noqa: F401
+    import yt_dlp  # noqa: F401
+
+# Recycling a worker would kill jobs running on its own pool, so only do it when
+# jobs run in separate worker processes
+if JOB_QUEUE == 'sqlite':
+    max_requests = 2000
+    max_requests_jitter = 200
+
+accesslog = '-'
@@ -0,0 +1,121 @@
+import queue
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Responses worth retrying: rate limiting and transient upstream failures
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class JitteredRetry(Retry):
+    """urllib3 Retry with "full jitter" exponential backoff.
+
+    A ``Retry-After`` header on a 429/503 still takes priority over the backoff,
+    because urllib3 checks for it before falling back to ``get_backoff_time``.
+    """
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff else 0
+
+
+class PooledSession(requests.Session):
+    """requests.Session with a sized keep-alive pool, retries and a default timeout.
+
+    One instance is shared by every worker thread talking to the same upstream.
+    """
+
+    def __init__(self, name, pool_size=16, retries=3, backoff_factor=1.0, timeout=30):
+        super().__init__()
+        self.name = name
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._requests = 0
+
+        retry = JitteredRetry(
+            total=retries,
+            connect=retries,
+            read=0,  # a read timeout may mean the upstream is still working on it
+            status=retries,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=None,  # retry POSTs too; 429/5xx mean the call wasn't processed
+            backoff_factor=backoff_factor,
+            respect_retry_after_header=True,
+            raise_on_status=False,  # hand the last response back so callers see the status
+        )
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+        self.mount('https://', self.adapter)
+        self.mount('http://', self.adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with self._lock:
+            self._requests += 1
+        return super().request(method, url, **kwargs)
+
+    def stats(self):
+        """Per-host connection reuse: how many requests each new TCP+TLS connection served"""
+        hosts = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = hosts.setdefault(pool.host, {'requests': 0, 'connections_opened': 0})
+            host['requests'] += pool.num_requests
+            host['connections_opened'] += pool.num_connections
+
+        for host in hosts.values():
+            host['connections_reused'] = max(0, host['requests'] - host['connections_opened'])
+
+        with self._lock:
+            calls = self._requests
+        return {'calls': calls, 'pool_size': self.adapter._pool_maxsize, 'hosts': hosts}
+
+
+def buffered_body(chunks, max_buffer_bytes=8 * 1024 * 1024, chunk_size=512 * 1024):
+    """Yield from ``chunks`` while a background thread keeps reading ahead.
+
+    Lets a streaming download and a chunked upload run at the same time while
+    holding at most ``max_buffer_bytes`` in memory. Errors in the producer are
+    re-raised in the consumer so a broken download fails the upload too.
+    """
+    buffer = queue.Queue(maxsize=max(1, max_buffer_bytes // chunk_size))
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        # Block while the buffer is full, but give up once the consumer has gone away
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+
+    producer = threading.Thread(target=produce, name='stream-producer', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Consumer gave up (e.g. upload failed): let the producer exit
+        stop.set()
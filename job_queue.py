@@ -0,0 +1,200 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from scheduler import QueueFull
+
+
+class SQLiteJobQueue:
+    """Durable job queue in SQLite, shared by web processes (producers) and workers.
+
+    Producers use the same ``submit``/``position``/``stats`` interface as the in-process
+    ``JobScheduler``; tasks are stored by function name with JSON arguments and looked
+    up again in the worker. A worker leases a task for ``visibility_timeout`` seconds
+    and keeps extending the lease while it runs. If the worker dies the lease runs out
+    and another worker picks the task up, up to ``max_attempts`` times.
+    """
+
+    def __init__(self, path, max_queue=50, visibility_timeout=120, max_attempts=3, retry_delay=10):
+        self.path = path
+        self.max_queue = max_queue
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    task TEXT NOT NULL,
+                    args TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    available_at REAL NOT NULL,
+                    leased_until REAL,
+                    leased_by TEXT
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_available ON tasks (available_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_job ON tasks (job_id)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _waiting(self, conn, now):
+        # Tasks scheduled for later (retries, transcript checks) aren't in line yet
+        return conn.execute(
+            'SELECT COUNT(*) FROM tasks WHERE available_at <= ? AND (leased_until IS NULL OR leased_until < ?)',
+            (now, now)
+        ).fetchone()[0]
+
+    def submit(self, job_id, fn, *args, delay=0):
+        """Queue fn(*args) for a worker and return the 1-based queue position, or raise QueueFull.
+
+        A task with a delay is a follow-up for a job that's already running (such as a
+        transcript status check): it isn't refused when the queue is full and only
+        becomes available after ``delay`` seconds.
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            waiting = self._waiting(conn, now)
+            if waiting >= self.max_queue and not delay:
+                raise QueueFull(f"Job queue is full ({self.max_queue} waiting)")
+            conn.execute(
+                'INSERT INTO tasks (job_id, task, args, created_at, available_at) VALUES (?, ?, ?, ?, ?)',
+                (job_id, fn.__name__, json.dumps(args, ensure_ascii=False), now, now + delay)
+            )
+        return waiting + 1
+
+    def position(self, job_id):
+        """1-based position of a waiting job, or None once a worker has it (or it's unknown)"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT id FROM tasks WHERE job_id = ? AND (leased_until IS NULL OR leased_until < ?) ORDER BY id LIMIT 1',
+                (job_id, now)
+            ).fetchone()
+            if row is None:
+                return None
+            ahead = conn.execute(
+                'SELECT COUNT(*) FROM tasks WHERE id < ? AND (leased_until IS NULL OR leased_until < ?)',
+                (row[0], now)
+            ).fetchone()[0]
+        return ahead + 1
+
+    def waiting(self):
+        """IDs of the jobs whose tasks no worker holds"""
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT DISTINCT job_id FROM tasks WHERE leased_until IS NULL OR leased_until < ?', (now,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def remove(self, job_id):
+        """Drop a job's tasks that no worker holds; returns True if any were waiting"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            removed = conn.execute(
+                'DELETE FROM tasks WHERE job_id = ? AND (leased_until IS NULL OR leased_until < ?)', (job_id, now)
+            ).rowcount
+        return removed > 0
+
+    def lease(self, worker_id):
+        """Claim the oldest available task, or return None.
+
+        Returns a dict with id, job_id, task, args, attempts and waited (seconds since
+        it was queued). Tasks whose lease ran out are handed out again.
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT id, job_id, task, args, attempts, created_at FROM tasks '
+                'WHERE available_at <= ? AND (leased_until IS NULL OR leased_until < ?) AND attempts < ? '
+                'ORDER BY id LIMIT 1',
+                (now, now, self.max_attempts)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                'UPDATE tasks SET attempts = attempts + 1, leased_until = ?, leased_by = ? WHERE id = ?',
+                (now + self.visibility_timeout, worker_id, row[0])
+            )
+        return {
+            'id': row[0],
+            'job_id': row[1],
+            'task': row[2],
+            'args': json.loads(row[3]),
+            'attempts': row[4] + 1,
+            'waited': now - row[5],
+        }
+
+    def extend(self, task_ids):
+        """Push the lease of running tasks forward so they aren't handed to another worker"""
+        if not task_ids:
+            return
+        leased_until = time.time() + self.visibility_timeout
+        with self._lock, self._connect() as conn:
+            conn.executemany('UPDATE tasks SET leased_until = ? WHERE id = ?', [(leased_until, i) for i in task_ids])
+
+    def ack(self, task_id):
+        """The task finished (successfully or with an error the pipeline recorded itself)"""
+        with self._lock, self._connect() as conn:
+            conn.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
+
+    def fail(self, task):
+        """Release a task that crashed for a later retry; returns False once it's out of attempts"""
+        with self._lock, self._connect() as conn:
+            if task['attempts'] >= self.max_attempts:
+                conn.execute('DELETE FROM tasks WHERE id = ?', (task['id'],))
+                return False
+            conn.execute(
+                'UPDATE tasks SET leased_until = NULL, leased_by = NULL, available_at = ? WHERE id = ?',
+                (time.time() + self.retry_delay * task['attempts'], task['id'])
+            )
+        return True
+
+    def expired(self):
+        """Tasks that used up every attempt without being acked (their workers kept dying)"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                'SELECT id, job_id FROM tasks WHERE attempts >= ? AND leased_until < ?', (self.max_attempts, now)
+            ).fetchall()
+            conn.executemany('DELETE FROM tasks WHERE id = ?', [(row[0],) for row in rows])
+        return [job_id for _, job_id in rows]
+
+    def stats(self):
+        now = time.time()
+        with self._connect() as conn:
+            total = conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+            waiting = self._waiting(conn, now)
+            active, workers = conn.execute(
+                'SELECT COUNT(*), COUNT(DISTINCT leased_by) FROM tasks WHERE leased_until >= ?', (now,)
+            ).fetchone()
+        return {
+            'backend': 'sqlite',
+            'active': active,
+            'queued': waiting,
+            'scheduled': total - active - waiting,
+            'max_queue': self.max_queue,
+            'busy_workers': workers,
+        }
@@ -0,0 +1,384 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Job states after which nothing else will write to the job
+TERMINAL_STATUSES = ('completed', 'error', 'cancelled')
+
+
+def job_active(job):
+    """True while a job exists and hasn't reached a terminal state (or been cancelled)"""
+    return bool(job) and job.get('status') not in TERMINAL_STATUSES and not job.get('cancelled_at')
+
+
+class JobStore:
+    """Interface for job state storage.
+
+    Jobs are plain JSON-serialisable dicts with at least a ``status`` key. Backends
+    must be safe to call from the worker threads and the request handlers at once.
+    """
+
+    def __init__(self):
+        self._changed = threading.Condition()
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def wait_for_change(self, timeout):
+        """Block until a job is written by this process, or until timeout.
+
+        Writes from other worker processes aren't signalled, so callers should
+        re-read the store after every wakeup rather than trust the signal alone.
+        """
+        with self._changed:
+            self._changed.wait(timeout)
+
+    def get(self, job_id):
+        """Return the job dict, or None if it doesn't exist (or has expired)"""
+        raise NotImplementedError
+
+    def set(self, job_id, job):
+        """Replace the whole job dict"""
+        raise NotImplementedError
+
+    def update(self, job_id, **fields):
+        """Merge fields into the existing job dict, creating it if needed"""
+        raise NotImplementedError
+
+    def create(self, job_id, job, flight=None):
+        """Write a new job, or attach it to the active job already started under flight.
+
+        Identical requests pass the same flight key. The first becomes the flight's
+        owner and job is written as-is; while the owner is active, later callers are
+        written as ``{'status': 'queued', 'alias_of': owner}`` (keeping job's read_at)
+        and the owner's ID is returned. Both happen in one step, so two processes
+        can't both start the same work. Returns None when job_id owns the job.
+        """
+        raise NotImplementedError
+
+    def transition(self, job_id, expected_status, **fields):
+        """Merge fields only if the job is currently in expected_status.
+
+        Returns True if this caller won the transition. Used when more than one
+        thread or process may try to move a job on (e.g. webhook vs fallback poll).
+        """
+        raise NotImplementedError
+
+    def followers(self, job_id):
+        """IDs of the unfinished jobs coalesced onto job_id (its aliases)"""
+        raise NotImplementedError
+
+    def touch(self, job_ids):
+        """Mark unfinished jobs as still alive without rewriting them.
+
+        A job that waits (for a worker, a stage slot, a download, the Groq budget)
+        writes nothing; whoever holds it touches it so it isn't taken for dead.
+        """
+        raise NotImplementedError
+
+    def delete(self, job_id):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+
+class MemoryJobStore(JobStore):
+    """In-process LRU store that keeps at most ``max_jobs`` jobs for ``ttl`` seconds"""
+
+    def __init__(self, max_jobs=1000, ttl=6 * 3600):
+        super().__init__()
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        # OrderedDict is kept in last-write order, so expired jobs are at the front
+        while self._jobs:
+            job_id, (updated_at, _) = next(iter(self._jobs.items()))
+            if now - updated_at <= self.ttl:
+                break
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                del self._jobs[job_id]
+                return None
+            return dict(entry[1])
+
+    def set(self, job_id, job):
+        now = time.time()
+        with self._lock:
+            self._put(job_id, job, now)
+        self._notify()
+
+    def _put(self, job_id, job, now):
+        self._jobs.pop(job_id, None)
+        self._jobs[job_id] = (now, dict(job))
+        self._expire(now)
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+    def _active(self, job_id):
+        entry = self._jobs.get(job_id)
+        return entry is not None and time.time() - entry[0] <= self.ttl and job_active(entry[1])
+
+    def create(self, job_id, job, flight=None):
+        owner = None
+        with self._lock:
+            if flight is not None:
+                owner = self._flights.get(flight)
+                if owner and not self._active(owner):
+                    owner = None
+                if owner is None:
+                    self._flights[flight] = job_id
+                    # Flights whose job has ended can't be joined again, so they can go
+                    if len(self._flights) > self.max_jobs:
+                        self._flights = {key: o for key, o in self._flights.items() if self._active(o)}
+            if owner:
+                job = {'status': 'queued', 'alias_of': owner, 'read_at': job.get('read_at')}
+            self._put(job_id, job, time.time())
+        self._notify()
+        return owner
+
+    def update(self, job_id, **fields):
+        now = time.time()
+        with self._lock:
+            _, job = self._jobs.pop(job_id, (now, {}))
+            job = dict(job, **fields)
+            self._jobs[job_id] = (now, job)
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        self._notify()
+
+    def transition(self, job_id, expected_status, **fields):
+        now = time.time()
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is None or entry[1].get('status') != expected_status:
+                return False
+            del self._jobs[job_id]
+            self._jobs[job_id] = (now, dict(entry[1], **fields))
+        self._notify()
+        return True
+
+    def followers(self, job_id):
+        now = time.time()
+        with self._lock:
+            return [
+                alias_id for alias_id, (updated_at, job) in self._jobs.items()
+                if job.get('alias_of') == job_id and job.get('status') not in TERMINAL_STATUSES
+                and now - updated_at <= self.ttl
+            ]
+
+    def touch(self, job_ids):
+        now = time.time()
+        with self._lock:
+            for job_id in job_ids:
+                entry = self._jobs.pop(job_id, None)
+                if entry is not None:
+                    self._jobs[job_id] = (now if job_active(entry[1]) else entry[0], entry[1])
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+        self._notify()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory', 'jobs': len(self._jobs), 'max_jobs': self.max_jobs, 'ttl': self.ttl,
+                'flights': sum(self._active(owner) for owner in self._flights.values())
+            }
+
+
+class SQLiteJobStore(JobStore):
+    """SQLite (WAL) store shared by every worker process and kept across restarts.
+
+    Jobs that haven't been written for ``stale_after`` seconds while still in a
+    non-terminal state belonged to a worker that died; they are reported as errors
+    instead of spinning forever in the browser. Whoever holds a waiting job must
+    write or ``touch`` it more often than that. Aliases of coalesced jobs
+    are never stale themselves; the job they follow is checked instead.
+    """
+
+    def __init__(self, path, ttl=6 * 3600, stale_after=15 * 60):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self._lock = threading.Lock()
+        self._last_purge = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_updated ON jobs (updated_at)')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_alias ON jobs (json_extract(data, '$.alias_of'))")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS flights (
+                    flight TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _write(self, conn, job_id, job):
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO jobs (job_id, data, status, updated_at) VALUES (?, ?, ?, ?)',
+            (job_id, json.dumps(job, ensure_ascii=False), job.get('status', ''), now)
+        )
+        # Purging on every write would thrash the index; once a minute is plenty
+        if now - self._last_purge > 60:
+            self._last_purge = now
+            conn.execute('DELETE FROM jobs WHERE updated_at < ?', (now - self.ttl,))
+            conn.execute('DELETE FROM flights WHERE updated_at < ?', (now - self.ttl,))
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT data, updated_at FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return self._load(row)
+
+    def _load(self, row):
+        if row is None:
+            return None
+
+        job = json.loads(row[0])
+        age = time.time() - row[1]
+        if age > self.ttl:
+            return None
+        stale = self.stale_after and age > self.stale_after and not job.get('alias_of')
+        if stale and job.get('status') not in TERMINAL_STATUSES:
+            return {'status': 'error', 'error': 'Job was interrupted. Please try again.'}
+        return job
+
+    def set(self, job_id, job):
+        with self._lock, self._connect() as conn:
+            self._write(conn, job_id, job)
+        self._notify()
+
+    def update(self, job_id, **fields):
+        with self._lock, self._connect() as conn:
+            # BEGIN IMMEDIATE so read-modify-write is atomic across processes too
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT data FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+            job = json.loads(row[0]) if row else {}
+            job.update(fields)
+            self._write(conn, job_id, job)
+        self._notify()
+
+    def create(self, job_id, job, flight=None):
+        owner = None
+        with self._lock, self._connect() as conn:
+            # The write lock is held from the flight lookup until the job is written
+            conn.execute('BEGIN IMMEDIATE')
+            if flight is not None:
+                row = conn.execute('SELECT owner FROM flights WHERE flight = ?', (flight,)).fetchone()
+                if row:
+                    owner_row = conn.execute('SELECT data, updated_at FROM jobs WHERE job_id = ?', (row[0],)).fetchone()
+                    owner = row[0] if job_active(self._load(owner_row)) else None
+                if owner is None:
+                    conn.execute('INSERT OR REPLACE INTO flights VALUES (?, ?, ?)', (flight, job_id, time.time()))
+            if owner:
+                job = {'status': 'queued', 'alias_of': owner, 'read_at': job.get('read_at')}
+            self._write(conn, job_id, job)
+        self._notify()
+        return owner
+
+    def transition(self, job_id, expected_status, **fields):
+        with self._lock, self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT data FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+            if row is None:
+                return False
+            job = json.loads(row[0])
+            if job.get('status') != expected_status:
+                return False
+            job.update(fields)
+            self._write(conn, job_id, job)
+        self._notify()
+        return True
+
+    def followers(self, job_id):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT job_id FROM jobs WHERE json_extract(data, '$.alias_of') = ? AND status NOT IN (?, ?, ?) "
+                "AND updated_at >= ?",
+                (job_id,) + TERMINAL_STATUSES + (time.time() - self.ttl,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def touch(self, job_ids):
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        with self._lock, self._connect() as conn:
+            # Only the timestamp moves: a touch can't overwrite a concurrent write's data
+            conn.execute(
+                'UPDATE jobs SET updated_at = ? WHERE job_id IN (%s) AND status NOT IN (?, ?, ?)'
+                % ','.join('?' * len(job_ids)),
+                (time.time(), *job_ids) + TERMINAL_STATUSES
+            )
+
+    def delete(self, job_id):
+        with self._lock, self._connect() as conn:
+            conn.execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+        self._notify()
+
+    def stats(self):
+        with self._connect() as conn:
+            rows = conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+            flights = conn.execute(
+                'SELECT COUNT(*) FROM flights JOIN jobs ON jobs.job_id = flights.owner WHERE jobs.status NOT IN (?, ?, ?)',
+                TERMINAL_STATUSES
+            ).fetchone()[0]
+        return {
+            'backend': 'sqlite', 'jobs': sum(count for _, count in rows), 'by_status': dict(rows), 'ttl': self.ttl,
+            'flights': flights
+        }
+
+
+def create_job_store(backend, data_dir):
+    """Build the job store selected by the JOB_STORE setting"""
+    ttl = int(os.environ.get('JOB_TTL', 6 * 3600))
+    if backend == 'memory':
+        return MemoryJobStore(max_jobs=int(os.environ.get('JOB_STORE_MAX_JOBS', 1000)), ttl=ttl)
+    if backend == 'sqlite':
+        return SQLiteJobStore(
+            os.environ.get('JOB_STORE_PATH', os.path.join(data_dir, 'jobs.db')),
+            ttl=ttl,
+            stale_after=int(os.environ.get('JOB_STALE_AFTER', 15 * 60)),
+        )
+    raise ValueError(f"Unknown JOB_STORE backend: {backend}")
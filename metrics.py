@@ -0,0 +1,304 @@
+import functools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Seconds; pipeline stages range from a metadata probe to a long transcription
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+BYTE_BUCKETS = tuple(2 ** n * 1024 * 1024 for n in range(0, 10))  # 1MB .. 512MB
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    body = ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels)
+    return '{%s}' % body
+
+
+class Metric:
+    """A named family of samples, one per distinct set of label values"""
+    kind = None
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def header(self):
+        return [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+
+    def snapshot(self):
+        """JSON-serialisable copy of the samples"""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merged(self, snapshots):
+        """This process's samples plus those in other processes' snapshots"""
+        with self._lock:
+            values = dict(self._values)
+        for snapshot in snapshots:
+            for key, value in snapshot.get(self.name, []):
+                key = tuple(tuple(pair) for pair in key)
+                values[key] = self._add(values[key], value) if key in values else value
+        return values
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    @staticmethod
+    def _add(a, b):
+        return a + b
+
+    def render(self, snapshots=()):
+        values = self.merged(snapshots)
+        return self.header() + [f'{self.name}{format_labels(key)} {value}' for key, value in values.items()]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def merged(self, snapshots):
+        # Gauges are set from shared state when /metrics is rendered; summing them
+        # across processes would count that state once per process
+        with self._lock:
+            return dict(self._values)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=DURATION_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0, 0))
+            counts = [bucket_count + (value <= bound) for bucket_count, bound in zip(counts, self.buckets)]
+            self._values[key] = (counts, total + value, count + 1)
+
+    @staticmethod
+    def _add(a, b):
+        return [x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]
+
+    def render(self, snapshots=()):
+        lines = self.header()
+        for key, (counts, total, count) in self.merged(snapshots).items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{format_labels(key + (("le", bound),))} {bucket_count}')
+            lines.append(f'{self.name}_bucket{format_labels(key + (("le", "+Inf"),))} {count}')
+            lines.append(f'{self.name}_sum{format_labels(key)} {round(total, 6)}')
+            lines.append(f'{self.name}_count{format_labels(key)} {count}')
+        return lines
+
+
+class Registry:
+    """Process-local metrics rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = OrderedDict()
+
+    def _add(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, description):
+        return self._add(Counter(name, description))
+
+    def gauge(self, name, description):
+        return self._add(Gauge(name, description))
+
+    def histogram(self, name, description, buckets=DURATION_BUCKETS):
+        return self._add(Histogram(name, description, buckets))
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def render(self, snapshots=()):
+        """Exposition text, with counters and histograms summed over other processes' snapshots"""
+        snapshots = [snapshot['metrics'] for snapshot in snapshots]
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render(snapshots))
+        return '\n'.join(lines) + '\n'
+
+
+class ProcessStats:
+    """Metric snapshots of every process sharing a data directory, kept in SQLite.
+
+    Web and worker processes each ``publish`` their registry (plus any live stats,
+    such as stage slots) every few seconds, and whichever process serves /metrics
+    merges the others in. Pipeline work done by worker processes or by other
+    gunicorn workers is then counted too. A process that stops publishing drops
+    out after ``max_age`` seconds.
+    """
+
+    def __init__(self, path, registry, max_age=3600):
+        self.path = path
+        self.registry = registry
+        self.max_age = max_age
+        self.process_id = f'{socket.gethostname()}-{os.getpid()}'
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS processes (
+                    process_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def publish(self, **live):
+        now = time.time()
+        data = json.dumps({'metrics': self.registry.snapshot(), 'live': live})
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO processes VALUES (?, ?, ?)', (self.process_id, data, now))
+            conn.execute('DELETE FROM processes WHERE updated_at < ?', (now - self.max_age,))
+
+    def others(self, max_age=None):
+        """Latest snapshots of the other processes, published within max_age seconds"""
+        cutoff = time.time() - (max_age or self.max_age)
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT data FROM processes WHERE process_id != ? AND updated_at >= ?', (self.process_id, cutoff)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+class JobTimings:
+    """Per-job stage durations, collected while a job runs and attached to its record.
+
+    The pipeline marks which job a thread is working for with ``job(job_id)``; stage
+    timings recorded on that thread (or on threads started through ``wrap``) add up
+    under that job. Only the most recent ``max_jobs`` jobs are kept. ``running()``
+    lists the jobs a thread is working for, so they can be kept alive in the job store.
+    """
+
+    def __init__(self, max_jobs=2000):
+        self.max_jobs = max_jobs
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        # Number of threads currently working for each job
+        self._threads = {}
+
+    def current(self):
+        return getattr(self._local, 'job_id', None)
+
+    @contextmanager
+    def job(self, job_id):
+        previous = self.current()
+        self._local.job_id = job_id
+        with self._lock:
+            self._threads[job_id] = self._threads.get(job_id, 0) + 1
+        try:
+            yield
+        finally:
+            self._local.job_id = previous
+            with self._lock:
+                if self._threads[job_id] > 1:
+                    self._threads[job_id] -= 1
+                else:
+                    del self._threads[job_id]
+
+    def running(self):
+        """IDs of the jobs some thread in this process is working for right now"""
+        with self._lock:
+            return [job_id for job_id in self._threads if job_id]
+
+    def wrap(self, fn, job_id=None):
+        """Bind fn to a job (by default the current one) so timings recorded in another thread count too"""
+        job_id = job_id or self.current()
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with self.job(job_id):
+                return fn(*args, **kwargs)
+        return run
+
+    def record(self, stage, seconds, job_id=None):
+        job_id = job_id or self.current()
+        if not job_id:
+            return
+        with self._lock:
+            stages = self._jobs.pop(job_id, {})
+            stages[stage] = round(stages.get(stage, 0) + seconds, 3)
+            self._jobs[job_id] = stages
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+    def pop(self, job_id):
+        with self._lock:
+            return self._jobs.pop(job_id, {})
+
+
+registry = Registry()
+job_timings = JobTimings()
+
+STAGE_SECONDS = registry.histogram('ytmcq_stage_seconds', 'Time spent in each pipeline stage')
+UPLOAD_BYTES = registry.histogram('ytmcq_upload_bytes', 'Audio bytes sent to AssemblyAI per job', BYTE_BUCKETS)
+GROQ_TOKENS = registry.histogram('ytmcq_groq_tokens', 'Tokens per Groq call', TOKEN_BUCKETS)
+GROQ_ATTEMPTS = registry.counter('ytmcq_groq_attempts_total', 'Groq generation attempts by outcome')
+STRATEGY_FALLBACKS = registry.counter('ytmcq_strategy_fallbacks_total', 'Retries with a smaller Groq strategy')
+FALLBACK_CONTENT = registry.counter('ytmcq_fallback_content_total', 'Times the generic fallback MCQs/flashcards were served')
+JSON_REPAIRS = registry.counter('ytmcq_json_repairs_total', 'Truncated Groq responses salvaged item by item')
+ASSEMBLYAI_POLLS = registry.counter('ytmcq_assemblyai_polls_total', 'AssemblyAI transcript status checks')
+JOBS_FINISHED = registry.counter('ytmcq_jobs_total', 'Jobs that reached a terminal state')
+JOBS_COALESCED = registry.counter('ytmcq_jobs_coalesced_total', 'Requests attached to an identical in-flight job')
+JOBS_CANCELLED = registry.counter('ytmcq_jobs_cancelled_total', 'Jobs cancelled by their client or for abandonment, by stage')
+CANCEL_RECLAIMED = registry.counter('ytmcq_cancel_reclaimed_total', 'Pipeline work skipped or cut short by cancellation')
+CANCEL_GROQ_TOKENS = registry.counter(
+    'ytmcq_cancel_groq_tokens_total', 'Upper bound on Groq tokens not spent because their job was cancelled'
+)
+SCHEDULER_JOBS = registry.gauge('ytmcq_scheduler_jobs', 'Jobs running on or waiting for the worker pool')
+STAGE_SLOTS = registry.gauge('ytmcq_stage_slots', 'Per-stage concurrency slots in use and waiters')
+GROQ_BUDGET = registry.gauge('ytmcq_groq_budget', 'Groq rate budget: waiting calls, tokens available, pause')
+
+
+@contextmanager
+def timed(stage, **labels):
+    """Time a block into the stage histogram and the current job's stage timings"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+        job_timings.record(stage, seconds)
+
+
+def observe_stage(stage, seconds, job_id=None):
+    """Record a stage whose duration was measured elsewhere (e.g. across processes)"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    job_timings.record(stage, seconds, job_id)
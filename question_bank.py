@@ -0,0 +1,267 @@
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+
+from chunking import select_balanced
+
+# MinHash signature: NUM_PERM hash functions, split into BANDS bands for LSH lookup
+NUM_PERM = 32
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+PRIME = (1 << 61) - 1
+# Fixed seed: signatures are stored, so the hash functions must never change
+_rng = random.Random(20240601)
+PERMUTATIONS = [(_rng.randrange(1, PRIME), _rng.randrange(0, PRIME)) for _ in range(NUM_PERM)]
+
+# Words too common to say anything about what a video covers
+STOPWORDS = set("""
+about above after again against also because been before being below between both could does doing down during each
+from further have having here into itself just more most other over same should some such than that their them then
+there these they this those through under until very what when where which while will with would your yours
+""".split())
+
+# The field whose text identifies an item, per kind
+TEXT_KEYS = {'mcqs': 'question', 'flashcards': 'front'}
+DIFFICULTIES = ('easy', 'medium', 'hard')
+
+
+def shingles(text, size=4):
+    """Character n-grams of the normalised text; robust to small rewordings and any script"""
+    text = ' '.join(re.findall(r'\w+', (text or '').lower()))
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash(text):
+    hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles(text)]
+    if not hashes:
+        return [0] * NUM_PERM
+    return [min((a * h + b) % PRIME for h in hashes) for a, b in PERMUTATIONS]
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of the two texts behind the signatures"""
+    return sum(1 for x, y in zip(signature, other) if x == y) / NUM_PERM
+
+
+def band_keys(kind, signature):
+    return [
+        f"{kind}:{band}:{zlib.crc32(json.dumps(signature[band * ROWS:(band + 1) * ROWS]).encode()):08x}"
+        for band in range(BANDS)
+    ]
+
+
+def content_words(text):
+    return {word for word in re.findall(r'\w+', (text or '').lower()) if len(word) > 3 and word not in STOPWORDS}
+
+
+def item_text(item):
+    """Everything an item says, used to judge whether a transcript covers it"""
+    parts = [item.get('question') or item.get('front') or '', item.get('back') or '', item.get('explanation') or '']
+    parts.extend(option.split(')', 1)[-1] for option in item.get('options') or [] if isinstance(option, str))
+    return ' '.join(parts)
+
+
+class QuestionBank:
+    """Persistent bank of generated MCQs and flashcards, indexed by video, topic and difficulty.
+
+    Every item is stored once: near-duplicates (MinHash over character shingles,
+    looked up through LSH bands) are dropped on the way in. A later job for the same
+    video, or another video covering the same material, can be served from the bank
+    and only the shortfall is generated. Its counters are kept in the database, so
+    they add up across processes.
+    """
+
+    def __init__(self, path, ttl=90 * 24 * 3600, threshold=0.7, min_coverage=0.6):
+        self.path = path
+        self.ttl = ttl
+        self.threshold = threshold
+        self.min_coverage = min_coverage
+        self._lock = threading.Lock()
+        self._last_purge = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    video_id TEXT,
+                    language TEXT NOT NULL,
+                    topic TEXT,
+                    subject TEXT,
+                    difficulty TEXT,
+                    payload TEXT NOT NULL,
+                    signature TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_items_video ON items (kind, language, video_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_items_topic ON items (kind, language, topic, difficulty)')
+            conn.execute('CREATE TABLE IF NOT EXISTS bands (band TEXT NOT NULL, item_id INTEGER NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_bands ON bands (band)')
+            conn.execute('CREATE TABLE IF NOT EXISTS terms (term TEXT NOT NULL, item_id INTEGER NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_terms ON terms (term)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _count(conn, name, amount=1):
+        # Counters are kept in the database so every process adds to the same totals
+        if amount:
+            conn.execute(
+                'INSERT INTO counters VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+                (name, amount)
+            )
+
+    def _find_duplicate(self, conn, kind, signature):
+        keys = band_keys(kind, signature)
+        rows = conn.execute(
+            'SELECT DISTINCT items.id, items.signature FROM bands JOIN items ON items.id = bands.item_id '
+            'WHERE bands.band IN (%s)' % ','.join('?' * len(keys)), keys
+        ).fetchall()
+        for item_id, other in rows:
+            if similarity(signature, json.loads(other)) >= self.threshold:
+                return item_id
+        return None
+
+    def add(self, kind, video_id, language, items):
+        """Store new items, skipping near-duplicates of anything already banked; returns how many were added"""
+        text_key = TEXT_KEYS[kind]
+        language = language or 'en'
+        now = time.time()
+        added = 0
+
+        with self._lock, self._connect() as conn:
+            for item in items:
+                signature = minhash(item.get(text_key, ''))
+                if self._find_duplicate(conn, kind, signature) is not None:
+                    self._count(conn, 'duplicates')
+                    continue
+                cursor = conn.execute(
+                    'INSERT INTO items (kind, video_id, language, topic, subject, difficulty, payload, signature, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        kind, video_id, language,
+                        (item.get('topic') or '').strip().lower() or None,
+                        (item.get('subject') or '').strip().lower() or None,
+                        (item.get('difficulty') or '').strip().lower() or None,
+                        json.dumps(item, ensure_ascii=False), json.dumps(signature), now
+                    )
+                )
+                item_id = cursor.lastrowid
+                conn.executemany('INSERT INTO bands VALUES (?, ?)', [(key, item_id) for key in band_keys(kind, signature)])
+                terms = content_words(f"{item.get('topic') or ''} {item.get('subject') or ''}")
+                conn.executemany('INSERT INTO terms VALUES (?, ?)', [(term, item_id) for term in terms])
+                added += 1
+            self._count(conn, 'added', added)
+            self._purge(conn, now)
+        return added
+
+    def _purge(self, conn, now):
+        # Once a minute is plenty; the bank only grows by a few dozen rows per job
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        expired = [row[0] for row in conn.execute('SELECT id FROM items WHERE created_at < ?', (now - self.ttl,))]
+        for table, column in (('bands', 'item_id'), ('terms', 'item_id'), ('items', 'id')):
+            conn.executemany(f'DELETE FROM {table} WHERE {column} = ?', [(item_id,) for item_id in expired])
+
+    def lookup(self, kind, language, transcript, video_id=None, limit=None):
+        """Banked items this transcript covers, mixed across difficulty levels.
+
+        Items from the same video always qualify. Items from other videos qualify when
+        their topic terms appear in the transcript and at least ``min_coverage`` of
+        their own content words do too.
+        """
+        language = language or 'en'
+        words = content_words(transcript)
+        # The transcript's most frequent words pick the candidate topics
+        top_terms = [word for word, _ in Counter(
+            word for word in re.findall(r'\w+', transcript.lower()) if word in words
+        ).most_common(200)]
+        cutoff = time.time() - self.ttl
+
+        with self._connect() as conn:
+            same_video = []
+            if video_id:
+                same_video = conn.execute(
+                    'SELECT id, payload FROM items WHERE kind = ? AND language = ? AND video_id = ? AND created_at >= ?',
+                    (kind, language, video_id, cutoff)
+                ).fetchall()
+            related = []
+            if top_terms:
+                related = conn.execute(
+                    'SELECT DISTINCT items.id, items.payload FROM terms JOIN items ON items.id = terms.item_id '
+                    'WHERE terms.term IN (%s) AND items.kind = ? AND items.language = ? AND items.created_at >= ? '
+                    'AND (items.video_id IS NULL OR items.video_id != ?)' % ','.join('?' * len(top_terms)),
+                    (*top_terms, kind, language, cutoff, video_id or '')
+                ).fetchall()
+
+        by_difficulty = {level: [] for level in DIFFICULTIES + ('other',)}
+        for rows, check_coverage in ((same_video, False), (related, True)):
+            for _, payload in rows:
+                item = json.loads(payload)
+                if check_coverage and not self._covers(words, item):
+                    continue
+                level = (item.get('difficulty') or '').lower()
+                by_difficulty[level if level in by_difficulty else 'other'].append(item)
+
+        candidates = sum(len(items) for items in by_difficulty.values())
+        items = select_balanced(list(by_difficulty.values()), limit or candidates, TEXT_KEYS[kind])
+        if items:
+            with self._lock, self._connect() as conn:
+                self._count(conn, 'served', len(items))
+        return items
+
+    def _covers(self, words, item):
+        """True if the transcript mentions most of what the item is about"""
+        item_words = content_words(item_text(item))
+        if not item_words:
+            return False
+        return len(item_words & words) / len(item_words) >= self.min_coverage
+
+    def search(self, kind, video_id=None, topic=None, difficulty=None, language=None, limit=50, offset=0):
+        """Browse the bank by any of its indexes"""
+        clauses, params = ['kind = ?', 'created_at >= ?'], [kind, time.time() - self.ttl]
+        for column, value in (('video_id', video_id), ('topic', topic), ('difficulty', difficulty), ('language', language)):
+            if value:
+                clauses.append(f'{column} = ?')
+                params.append(value.lower() if column in ('topic', 'difficulty') else value)
+        where = ' AND '.join(clauses)
+
+        with self._connect() as conn:
+            total = conn.execute(f'SELECT COUNT(*) FROM items WHERE {where}', params).fetchone()[0]
+            rows = conn.execute(
+                f'SELECT video_id, payload FROM items WHERE {where} ORDER BY id LIMIT ? OFFSET ?', (*params, limit, offset)
+            ).fetchall()
+        return total, [dict(json.loads(payload), video_id=row_video) for row_video, payload in rows]
+
+    def stats(self):
+        with self._connect() as conn:
+            rows = conn.execute('SELECT kind, COUNT(*) FROM items GROUP BY kind').fetchall()
+            topics = conn.execute('SELECT COUNT(DISTINCT topic) FROM items').fetchone()[0]
+            counters = dict(conn.execute('SELECT name, value FROM counters').fetchall())
+        stats = {key: counters.get(key, 0) for key in ('served', 'added', 'duplicates')}
+        stats.update({'items': dict(rows), 'topics': topics, 'ttl': self.ttl, 'threshold': self.threshold})
+        return stats
@@ -0,0 +1,232 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+RESET_UNITS = {'ms': 0.001, 'h': 3600, 'm': 60, 's': 1}
+
+
+def parse_reset(value):
+    """Seconds in a rate-limit reset header such as "7.66s", "2m59.56s" or a bare "30" """
+    if not value:
+        return None
+    parts = re.findall(r'([\d.]+)(ms|h|m|s)', value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * RESET_UNITS[unit] for amount, unit in parts)
+
+
+def header_int(headers, name):
+    try:
+        return int(float(headers.get(name)))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBudget:
+    """Token buckets for an API's tokens-per-minute and requests-per-minute limits.
+
+    Callers ``acquire`` a grant before each request and wait until both buckets can
+    cover it. A grant reserves the prompt plus the share of ``max_completion`` that
+    responses have actually been using (learned from their usage, starting at all of
+    it). Waiters queue per job and jobs take turns, so one job's burst of chunk
+    requests can't starve the others. ``settle`` trues the reservation up to the real
+    usage and recalibrates from the provider's x-ratelimit-* headers, pausing
+    everyone after a 429. With ``path`` the bucket levels live in SQLite and are
+    shared by every process using the file.
+    """
+
+    def __init__(self, tokens_per_minute, requests_per_minute, path=None):
+        self.path = path
+        self._cond = threading.Condition()
+        self._queues = {}
+        self._turns = deque()
+        self._stats = {'granted': 0, 'waited_s': 0.0, 'max_wait_s': 0.0, 'throttled': 0}
+        self._completion_share = 1.0
+
+        state = {
+            'tpm': tokens_per_minute,
+            'rpm': requests_per_minute,
+            'tokens': tokens_per_minute,
+            'requests': requests_per_minute,
+            'updated': time.time(),
+            'paused_until': 0,
+        }
+        if not path:
+            self._state = state
+            return
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS budget (id INTEGER PRIMARY KEY CHECK (id = 0), state TEXT NOT NULL)')
+            conn.execute('INSERT OR IGNORE INTO budget VALUES (0, ?)', (json.dumps(state),))
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _update(self, fn):
+        """Apply fn to the bucket state (in memory, or in one SQLite transaction) and return its result"""
+        if not self.path:
+            return fn(self._state)
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            state = json.loads(conn.execute('SELECT state FROM budget WHERE id = 0').fetchone()[0])
+            result = fn(state)
+            conn.execute('UPDATE budget SET state = ? WHERE id = 0', (json.dumps(state),))
+        return result
+
+    @staticmethod
+    def _refill(state, now):
+        elapsed = max(0.0, now - state['updated'])
+        state['tokens'] = min(state['tpm'], state['tokens'] + elapsed * state['tpm'] / 60)
+        state['requests'] = min(state['rpm'], state['requests'] + elapsed * state['rpm'] / 60)
+        state['updated'] = now
+
+    def _take(self, state, tokens):
+        """Deduct one request of ``tokens`` and return 0, or return how long until it would fit"""
+        now = time.time()
+        self._refill(state, now)
+        if state['paused_until'] > now:
+            return state['paused_until'] - now
+        # A request bigger than the whole bucket would never fit; let it through on a full one
+        tokens = min(tokens, state['tpm'])
+        if state['tokens'] >= tokens and state['requests'] >= 1:
+            state['tokens'] -= tokens
+            state['requests'] -= 1
+            return 0
+        return max(
+            (tokens - state['tokens']) * 60 / state['tpm'],
+            (1 - state['requests']) * 60 / state['rpm'],
+            0.01
+        )
+
+    def acquire(self, prompt_tokens, max_completion=0, job_id=None, abandon=None):
+        """Block until the budget covers the request; returns its grant (tokens reserved, seconds waited).
+
+        ``abandon()`` is polled while waiting; once it returns True the request is
+        withdrawn from the queue and None is returned instead of a grant.
+        """
+        started = time.monotonic()
+        ticket = object()
+        with self._cond:
+            tokens = prompt_tokens + math.ceil(max_completion * self._completion_share)
+            queue = self._queues.setdefault(job_id, deque())
+            queue.append(ticket)
+            if job_id not in self._turns:
+                self._turns.append(job_id)
+
+            granted = False
+            while True:
+                wait = 1.0
+                if self._turns[0] == job_id and queue[0] is ticket:
+                    wait = self._update(lambda state: self._take(state, tokens))
+                    if wait == 0:
+                        granted = True
+                        break
+                if abandon and abandon():
+                    break
+                # Shared buckets are also drained by other processes, so keep re-checking
+                self._cond.wait(min(wait, 1.0) if self.path or abandon else wait)
+
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[job_id]
+                self._turns.remove(job_id)
+            elif granted:
+                # This job's turn is used up; it goes to the back of the line
+                self._turns.remove(job_id)
+                self._turns.append(job_id)
+            self._cond.notify_all()
+            if not granted:
+                return None
+
+            waited = time.monotonic() - started
+            self._stats['granted'] += 1
+            self._stats['waited_s'] += waited
+            self._stats['max_wait_s'] = max(self._stats['max_wait_s'], waited)
+        return {'tokens': tokens, 'max_completion': max_completion, 'waited': waited}
+
+    def settle(self, grant, usage=None, headers=None, status=200):
+        """True the grant up to the response's token usage and recalibrate from its rate-limit headers.
+
+        Without usage (a failed request) the whole reservation is refunded.
+        """
+        headers = headers or {}
+        usage = usage or {}
+        used = usage.get('total_tokens') or usage.get('prompt_tokens', 0) + usage.get('completion_tokens', 0)
+        now = time.time()
+
+        def apply(state):
+            self._refill(state, now)
+            state['tokens'] = min(state['tpm'], state['tokens'] + grant['tokens'] - used)
+
+            limit = header_int(headers, 'x-ratelimit-limit-tokens')
+            if limit:
+                state['tpm'] = limit
+            remaining = header_int(headers, 'x-ratelimit-remaining-tokens')
+            if remaining is not None:
+                state['tokens'] = min(state['tokens'], remaining)
+
+            pause = None
+            if status == 429:
+                pause = parse_reset(headers.get('retry-after')) or parse_reset(headers.get('x-ratelimit-reset-tokens')) or 1
+            elif header_int(headers, 'x-ratelimit-remaining-requests') == 0:
+                pause = parse_reset(headers.get('x-ratelimit-reset-requests'))
+            if pause:
+                state['paused_until'] = max(state['paused_until'], now + pause)
+
+        with self._cond:
+            self._update(apply)
+            if grant['max_completion'] and 'completion_tokens' in usage:
+                share = min(1.0, usage['completion_tokens'] / grant['max_completion'])
+                self._completion_share = max(0.05, 0.8 * self._completion_share + 0.2 * share)
+            if status == 429:
+                self._stats['throttled'] += 1
+            self._cond.notify_all()
+
+    def stats(self):
+        now = time.time()
+
+        def snapshot(state):
+            self._refill(state, now)
+            return dict(state)
+
+        with self._cond:
+            state = self._update(snapshot)
+            stats = dict(self._stats)
+            waiting = sum(len(queue) for queue in self._queues.values())
+            waiting_jobs = len(self._queues)
+
+        granted = stats['granted']
+        return {
+            'tokens_per_minute': state['tpm'],
+            'requests_per_minute': state['rpm'],
+            'tokens_available': int(state['tokens']),
+            'requests_available': round(state['requests'], 1),
+            'paused_for_s': round(max(0, state['paused_until'] - now), 1),
+            'waiting': waiting,
+            'waiting_jobs': waiting_jobs,
+            'granted': granted,
+            'throttled': stats['throttled'],
+            'avg_wait_s': round(stats['waited_s'] / granted, 3) if granted else 0.0,
+            'max_wait_s': round(stats['max_wait_s'], 3),
+            'completion_share': round(self._completion_share, 3),
+            'shared': bool(self.path),
+        }
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+def request_key(body):
+    """Stable hash of a JSON request body (model, messages, sampling params)"""
+    encoded = json.dumps(body, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class ResponseMemo:
+    """On-disk memo of upstream responses keyed by a hash of the full request body.
+
+    Retried and resubmitted jobs send byte-identical Groq requests; answering those
+    from here saves the call and its tokens. Entries expire after ``ttl`` seconds and
+    the least recently used ones are evicted once the store exceeds ``max_bytes``.
+    Its counters are kept in the database, so they add up across processes.
+    """
+
+    def __init__(self, path, ttl=24 * 3600, max_bytes=100 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _count(conn, name, amount=1):
+        # Counters are kept in the database so every process adds to the same totals
+        if amount:
+            conn.execute(
+                'INSERT INTO counters VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+                (name, amount)
+            )
+
+    def get(self, key):
+        """Return the memoized response for a request key, or None"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute('SELECT response, tokens, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row and now - row[2] > self.ttl:
+                conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._count(conn, 'evictions')
+                row = None
+            if row is None:
+                self._count(conn, 'misses')
+                return None
+            conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self._count(conn, 'hits')
+            self._count(conn, 'tokens_saved', row[1])
+        return json.loads(row[0])
+
+    def bypass(self):
+        """Count a lookup skipped because the caller asked for a fresh response"""
+        with self._lock, self._connect() as conn:
+            self._count(conn, 'bypassed')
+
+    def put(self, key, response):
+        usage = response.get('usage') or {}
+        tokens = usage.get('prompt_tokens', 0) + usage.get('completion_tokens', 0)
+        encoded = json.dumps(response, ensure_ascii=False)
+        size = len(encoded.encode('utf-8'))
+        now = time.time()
+
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, encoded, tokens, size, now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        self._count(conn, 'evictions', conn.execute(
+            'DELETE FROM responses WHERE created_at < ?', (now - self.ttl,)
+        ).rowcount)
+
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute('SELECT key, size FROM responses ORDER BY accessed_at ASC').fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            self._count(conn, 'evictions')
+
+    def stats(self):
+        with self._connect() as conn:
+            entries, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+            counters = dict(conn.execute('SELECT name, value FROM counters').fetchall())
+        stats = {key: counters.get(key, 0) for key in ('hits', 'misses', 'bypassed', 'tokens_saved', 'evictions')}
+
+        lookups = stats['hits'] + stats['misses']
+        stats.update({
+            'hit_rate': round(stats['hits'] / lookups, 3) if lookups else 0.0,
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+        })
+        return stats
@@ -0,0 +1,215 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
+
+# YouTube video IDs are always 11 characters from this alphabet
+VIDEO_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+# Path prefixes that are followed directly by the video ID
+PATH_PREFIXES = ('shorts', 'embed', 'v', 'e', 'live')
+
+
+def extract_video_id(youtube_url):
+    """Return the canonical 11-char video ID for any common YouTube URL form, or None"""
+    if not youtube_url:
+        return None
+
+    url = youtube_url.strip()
+    if VIDEO_ID_RE.match(url):
+        return url
+    if '://' not in url:
+        url = 'https://' + url
+
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return None
+
+    host = (parsed.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    parts = [p for p in parsed.path.split('/') if p]
+
+    candidate = None
+    if host == 'youtu.be':
+        # youtu.be/<id>?t=42
+        candidate = parts[0] if parts else None
+    elif host.endswith('youtube.com') or host.endswith('youtube-nocookie.com'):
+        if parts and parts[0] == 'watch':
+            # watch?v=<id>&t=42s&list=...
+            candidate = parse_qs(parsed.query).get('v', [None])[0]
+        elif len(parts) >= 2 and parts[0] in PATH_PREFIXES:
+            # shorts/<id>, embed/<id>, live/<id>
+            candidate = parts[1]
+
+    if candidate and VIDEO_ID_RE.match(candidate):
+        return candidate
+    return None
+
+
+class ResultCache:
+    """Persistent SQLite cache of transcripts, MCQs and flashcards keyed by video ID + language.
+
+    Each kind of payload is stored as its own row so a transcript can be reused even
+    when the generated content has expired or failed. Entries older than ``ttl`` seconds
+    are ignored, and the least recently used rows are evicted once the total payload
+    size goes over ``max_bytes``. Hit/miss and eviction counts are kept in the
+    database too, so they add up across every process sharing it.
+    """
+
+    KINDS = ('transcript', 'mcqs', 'flashcards')
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_bytes=200 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    video_id TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (video_id, language, kind)
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_results_accessed ON results (accessed_at)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _count(conn, name, amount=1):
+        # Counters are kept in the database so every process adds to the same totals
+        if amount:
+            conn.execute(
+                'INSERT INTO counters VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+                (name, amount)
+            )
+
+    @staticmethod
+    def _language_key(language):
+        # None means "auto-detect", which is its own cache slot
+        return language or 'auto'
+
+    def get(self, video_id, language, kind, count=True):
+        """Return the cached payload for (video_id, language, kind), or None on a miss.
+
+        With count=False the lookup is left out of the hit/miss stats.
+        """
+        language = self._language_key(language)
+        now = time.time()
+        payload = None
+
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                'SELECT payload, created_at FROM results WHERE video_id = ? AND language = ? AND kind = ?',
+                (video_id, language, kind)
+            ).fetchone()
+
+            if row and now - row[1] > self.ttl:
+                conn.execute(
+                    'DELETE FROM results WHERE video_id = ? AND language = ? AND kind = ?',
+                    (video_id, language, kind)
+                )
+                self._count(conn, 'evictions')
+                row = None
+
+            if row:
+                conn.execute(
+                    'UPDATE results SET accessed_at = ? WHERE video_id = ? AND language = ? AND kind = ?',
+                    (now, video_id, language, kind)
+                )
+                payload = json.loads(row[0])
+            if count:
+                self._count(conn, f"{kind}.{'hits' if row else 'misses'}")
+
+        return payload
+
+    def count_hits(self, *kinds):
+        """Record hits for lookups made with count=False"""
+        with self._lock, self._connect() as conn:
+            for kind in kinds:
+                self._count(conn, f'{kind}.hits')
+
+    def put(self, video_id, language, kind, payload):
+        """Store a payload and evict least recently used rows if over the size budget"""
+        language = self._language_key(language)
+        encoded = json.dumps(payload, ensure_ascii=False)
+        size = len(encoded.encode('utf-8'))
+        now = time.time()
+
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (video_id, language, kind, encoded, size, now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        expired = conn.execute('DELETE FROM results WHERE created_at < ?', (now - self.ttl,)).rowcount
+        self._count(conn, 'evictions', expired)
+
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = conn.execute(
+            'SELECT video_id, language, kind, size FROM results ORDER BY accessed_at ASC'
+        ).fetchall()
+        for video_id, language, kind, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute(
+                'DELETE FROM results WHERE video_id = ? AND language = ? AND kind = ?',
+                (video_id, language, kind)
+            )
+            total -= size
+            self._count(conn, 'evictions')
+
+    def stats(self):
+        """Hit/miss counters per payload kind plus current size of the store"""
+        with self._connect() as conn:
+            entries, total = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results'
+            ).fetchone()
+            counters = dict(conn.execute('SELECT name, value FROM counters').fetchall())
+        stats = {
+            kind: {key: counters.get(f'{kind}.{key}', 0) for key in ('hits', 'misses')} for kind in self.KINDS
+        }
+        stats['evictions'] = counters.get('evictions', 0)
+
+        hits = sum(stats[kind]['hits'] for kind in self.KINDS)
+        misses = sum(stats[kind]['misses'] for kind in self.KINDS)
+        stats.update({
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+        })
+        return stats
@@ -0,0 +1,256 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the scheduler queue is at capacity"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a pipeline stage that finds its job has been cancelled"""
+
+
+class JobScheduler:
+    """Fixed-size worker pool fed by a bounded FIFO queue.
+
+    Unlike ``ThreadPoolExecutor`` the queue is inspectable, so callers can tell a
+    waiting job where it stands and new submissions can be refused when it's full.
+    """
+
+    def __init__(self, workers=8, max_queue=50, name='pipeline', on_start=None):
+        self.workers = workers
+        self.max_queue = max_queue
+        # Called as on_start(job_id, seconds_waited) when a worker picks a job up
+        self.on_start = on_start
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._active = 0
+        self._threads = []
+
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f'{name}-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job_id, fn, *args):
+        """Queue fn(*args) and return the 1-based queue position, or raise QueueFull"""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                raise QueueFull(f"Job queue is full ({self.max_queue} waiting)")
+            self._queue.append((job_id, fn, args, time.monotonic()))
+            self._cond.notify()
+            return len(self._queue)
+
+    def position(self, job_id):
+        """1-based position of a waiting job, or None once it has started (or is unknown)"""
+        with self._cond:
+            for index, (queued_id, _, _, _) in enumerate(self._queue):
+                if queued_id == job_id:
+                    return index + 1
+        return None
+
+    def waiting(self):
+        """IDs of the jobs still waiting for a worker"""
+        with self._cond:
+            return [entry[0] for entry in self._queue]
+
+    def remove(self, job_id):
+        """Drop a job that's still waiting; returns True if it was in the queue"""
+        with self._cond:
+            for entry in self._queue:
+                if entry[0] == job_id:
+                    self._queue.remove(entry)
+                    return True
+        return False
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job_id, fn, args, queued_at = self._queue.popleft()
+                self._active += 1
+            try:
+                if self.on_start:
+                    self.on_start(job_id, time.monotonic() - queued_at)
+                fn(*args)
+            except Exception as e:
+                # The pipeline records its own errors; this only guards the worker thread
+                print(f"Job {job_id} crashed: {e}")
+            finally:
+                with self._cond:
+                    self._active -= 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'active': self._active,
+                'queued': len(self._queue),
+                'max_queue': self.max_queue,
+            }
+
+
+class StageLimiter:
+    """Per-stage concurrency caps so one slow stage can't starve the others"""
+
+    def __init__(self, limits):
+        self.limits = dict(limits)
+        self._semaphores = {stage: threading.BoundedSemaphore(limit) for stage, limit in self.limits.items()}
+        self._lock = threading.Lock()
+        self._in_use = {stage: 0 for stage in self.limits}
+        self._waiting = {stage: 0 for stage in self.limits}
+
+    @contextmanager
+    def stage(self, name):
+        """Hold one slot of the named stage for the duration of the block"""
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            yield
+            return
+
+        with self._lock:
+            self._waiting[name] += 1
+        semaphore.acquire()
+        with self._lock:
+            self._waiting[name] -= 1
+            self._in_use[name] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_use[name] -= 1
+            semaphore.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                stage: {'limit': self.limits[stage], 'in_use': self._in_use[stage], 'waiting': self._waiting[stage]}
+                for stage in self.limits
+            }
+
+
+class TimerQueue:
+    """One background thread that runs one-shot delayed callbacks.
+
+    Used for work that only needs to happen occasionally (e.g. fallback status
+    checks), so waiting jobs don't each park a worker thread in ``time.sleep``.
+    """
+
+    def __init__(self, name='timers'):
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def schedule(self, delay, fn, *args):
+        """Run fn(*args) on the timer thread after ``delay`` seconds"""
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), fn, args))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                remaining = self._heap[0][0] - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                _, _, fn, args = heapq.heappop(self._heap)
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Timer callback {getattr(fn, '__name__', fn)} failed: {e}")
+
+    def stats(self):
+        with self._cond:
+            return {'pending': len(self._heap)}
+
+
+class CancelTokens:
+    """Per-job cancellation flags that pipeline stages check between (and during) steps.
+
+    ``cancel`` flags a job in this process and wakes anything waiting on it. A job
+    cancelled by another process is noticed through ``is_cancelled(job_id)``, a
+    shared-store lookup made at most every ``recheck`` seconds per job.
+    """
+
+    def __init__(self, is_cancelled=None, recheck=2.0, max_jobs=10000):
+        self.is_cancelled = is_cancelled
+        self.recheck = recheck
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._events = OrderedDict()
+        self._checked = {}
+
+    def _event(self, job_id):
+        with self._lock:
+            event = self._events.get(job_id)
+            if event is None:
+                event = self._events[job_id] = threading.Event()
+                while len(self._events) > self.max_jobs:
+                    stale, _ = self._events.popitem(last=False)
+                    self._checked.pop(stale, None)
+            return event
+
+    def cancel(self, job_id):
+        self._event(job_id).set()
+
+    def is_set(self, job_id):
+        """True if the job was cancelled in this process (no store lookup)"""
+        with self._lock:
+            event = self._events.get(job_id)
+        return bool(event and event.is_set())
+
+    def cancelled(self, job_id):
+        if not job_id:
+            return False
+        event = self._event(job_id)
+        if event.is_set():
+            return True
+        if self.is_cancelled is None:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked.get(job_id, -self.recheck) < self.recheck:
+                return False
+            self._checked[job_id] = now
+        if self.is_cancelled(job_id):
+            event.set()
+            return True
+        return False
+
+    def check(self, job_id):
+        """Raise JobCancelled if the job has been cancelled"""
+        if self.cancelled(job_id):
+            raise JobCancelled(f"Job {job_id} was cancelled")
+
+    def wait(self, job_id, seconds):
+        """Sleep for up to ``seconds``; returns True as soon as the job is cancelled"""
+        deadline = time.monotonic() + seconds
+        event = self._event(job_id)
+        while not self.cancelled(job_id):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            event.wait(min(remaining, self.recheck))
+        return True
+
+    def discard(self, job_id):
+        with self._lock:
+            self._events.pop(job_id, None)
+            self._checked.pop(job_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tracked': len(self._events),
+                'cancelled': sum(1 for event in self._events.values() if event.is_set()),
+            }
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# app.py opens its stores under DATA_DIR when imported; keep them out of the repo
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='ytmcq-tests-'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
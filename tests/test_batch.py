@@ -0,0 +1,16 @@
+import uuid
+
+import app as ytmcq
+
+
+def test_batch_progress_counts_every_finished_child():
+    children = [{'job_id': str(uuid.uuid4()), 'url': f'https://youtu.be/video{i:06d}'} for i in range(4)]
+    for child, status in zip(children, ('completed', 'error', 'cancelled')):
+        ytmcq.job_store.set(child['job_id'], {'status': status})
+    batch_id = str(uuid.uuid4())
+    ytmcq.job_store.set(batch_id, {'status': 'running', 'type': 'batch', 'children': children, 'next_child': 3})
+
+    data = ytmcq.app.test_client().get(f'/batch/{batch_id}').get_json()
+    assert (data['completed'], data['failed'], data['cancelled']) == (1, 1, 1)
+    assert data['progress'] == 75
+    assert data['by_status']['pending'] == 1
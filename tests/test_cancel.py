@@ -0,0 +1,35 @@
+import uuid
+
+import app as ytmcq
+
+
+def coalesced_job(followers):
+    owner = str(uuid.uuid4())
+    flight = f'{owner}:en'
+    ytmcq.job_store.create(owner, {'status': 'queued'}, flight)
+    ytmcq.job_store.update(owner, status='generating_content')
+    aliases = [str(uuid.uuid4()) for _ in range(followers)]
+    for alias in aliases:
+        assert ytmcq.job_store.create(alias, {'status': 'queued'}, flight) == owner
+    return owner, aliases
+
+
+def test_job_keeps_running_while_anyone_follows_it():
+    owner, (first, second) = coalesced_job(2)
+
+    assert ytmcq.cancel_job(first) == 'detached'
+    assert ytmcq.cancel_job(owner) == 'detached'
+    assert ytmcq.job_store.get(owner)['status'] == 'generating_content'
+    assert ytmcq.job_store.followers(owner) == [second]
+
+    # The last follower takes the job down with it
+    assert ytmcq.cancel_job(second) == 'cancelled'
+    assert ytmcq.job_store.get(owner)['cancelled_at']
+    assert ytmcq.cancel_job(second) == 'cancelled'
+
+
+def test_unshared_job_is_cancelled():
+    owner, _ = coalesced_job(0)
+    assert ytmcq.cancel_job(owner) == 'cancelled'
+    assert ytmcq.job_store.get(owner)['status'] == 'cancelled'
+    assert ytmcq.cancel_job('missing') is None
@@ -0,0 +1,66 @@
+import json
+
+from app import captions_to_text, pick_caption_track
+
+JSON3 = [{'ext': 'json3', 'url': 'https://example.test/c.json3'}]
+
+
+def test_manual_subtitles_win():
+    info = {
+        'language': 'en',
+        'subtitles': {'en-GB': JSON3},
+        'automatic_captions': {'en-orig': JSON3, 'en': JSON3},
+    }
+    assert pick_caption_track(info) == ('en', JSON3, False)
+
+
+def test_auto_captions_only_in_the_original_language():
+    info = {'automatic_captions': {'es-orig': JSON3, 'es': JSON3, 'en': JSON3, 'fr': JSON3}}
+
+    assert pick_caption_track(info) == ('es', JSON3, True)
+    assert pick_caption_track(info, 'es') == ('es', JSON3, True)
+    # The other auto tracks are machine translations of the Spanish captions
+    assert pick_caption_track(info, 'en') is None
+    assert pick_caption_track(info, 'fr') is None
+
+
+def test_auto_captions_with_known_language():
+    info = {'language': 'en-US', 'automatic_captions': {'en': JSON3, 'de': JSON3}}
+
+    assert pick_caption_track(info) is None
+    assert pick_caption_track(info, 'en') == ('en', JSON3, True)
+    assert pick_caption_track(info, 'de') is None
+
+
+def test_no_language_no_captions():
+    assert pick_caption_track({'automatic_captions': {'en': JSON3}}) is None
+    assert pick_caption_track({}, 'en') is None
+
+
+def test_json3_captions_to_text():
+    content = json.dumps({'events': [
+        {'segs': [{'utf8': 'Hello '}, {'utf8': 'world.'}]},
+        {'segs': [{'utf8': '\n'}]},
+        {},
+        {'segs': [{'utf8': 'Second  line.'}]},
+    ]})
+    assert captions_to_text(content, 'json3') == 'Hello world. Second line.'
+
+
+def test_vtt_captions_to_text():
+    content = """WEBVTT
+Kind: captions
+Language: en
+
+1
+00:00:00.000 --> 00:00:02.000
+<c>Hello</c> there
+
+00:00:02.000 --> 00:00:04.000
+Hello there
+
+NOTE a comment
+00:00:04.000 --> 00:00:06.000
+General Kenobi
+"""
+    assert captions_to_text(content, 'vtt') == 'Hello there General Kenobi'
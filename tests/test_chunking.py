@@ -0,0 +1,61 @@
+from chunking import CHARS_PER_TOKEN, chunk_budget, select_balanced, split_transcript
+
+
+def test_short_transcript_is_one_chunk():
+    assert split_transcript('  One sentence.  ', 100) == ['One sentence.']
+    assert split_transcript('   ', 100) == []
+
+
+def test_split_keeps_every_word_within_budget():
+    text = '\n\n'.join(' '.join(f'Sentence {p}-{s} about photons.' for s in range(20)) for p in range(5))
+    chunks = split_transcript(text, 50)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 50 * CHARS_PER_TOKEN for chunk in chunks)
+    assert ' '.join(chunks).split() == text.split()
+
+
+def test_split_prefers_sentence_boundaries():
+    text = 'First sentence here. Second one here. Third one here.'
+    assert split_transcript(text, 6) == ['First sentence here.', 'Second one here.', 'Third one here.']
+
+
+def test_split_devanagari_danda():
+    text = 'पहिलो वाक्य यहाँ छ। दोस्रो वाक्य यहाँ छ। तेस्रो वाक्य यहाँ छ।'
+    chunks = split_transcript(text, 6)
+    assert chunks[0] == 'पहिलो वाक्य यहाँ छ।'
+    assert ' '.join(chunks) == text
+
+
+def test_unpunctuated_text_is_cut_at_words():
+    text = ' '.join(['word'] * 200)
+    chunks = split_transcript(text, 10)
+    assert all(len(chunk) <= 40 for chunk in chunks)
+    assert sum(len(chunk.split()) for chunk in chunks) == 200
+
+
+def test_chunk_budget_bounds():
+    short = 'x' * 400
+    long = 'x' * 400000
+    assert chunk_budget(short, 1000, 6000, 8) == 1000
+    assert chunk_budget(long, 1000, 6000, 8) == 6000
+    assert chunk_budget('x' * 96000, 1000, 6000, 8) == 3000
+
+
+def test_select_balanced_round_robins_over_chunks():
+    chunks = [
+        [{'q': 'alpha one'}, {'q': 'alpha two'}, {'q': 'alpha three'}],
+        [{'q': 'beta one'}],
+        [{'q': 'gamma one'}, {'q': 'gamma two'}],
+    ]
+    selected = select_balanced(chunks, 4, 'q')
+    assert [item['q'] for item in selected] == ['alpha one', 'beta one', 'gamma one', 'alpha two']
+
+
+def test_select_balanced_skips_near_duplicates():
+    chunks = [
+        [{'q': 'What is the capital of France?'}, {'q': 'Why is the sky blue?'}],
+        [{'q': 'what is the capital of france'}],
+    ]
+    seen = [{'why', 'is', 'the', 'sky', 'blue'}]
+    assert select_balanced(chunks, 5, 'q', seen) == [{'q': 'What is the capital of France?'}]
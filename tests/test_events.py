@@ -0,0 +1,23 @@
+import threading
+import uuid
+
+import app as ytmcq
+
+
+def test_event_streams_are_capped(monkeypatch):
+    monkeypatch.setattr(ytmcq, '_sse_slots', threading.BoundedSemaphore(1))
+    job_id = str(uuid.uuid4())
+    ytmcq.job_store.create(job_id, {'status': 'completed'})
+    client = ytmcq.app.test_client()
+
+    first = client.get(f'/events/{job_id}', buffered=False)
+    assert first.status_code == 200
+    refused = client.get(f'/events/{job_id}')
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After']
+
+    # Closing the stream gives its slot back
+    first.close()
+    again = client.get(f'/events/{job_id}')
+    assert again.status_code == 200
+    assert b'"completed"' in again.data
@@ -0,0 +1,55 @@
+import threading
+import time
+
+import pytest
+
+from http_clients import buffered_body
+
+
+def test_buffered_body_passes_chunks_through_in_order():
+    chunks = [bytes([i]) * 10 for i in range(50)]
+    assert list(buffered_body(iter(chunks), max_buffer_bytes=30, chunk_size=10)) == chunks
+
+
+def test_buffered_body_reads_ahead_only_up_to_the_buffer():
+    produced = []
+
+    def chunks():
+        for i in range(100):
+            produced.append(i)
+            yield b'x' * 10
+
+    body = buffered_body(chunks(), max_buffer_bytes=40, chunk_size=10)
+    next(body)
+    time.sleep(0.2)
+    # One handed out, four buffered and one blocked on the full buffer
+    assert len(produced) <= 6
+    body.close()
+
+
+def test_buffered_body_reraises_producer_errors():
+    def chunks():
+        yield b'a'
+        raise IOError('download broke')
+
+    body = buffered_body(chunks())
+    assert next(body) == b'a'
+    with pytest.raises(IOError, match='download broke'):
+        next(body)
+
+
+def test_buffered_body_lets_the_producer_go_when_the_consumer_stops():
+    finished = threading.Event()
+
+    def chunks():
+        try:
+            while True:
+                yield b'x'
+        finally:
+            finished.set()
+
+    body = buffered_body(chunks(), max_buffer_bytes=2, chunk_size=1)
+    next(body)
+    body.close()
+    # The producer notices within its one-second put timeout
+    assert finished.wait(3)
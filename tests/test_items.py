@@ -0,0 +1,51 @@
+import json
+
+from app import ItemStream, parse_items
+
+ITEMS = [
+    {'question': 'What does {x} mean?', 'options': ['a', 'b'], 'answer': 'a'},
+    {'question': 'Quote: "}" and \\ escapes', 'options': [], 'answer': 'b'},
+    {'question': 'Nested', 'meta': {'tags': ['x', {'y': 1}]}, 'answer': 'c'},
+]
+DOCUMENT = json.dumps({'questions': ITEMS, 'note': 'done'})
+
+
+def test_parse_items_whole_document():
+    assert parse_items(DOCUMENT, 'questions') == ITEMS
+
+
+def test_parse_items_keeps_items_before_truncation():
+    cut = DOCUMENT.index('Nested') - 5
+    assert parse_items(DOCUMENT[:cut], 'questions') == ITEMS[:2]
+
+
+def test_parse_items_without_items_array():
+    assert parse_items('{"answer": "no items"', 'questions') == []
+    assert parse_items('not json at all', 'questions') == []
+
+
+def test_item_stream_yields_items_as_they_close():
+    stream = ItemStream('questions')
+    received = []
+    for i in range(0, len(DOCUMENT), 7):
+        received.extend(stream.feed(DOCUMENT[i:i + 7]))
+    assert received == ITEMS
+    assert stream.done
+
+
+def test_item_stream_one_character_at_a_time():
+    stream = ItemStream('questions')
+    received = [item for char in 'noise ' + DOCUMENT for item in stream.feed(char)]
+    assert received == ITEMS
+
+
+def test_item_stream_ignores_text_after_the_array():
+    stream = ItemStream('questions')
+    tail = ', "more": [{"question": "not an item"}]}'
+    received = stream.feed(json.dumps({'questions': ITEMS[:1]})[:-1] + tail)
+    assert received == ITEMS[:1]
+
+
+def test_item_stream_skips_undecodable_items():
+    stream = ItemStream('questions')
+    assert stream.feed('{"questions": [{"bad": tru}, {"ok": 1}]}') == [{'ok': 1}]
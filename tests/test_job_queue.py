@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from job_queue import SQLiteJobQueue
+from scheduler import QueueFull
+
+
+def process(*args):
+    pass
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / 'queue.db'), max_queue=2, visibility_timeout=0.2, max_attempts=2, retry_delay=0)
+
+
+def test_lease_hands_out_each_task_once(queue):
+    queue.submit('job', process, 'url', 'job')
+
+    task = queue.lease('w1')
+    assert task['job_id'] == 'job'
+    assert task['task'] == 'process'
+    assert task['args'] == ['url', 'job']
+    assert task['attempts'] == 1
+    assert queue.lease('w2') is None
+
+
+def test_expired_lease_is_redelivered(queue):
+    queue.submit('job', process)
+    first = queue.lease('w1')
+    time.sleep(0.3)
+
+    second = queue.lease('w2')
+    assert second['id'] == first['id']
+    assert second['attempts'] == 2
+
+    # Out of attempts: never handed out again, and reported once its lease runs out
+    time.sleep(0.3)
+    assert queue.lease('w3') is None
+    assert queue.expired() == ['job']
+    assert queue.stats()['active'] == queue.stats()['queued'] == 0
+
+
+def test_extended_lease_is_not_redelivered(queue):
+    queue.submit('job', process)
+    task = queue.lease('w1')
+    for _ in range(3):
+        time.sleep(0.1)
+        queue.extend([task['id']])
+    assert queue.lease('w2') is None
+
+    queue.ack(task['id'])
+    time.sleep(0.3)
+    assert queue.lease('w2') is None
+
+
+def test_failed_task_is_retried_until_out_of_attempts(queue):
+    queue.submit('job', process)
+    assert queue.fail(queue.lease('w1'))
+    assert queue.fail(queue.lease('w1')) is False
+    assert queue.lease('w1') is None
+
+
+def test_full_queue_refuses_new_jobs_but_not_follow_ups(queue):
+    queue.submit('a', process)
+    queue.submit('b', process)
+    with pytest.raises(QueueFull):
+        queue.submit('c', process)
+
+    queue.submit('a', process, delay=60)
+    assert queue.stats()['scheduled'] == 1
+    assert queue.position('b') == 2
+
+
+def test_remove_drops_only_unleased_tasks(queue):
+    queue.submit('job', process)
+    queue.submit('other', process)
+    queue.lease('w1')
+
+    assert queue.remove('job') is False
+    assert queue.remove('other') is True
+    assert queue.waiting() == []
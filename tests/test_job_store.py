@@ -0,0 +1,122 @@
+import threading
+
+import pytest
+
+from job_store import MemoryJobStore, SQLiteJobStore
+from metrics import JobTimings
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryJobStore()
+    return SQLiteJobStore(str(tmp_path / 'jobs.db'))
+
+
+def test_transition_only_from_expected_status(store):
+    store.set('job', {'status': 'processing', 'transcript_id': 't1'})
+
+    assert store.transition('job', 'processing', status='transcribed')
+    assert not store.transition('job', 'processing', status='transcribed')
+    assert store.get('job') == {'status': 'transcribed', 'transcript_id': 't1'}
+    assert not store.transition('missing', 'processing', status='transcribed')
+
+
+def test_transition_has_one_winner(store):
+    store.set('job', {'status': 'processing'})
+    won = []
+    barrier = threading.Barrier(8)
+
+    def claim():
+        barrier.wait()
+        if store.transition('job', 'processing', status='transcribed'):
+            won.append(True)
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(won) == 1
+
+
+def test_stale_jobs_are_interrupted_but_aliases_are_not(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / 'jobs.db'), stale_after=0.01)
+    store.set('job', {'status': 'processing'})
+    store.set('alias', {'status': 'queued', 'alias_of': 'job'})
+    store.set('done', {'status': 'completed'})
+    threading.Event().wait(0.05)
+
+    assert store.get('job')['status'] == 'error'
+    assert store.get('alias')['status'] == 'queued'
+    assert store.get('done')['status'] == 'completed'
+
+
+def test_rewritten_jobs_are_not_stale(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / 'jobs.db'), stale_after=0.1)
+    store.set('job', {'status': 'queued'})
+    for _ in range(3):
+        threading.Event().wait(0.05)
+        assert store.transition('job', 'queued')
+    assert store.get('job')['status'] == 'queued'
+
+
+def test_touched_jobs_are_not_stale(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / 'jobs.db'), stale_after=0.1)
+    store.create('job', {'status': 'downloading', 'video': {'title': 'T'}}, 'flight')
+    timings = JobTimings()
+    with timings.job('job'):
+        # A job blocked on a slot or a download writes nothing; its heartbeat keeps it alive
+        for _ in range(3):
+            threading.Event().wait(0.05)
+            store.touch(timings.running())
+    assert timings.running() == []
+
+    assert store.get('job') == {'status': 'downloading', 'video': {'title': 'T'}}
+    assert store.create('again', {'status': 'queued'}, 'flight') == 'job'
+def test_create_joins_active_flight(store):
+    assert store.create('owner', {'status': 'queued', 'read_at': 1}, 'video:en') is None
+    assert store.create('alias', {'status': 'queued', 'read_at': 2}, 'video:en') == 'owner'
+    assert store.get('alias') == {'status': 'queued', 'alias_of': 'owner', 'read_at': 2}
+    assert store.create('other', {'status': 'queued'}, 'video:fr') is None
+    assert store.stats()['flights'] == 2
+
+
+def test_create_starts_afresh_once_owner_ends(store):
+    store.create('owner', {'status': 'queued'}, 'video:en')
+    store.update('owner', status='completed')
+
+    assert store.create('next', {'status': 'queued'}, 'video:en') is None
+    assert store.create('alias', {'status': 'queued'}, 'video:en') == 'next'
+
+    store.update('next', status='cancelled', cancelled_at=1)
+    assert store.create('last', {'status': 'queued'}, 'video:en') is None
+
+
+def test_one_owner_across_store_instances(tmp_path):
+    # Separate instances share nothing but the file, like separate web processes
+    path = str(tmp_path / 'jobs.db')
+    stores = [SQLiteJobStore(path) for _ in range(6)]
+    owners = []
+    barrier = threading.Barrier(len(stores))
+
+    def claim(i):
+        barrier.wait()
+        owners.append(stores[i].create(f'job{i}', {'status': 'queued'}, 'video:en'))
+
+    threads = [threading.Thread(target=claim, args=(i,)) for i in range(len(stores))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert owners.count(None) == 1
+    assert len(set(owners) - {None}) == 1
+def test_followers_are_unfinished_aliases(store):
+    store.create('owner', {'status': 'queued'}, 'video:en')
+    store.create('a', {'status': 'queued'}, 'video:en')
+    store.create('b', {'status': 'queued'}, 'video:en')
+    store.set('b', {'status': 'cancelled'})
+
+    assert store.followers('owner') == ['a']
+    assert store.followers('a') == []
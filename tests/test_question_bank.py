@@ -0,0 +1,71 @@
+import pytest
+
+from question_bank import QuestionBank
+
+
+def mcq(question, topic='photosynthesis', difficulty='easy', options=('A) light', 'B) water')):
+    return {'question': question, 'options': list(options), 'topic': topic, 'difficulty': difficulty}
+
+
+@pytest.fixture
+def bank(tmp_path):
+    return QuestionBank(str(tmp_path / 'bank.db'))
+
+
+def test_near_duplicates_are_banked_once(bank):
+    added = bank.add('mcqs', 'vid1', 'en', [
+        mcq('What do plants need for photosynthesis?'),
+        mcq('What do plants need for photosynthesis ?'),
+        mcq('Which gas do plants release during photosynthesis?'),
+    ])
+    assert added == 2
+    assert bank.add('mcqs', 'vid2', 'en', [mcq('what do plants need for photosynthesis')]) == 0
+    assert bank.stats()['items'] == {'mcqs': 2}
+
+
+def test_kinds_are_kept_apart(bank):
+    bank.add('mcqs', 'vid', 'en', [mcq('What is chlorophyll?')])
+    assert bank.add('flashcards', 'vid', 'en', [{'front': 'What is chlorophyll?', 'back': 'A pigment'}]) == 1
+
+
+def test_lookup_serves_same_video_items(bank):
+    bank.add('mcqs', 'vid', 'en', [mcq('What colour is chlorophyll?'), mcq('Where does the Calvin cycle run?', difficulty='hard')])
+
+    items = bank.lookup('mcqs', 'en', 'An unrelated transcript about rivers.', video_id='vid')
+    assert {item['question'] for item in items} == {'What colour is chlorophyll?', 'Where does the Calvin cycle run?'}
+    assert bank.lookup('mcqs', 'fr', 'Anything', video_id='vid') == []
+    assert len(bank.lookup('mcqs', 'en', 'Anything', video_id='vid', limit=1)) == 1
+
+
+def test_lookup_serves_other_videos_only_when_the_transcript_covers_them(bank):
+    bank.add('mcqs', 'other', 'en', [mcq(
+        'Which pigment absorbs light during photosynthesis?', options=('A) chlorophyll', 'B) carotene'),
+    )])
+    covering = 'Photosynthesis uses light. The pigment chlorophyll absorbs light; carotene helps. ' * 3
+    unrelated = 'Photosynthesis was mentioned once, then we talked about medieval castles and kings. ' * 3
+
+    assert len(bank.lookup('mcqs', 'en', covering, video_id='vid')) == 1
+    assert bank.lookup('mcqs', 'en', unrelated, video_id='vid') == []
+
+
+def test_search_by_index(bank):
+    bank.add('mcqs', 'vid', 'en', [
+        mcq('What is a photon?', topic='Light', difficulty='Hard'),
+        mcq('What is an electron?', topic='atoms'),
+    ])
+    total, items = bank.search('mcqs', topic='light')
+    assert total == 1
+    assert items[0]['question'] == 'What is a photon?'
+    assert items[0]['video_id'] == 'vid'
+    assert bank.search('mcqs', difficulty='hard')[0] == 1
+    assert bank.search('mcqs', video_id='vid', limit=1, offset=1)[1][0]['question'] == 'What is an electron?'
+
+
+def test_bank_stats_add_up_across_processes(tmp_path):
+    path = str(tmp_path / 'bank.db')
+    QuestionBank(path).add('mcqs', 'vid', 'en', [mcq('What is chlorophyll?')])
+    QuestionBank(path).add('mcqs', 'vid', 'en', [mcq('What is chlorophyll?')])
+    QuestionBank(path).lookup('mcqs', 'en', 'Chlorophyll', video_id='vid')
+
+    stats = QuestionBank(path).stats()
+    assert (stats['added'], stats['duplicates'], stats['served']) == (1, 1, 1)
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from rate_limit import TokenBudget, parse_reset
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def budget(request, tmp_path):
+    path = str(tmp_path / 'budget.db') if request.param == 'sqlite' else None
+    return TokenBudget(6000, 30, path=path)
+
+
+def test_parse_reset():
+    assert parse_reset('7.66s') == pytest.approx(7.66)
+    assert parse_reset('2m59.56s') == pytest.approx(179.56)
+    assert parse_reset('250ms') == pytest.approx(0.25)
+    assert parse_reset('30') == 30
+    assert parse_reset(None) is None
+    assert parse_reset('soon') is None
+
+
+def test_acquire_reserves_prompt_and_completion(budget):
+    grant = budget.acquire(1000, 500)
+    assert grant['tokens'] == 1500
+    assert budget.stats()['tokens_available'] == pytest.approx(4500, abs=5)
+
+
+def test_settle_trues_up_to_usage(budget):
+    grant = budget.acquire(1000, 500)
+    budget.settle(grant, {'prompt_tokens': 1000, 'completion_tokens': 100})
+    assert budget.stats()['tokens_available'] == pytest.approx(4900, abs=5)
+
+
+def test_settle_without_usage_refunds_everything(budget):
+    grant = budget.acquire(1000, 500)
+    budget.settle(grant, None, status=500)
+    assert budget.stats()['tokens_available'] == pytest.approx(6000, abs=5)
+
+
+def test_settle_learns_completion_share(budget):
+    grant = budget.acquire(100, 1000)
+    budget.settle(grant, {'prompt_tokens': 100, 'completion_tokens': 0})
+    assert budget.acquire(100, 1000)['tokens'] == 100 + 800
+
+
+def test_settle_follows_rate_limit_headers(budget):
+    grant = budget.acquire(100)
+    budget.settle(grant, {'total_tokens': 100}, {
+        'x-ratelimit-limit-tokens': '12000',
+        'x-ratelimit-remaining-tokens': '2000',
+    })
+    stats = budget.stats()
+    assert stats['tokens_per_minute'] == 12000
+    assert stats['tokens_available'] == pytest.approx(2000, abs=5)
+
+
+def test_429_pauses_everyone(budget):
+    grant = budget.acquire(100)
+    budget.settle(grant, None, {'retry-after': '0.3'}, status=429)
+    assert budget.stats()['paused_for_s'] > 0
+    assert budget.stats()['throttled'] == 1
+
+    started = time.monotonic()
+    budget.acquire(100)
+    assert time.monotonic() - started >= 0.2
+
+
+def test_abandoned_acquire_returns_none(budget):
+    budget.settle(budget.acquire(100), None, {'retry-after': '30'}, status=429)
+    assert budget.acquire(100, abandon=lambda: True) is None
+    assert budget.stats()['waiting'] == 0
+
+
+def test_budget_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / 'budget.db')
+    first, second = TokenBudget(6000, 30, path=path), TokenBudget(6000, 30, path=path)
+    first.acquire(4000)
+    assert second.stats()['tokens_available'] == pytest.approx(2000, abs=5)
+
+
+def test_app_budget_is_shared_by_default():
+    import app
+    assert app.groq_budget.stats()['shared']
@@ -0,0 +1,53 @@
+import time
+
+from response_memo import ResponseMemo, request_key
+
+RESPONSE = {'choices': [{'message': {'content': '{"questions": []}'}}], 'usage': {'prompt_tokens': 90, 'completion_tokens': 10}}
+
+
+def test_request_key_ignores_key_order():
+    assert request_key({'model': 'm', 'temperature': 0.3}) == request_key({'temperature': 0.3, 'model': 'm'})
+    assert request_key({'model': 'm', 'temperature': 0.3}) != request_key({'model': 'm', 'temperature': 0.4})
+
+
+def test_memo_round_trip(tmp_path):
+    memo = ResponseMemo(str(tmp_path / 'memo.db'))
+    assert memo.get('key') is None
+    memo.put('key', RESPONSE)
+    assert memo.get('key') == RESPONSE
+
+
+def test_memo_expires_entries(tmp_path):
+    memo = ResponseMemo(str(tmp_path / 'memo.db'), ttl=0.05)
+    memo.put('key', RESPONSE)
+    time.sleep(0.1)
+    assert memo.get('key') is None
+
+
+def test_memo_evicts_least_recently_used(tmp_path):
+    size = len(str(RESPONSE))
+    memo = ResponseMemo(str(tmp_path / 'memo.db'), max_bytes=size * 2 + 10)
+    for key in ('a', 'b'):
+        memo.put(key, RESPONSE)
+        time.sleep(0.01)
+    memo.get('a')
+    time.sleep(0.01)
+    memo.put('c', RESPONSE)
+
+    assert memo.get('a') == RESPONSE
+    assert memo.get('b') is None
+    assert memo.get('c') == RESPONSE
+
+
+def test_memo_stats_add_up_across_processes(tmp_path):
+    path = str(tmp_path / 'memo.db')
+    first, second = ResponseMemo(path), ResponseMemo(path)
+    first.put('key', RESPONSE)
+    assert first.get('key') == RESPONSE
+    assert second.get('key') == RESPONSE
+    assert second.get('other') is None
+    first.bypass()
+
+    stats = ResponseMemo(path).stats()
+    assert (stats['hits'], stats['misses'], stats['bypassed']) == (2, 1, 1)
+    assert stats['hit_rate'] == 0.667
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from result_cache import ResultCache, extract_video_id
+
+
+@pytest.mark.parametrize('url', [
+    'dQw4w9WgXcQ',
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://youtube.com/watch?feature=share&v=dQw4w9WgXcQ&t=42s&list=PL123',
+    'http://m.youtube.com/watch?v=dQw4w9WgXcQ',
+    'youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://youtu.be/dQw4w9WgXcQ?t=42',
+    'https://www.youtube.com/shorts/dQw4w9WgXcQ',
+    'https://www.youtube.com/embed/dQw4w9WgXcQ?autoplay=1',
+    'https://www.youtube.com/live/dQw4w9WgXcQ',
+    'https://www.youtube-nocookie.com/embed/dQw4w9WgXcQ',
+    '  https://youtu.be/dQw4w9WgXcQ  ',
+])
+def test_extract_video_id_canonicalises(url):
+    assert extract_video_id(url) == 'dQw4w9WgXcQ'
+
+
+@pytest.mark.parametrize('url', [
+    None,
+    '',
+    'https://vimeo.com/123456789',
+    'https://www.youtube.com/watch?v=short',
+    'https://www.youtube.com/playlist?list=PL123',
+    'https://example.com/watch?v=dQw4w9WgXcQ',
+    'https://youtu.be/',
+])
+def test_extract_video_id_rejects_other_urls(url):
+    assert extract_video_id(url) is None
+
+
+def test_cache_round_trip_per_language(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.db'))
+    cache.put('vid', 'en', 'mcqs', {'questions': [1]})
+    cache.put('vid', None, 'mcqs', {'questions': [2]})
+
+    assert cache.get('vid', 'en', 'mcqs') == {'questions': [1]}
+    assert cache.get('vid', None, 'mcqs') == {'questions': [2]}
+    assert cache.get('vid', 'fr', 'mcqs') is None
+    assert cache.get('vid', 'en', 'flashcards') is None
+
+
+def test_cache_expires_entries(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.db'), ttl=0.05)
+    cache.put('vid', 'en', 'transcript', {'text': 'hello'})
+    time.sleep(0.1)
+    assert cache.get('vid', 'en', 'transcript') is None
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.db'), max_bytes=250)
+    payload = {'text': 'x' * 100}
+    cache.put('a', 'en', 'transcript', payload)
+    time.sleep(0.01)
+    cache.put('b', 'en', 'transcript', payload)
+    time.sleep(0.01)
+    cache.get('a', 'en', 'transcript')
+    time.sleep(0.01)
+    cache.put('c', 'en', 'transcript', payload)
+
+    assert cache.get('a', 'en', 'transcript') == payload
+    assert cache.get('b', 'en', 'transcript') is None
+    assert cache.get('c', 'en', 'transcript') == payload
+
+
+def test_cache_stats_add_up_across_processes(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first, second = ResultCache(path), ResultCache(path)
+    first.put('dQw4w9WgXcQ', 'en', 'transcript', {'text': 'hi'})
+    assert first.get('dQw4w9WgXcQ', 'en', 'transcript')
+    assert second.get('dQw4w9WgXcQ', 'en', 'mcqs') is None
+    second.count_hits('flashcards')
+
+    stats = ResultCache(path).stats()
+    assert stats['transcript'] == {'hits': 1, 'misses': 0}
+    assert stats['mcqs'] == {'hits': 0, 'misses': 1}
+    assert (stats['hits'], stats['misses']) == (2, 1)
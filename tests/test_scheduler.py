@@ -0,0 +1,44 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import CancelTokens, JobCancelled
+
+
+def test_cancel_tokens_in_process():
+    tokens = CancelTokens()
+    assert not tokens.cancelled('job')
+    tokens.cancel('job')
+    assert tokens.cancelled('job')
+    with pytest.raises(JobCancelled):
+        tokens.check('job')
+    tokens.discard('job')
+    assert not tokens.cancelled('job')
+
+
+def test_cancel_tokens_notice_other_processes():
+    cancelled = set()
+    lookups = []
+
+    def is_cancelled(job_id):
+        lookups.append(job_id)
+        return job_id in cancelled
+
+    tokens = CancelTokens(is_cancelled, recheck=0.1)
+    assert not tokens.cancelled('job')
+    cancelled.add('job')
+    # Within recheck the store isn't asked again
+    assert not tokens.cancelled('job')
+    assert lookups == ['job']
+    time.sleep(0.15)
+    assert tokens.cancelled('job')
+
+
+def test_cancel_tokens_wait_wakes_on_cancel():
+    tokens = CancelTokens()
+    threading.Timer(0.1, tokens.cancel, ('job',)).start()
+    started = time.monotonic()
+    assert tokens.wait('job', 5)
+    assert time.monotonic() - started < 1
+    assert not tokens.wait('other', 0.05)
@@ -0,0 +1,43 @@
+import uuid
+
+import pytest
+
+import app as ytmcq
+from scheduler import QueueFull
+
+ERRORS = (('status', 'error'),)
+
+
+def new_url():
+    return f'https://youtu.be/{uuid.uuid4().hex[:11]}'
+
+
+def full_queue(monkeypatch, before=None):
+    def submit(job_id, fn, *args):
+        if before:
+            before(job_id)
+        raise QueueFull('Job queue is full (0 waiting)')
+
+    monkeypatch.setattr(ytmcq.scheduler, 'submit', submit)
+
+
+def test_refused_job_leaves_nothing_behind(monkeypatch):
+    full_queue(monkeypatch)
+    errors = ytmcq.JOBS_FINISHED._values.get(ERRORS, 0)
+
+    # A batch retries the same child until the queue has room
+    for _ in range(3):
+        with pytest.raises(QueueFull):
+            ytmcq.start_job(new_url(), job_id='child')
+        assert ytmcq.job_store.get('child') is None
+    assert ytmcq.JOBS_FINISHED._values.get(ERRORS, 0) == errors
+
+
+def test_refused_job_tells_its_followers(monkeypatch):
+    url, alias = new_url(), str(uuid.uuid4())
+    video_id = ytmcq.extract_video_id(url)
+    full_queue(monkeypatch, lambda job_id: ytmcq.job_store.create(alias, {'status': 'queued'}, f'{video_id}:'))
+
+    with pytest.raises(QueueFull):
+        ytmcq.start_job(url)
+    assert ytmcq.status_payload(alias) == {'status': 'error', 'error': 'Job queue is full (0 waiting)'}
@@ -0,0 +1,66 @@
+import pytest
+
+import app as ytmcq
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(ytmcq, 'MAX_VIDEO_DURATION', 3600)
+    monkeypatch.setattr(ytmcq, 'MAX_AUDIO_BYTES', 100 * 2**20)
+    monkeypatch.setattr(ytmcq, 'AUDIO_SECTION_SECONDS', 0)
+
+
+def audio(**fields):
+    return dict({'url': 'https://example.test/a', 'vcodec': 'none', 'acodec': 'opus', 'protocol': 'https'}, **fields)
+
+
+def test_video_within_limits():
+    assert ytmcq.video_limit_error({'duration': 600, 'formats': [audio(abr=128)]}) is None
+    assert ytmcq.video_limit_error({}) is None
+
+
+def test_live_streams_are_rejected():
+    assert 'Live streams' in ytmcq.video_limit_error({'is_live': True})
+
+
+def test_long_videos_are_rejected():
+    assert 'too long (120 min)' in ytmcq.video_limit_error({'duration': 7200})
+
+
+def test_large_audio_is_rejected():
+    info = {'duration': 1800, 'formats': [audio(filesize=200 * 2**20)]}
+    assert 'too large (about 200 MB)' in ytmcq.video_limit_error(info)
+
+
+def test_audio_size_estimated_from_bitrate():
+    # 512 kbit/s for 30 min is about 110 MB
+    info = {'duration': 1800, 'formats': [audio(abr=512)]}
+    assert 'too large' in ytmcq.video_limit_error(info)
+
+
+def test_only_the_section_counts(monkeypatch):
+    monkeypatch.setattr(ytmcq, 'AUDIO_SECTION_SECONDS', 600)
+    info = {'duration': 7200, 'formats': [audio(filesize=400 * 2**20)]}
+    assert ytmcq.video_limit_error(info) is None
+
+
+def test_empty_download_fails_with_the_size_limit(monkeypatch, tmp_path):
+    class SkippingYoutubeDL:
+        def __init__(self, opts):
+            self.opts = opts
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def download(self, urls):
+            # What yt-dlp does with a file over max_filesize: skip it without raising
+            assert self.opts['max_filesize'] == 100 * 2**20
+
+    monkeypatch.setattr('yt_dlp.YoutubeDL', SkippingYoutubeDL)
+    output = tmp_path / 'audio.mp3'
+    output.write_bytes(b'')
+    with pytest.raises(Exception, match='too large; the limit is 100 MB'):
+        ytmcq.download_audio('https://youtu.be/dQw4w9WgXcQ', str(output))
@@ -0,0 +1,204 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+import app as ytmcq
+from scheduler import QueueFull
+
+SECRET = 'test-secret'
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Webhook mode with AssemblyAI and the worker pool replaced by recorders"""
+    monkeypatch.setattr(ytmcq, 'ASSEMBLYAI_WEBHOOK_BASE_URL', 'https://example.test')
+    monkeypatch.setattr(ytmcq, 'ASSEMBLYAI_WEBHOOK_SECRET', SECRET)
+    calls = {'submitted': [], 'checks': [], 'transcript': {'status': 'completed', 'text': 'Hello.'}}
+    lock = threading.Lock()
+
+    def submit(job_id, fn, *args, **kwargs):
+        if calls.get('full'):
+            raise QueueFull('full')
+        with lock:
+            calls['submitted'].append(job_id)
+        return 1
+
+    monkeypatch.setattr(ytmcq.scheduler, 'submit', submit)
+    monkeypatch.setattr(ytmcq, 'fetch_transcript', lambda transcript_id, api_key: dict(calls['transcript']))
+    monkeypatch.setattr(ytmcq, 'schedule_transcription_check', lambda job_id, delay, attempt=0: calls['checks'].append(attempt))
+    return calls
+
+
+def waiting_job():
+    job_id = str(uuid.uuid4())
+    ytmcq.job_store.set(job_id, {'status': 'processing', 'transcript_id': f't-{job_id}', 'video_id': 'vid'})
+    return job_id
+
+
+def post_webhook(job_id, secret=SECRET):
+    return ytmcq.app.test_client().post(
+        f'/webhooks/assemblyai/{job_id}',
+        json={'transcript_id': f't-{job_id}', 'status': 'completed'},
+        headers={ytmcq.WEBHOOK_SECRET_HEADER: secret},
+    )
+
+
+def test_webhook_then_fallback_check_completes_once(pipeline):
+    job_id = waiting_job()
+
+    assert post_webhook(job_id).status_code == 200
+    ytmcq.check_transcription_job(job_id, 3)
+
+    assert pipeline['submitted'] == [job_id]
+    assert pipeline['checks'] == []
+    assert ytmcq.job_store.get(job_id)['status'] == 'transcribed'
+
+
+def test_fallback_check_then_webhook_completes_once(pipeline):
+    job_id = waiting_job()
+
+    ytmcq.check_transcription_job(job_id)
+    assert post_webhook(job_id).status_code == 200
+
+    assert pipeline['submitted'] == [job_id]
+
+
+def test_redelivered_task_resumes_the_wait(pipeline, monkeypatch):
+    # The worker died after submitting the audio; the retried task must not submit it again
+    def fail(*args, **kwargs):
+        raise AssertionError('audio fetched twice')
+
+    monkeypatch.setattr(ytmcq, 'probe_video', fail)
+    monkeypatch.setattr(ytmcq, 'submit_transcription', fail)
+    job_id = str(uuid.uuid4())
+    ytmcq.job_store.set(job_id, {'status': 'submitting', 'transcript_id': f't-{job_id}', 'video_id': 'vid'})
+
+    ytmcq.process_transcription('https://youtu.be/dQw4w9WgXcQ', job_id)
+
+    assert pipeline['checks'] == [0]
+    assert ytmcq.job_store.get(job_id)['status'] == 'processing'
+
+    # Once the transcript has moved on, a late redelivery leaves the job alone
+    job_id = waiting_job()
+    ytmcq.job_store.update(job_id, status='generating_content')
+    ytmcq.process_transcription('https://youtu.be/dQw4w9WgXcQ', job_id)
+    assert pipeline['checks'] == [0]
+
+
+def test_racing_deliveries_complete_once(pipeline):
+    job_id = waiting_job()
+    barrier = threading.Barrier(6)
+
+    def deliver():
+        barrier.wait()
+        ytmcq.dispatch_transcription_result(job_id, pipeline['transcript'])
+
+    threads = [threading.Thread(target=deliver) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert pipeline['submitted'] == [job_id]
+
+
+def test_unfinished_transcript_is_checked_again(pipeline):
+    job_id = waiting_job()
+    pipeline['transcript'] = {'status': 'processing'}
+
+    ytmcq.check_transcription_job(job_id, 2)
+
+    assert pipeline['submitted'] == []
+    assert pipeline['checks'] == [3]
+    assert ytmcq.job_store.get(job_id)['status'] == 'processing'
+
+
+def test_full_pool_hands_the_result_back(pipeline):
+    job_id = waiting_job()
+    pipeline['full'] = True
+
+    # AssemblyAI retries a failed webhook, and the job is left for the next delivery
+    assert post_webhook(job_id).status_code == 503
+    assert ytmcq.job_store.get(job_id)['status'] == 'processing'
+
+    pipeline['full'] = False
+    assert post_webhook(job_id).status_code == 200
+    assert pipeline['submitted'] == [job_id]
+
+
+def test_webhook_needs_the_secret(pipeline):
+    job_id = waiting_job()
+
+    assert post_webhook(job_id, secret='wrong').status_code == 401
+    assert post_webhook('unknown-job').status_code == 404
+    assert ytmcq.job_store.get(job_id)['status'] == 'processing'
+
+
+def test_cancelled_job_is_ended_by_its_check(pipeline, monkeypatch):
+    monkeypatch.setattr(ytmcq, 'delete_transcript', lambda *args: None)
+    job_id = waiting_job()
+    ytmcq.job_store.update(job_id, cancelled_at=1, cancel_reason='client')
+
+    ytmcq.check_transcription_job(job_id)
+
+    job = ytmcq.job_store.get(job_id)
+    assert job['status'] == 'cancelled'
+    assert job['cancel_reason'] == 'client'
+    assert pipeline['submitted'] == []
+
+
+@pytest.fixture
+def fake_assemblyai(monkeypatch):
+    """The app served on a real port, talking to bench_e2e's fake AssemblyAI and Groq"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+    from bench_e2e import FakeUpstreams, fake_probe
+    from werkzeug.serving import make_server
+
+    FakeUpstreams.config = SimpleNamespace(
+        upload_latency=0, transcribe_seconds=0.5, transcript_sentences=40, assemblyai_error_rate=0,
+        groq_latency=0, groq_error_rate=0, groq_tpm=0, truncate_rate=0, malformed_rate=0,
+    )
+    FakeUpstreams.media = os.urandom(64 * 1024)
+    FakeUpstreams.calls = {}
+    upstream = ThreadingHTTPServer(('127.0.0.1', 0), FakeUpstreams)
+    upstream.daemon_threads = True
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    upstream_url = f'http://127.0.0.1:{upstream.server_port}'
+
+    server = make_server('127.0.0.1', 0, ytmcq.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    for name, value in (
+        ('ASSEMBLYAI_BASE_URL', upstream_url), ('GROQ_BASE_URL', upstream_url),
+        ('ASSEMBLYAI_API_KEY', 'test'), ('GROQ_API_KEY', 'test'),
+        ('ASSEMBLYAI_WEBHOOK_BASE_URL', f'http://127.0.0.1:{server.server_port}'),
+        ('ASSEMBLYAI_WEBHOOK_SECRET', SECRET),
+        ('probe_video', fake_probe(upstream_url)),
+    ):
+        monkeypatch.setattr(ytmcq, name, value)
+    yield FakeUpstreams
+    server.shutdown()
+    upstream.shutdown()
+
+
+def test_webhook_resumes_the_pipeline(fake_assemblyai):
+    client = ytmcq.app.test_client()
+    job_id = client.post('/transcribe', json={'url': f'https://youtu.be/{uuid.uuid4().hex[:11]}'}).get_json()['job_id']
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        status = client.get(f'/status/{job_id}').get_json()
+        if status['status'] in ('completed', 'error'):
+            break
+        time.sleep(0.2)
+
+    assert status['status'] == 'completed', status
+    assert status['mcq_count'] > 0
+    # Completed by the callback; the fallback poll isn't due for another 30 seconds
+    assert fake_assemblyai.calls.get('webhook') == 1
+    assert fake_assemblyai.calls.get('poll', 0) <= 1
@@ -0,0 +1,114 @@
+"""Pipeline worker: runs the jobs web processes put on the SQLite job queue.
+
+    JOB_QUEUE=sqlite python worker.py --threads 8
+
+Run as many of these as there are cores to spare; they share DATA_DIR with the web
+processes. On SIGTERM a worker stops taking new jobs and finishes the ones it has;
+jobs of a worker that dies are picked up again once their lease runs out.
+"""
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+
+os.environ.setdefault('JOB_QUEUE', 'sqlite')
+
+import app
+from metrics import job_timings, observe_stage
+
+# Only these pipeline entry points may be named by a queued task
+TASKS = ('process_transcription', 'complete_transcription', 'check_transcription_job', 'start_batch')
+
+
+class Worker:
+    def __init__(self, queue, threads=8, poll_interval=1.0):
+        self.queue = queue
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.worker_id = f'{socket.gethostname()}-{os.getpid()}'
+        self._running = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def stop(self, *args):
+        print(f"Worker {self.worker_id} stopping after its current jobs")
+        self._stop.set()
+
+    def run(self):
+        consumers = [
+            threading.Thread(target=self._consume, name=f'queue-worker-{i}', daemon=True)
+            for i in range(self.threads)
+        ]
+        for thread in consumers:
+            thread.start()
+        threading.Thread(target=self._heartbeat, name='queue-heartbeat', daemon=True).start()
+
+        print(f"Worker {self.worker_id} running {self.threads} threads")
+        for thread in consumers:
+            thread.join()
+
+    def _consume(self):
+        while not self._stop.is_set():
+            task = self.queue.lease(self.worker_id)
+            if task is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            self.execute(task)
+
+    def execute(self, task):
+        job_id = task['job_id']
+        with self._lock:
+            self._running[task['id']] = task
+        try:
+            if task['task'] not in TASKS:
+                raise Exception(f"Unknown task {task['task']}")
+            observe_stage('queue_wait', task['waited'], job_id)
+            with job_timings.job(job_id):
+                getattr(app, task['task'])(*task['args'])
+            self.queue.ack(task['id'])
+        except Exception as e:
+            print(f"Job {job_id} crashed (attempt {task['attempts']}): {e}")
+            if not self.queue.fail(task):
+                self.give_up(job_id)
+        finally:
+            with self._lock:
+                self._running.pop(task['id'], None)
+
+    def give_up(self, job_id):
+        app.finish_job(job_id, {
+            'status': 'error',
+            'error': 'Processing failed repeatedly. Please try again later.'
+        })
+
+    def _heartbeat(self):
+        """Keep leases of running jobs alive and fail jobs whose workers kept dying"""
+        while True:
+            with self._lock:
+                running = list(self._running)
+            try:
+                self.queue.extend(running)
+                for job_id in self.queue.expired():
+                    self.give_up(job_id)
+            except Exception as e:
+                print(f"Queue heartbeat failed: {e}")
+            time.sleep(self.queue.visibility_timeout / 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WORKER_THREADS', 8)))
+    args = parser.parse_args()
+
+    if app.JOB_QUEUE != 'sqlite':
+        raise SystemExit("worker.py needs JOB_QUEUE=sqlite")
+
+    worker = Worker(app.scheduler, threads=args.threads)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == '__main__':
+    main()